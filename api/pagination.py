@@ -0,0 +1,31 @@
+"""
+cafeMuji - API のページング
+
+注文一覧は受付時刻（timestamp）のカーソルでページングします。
+ページ番号方式のような COUNT(*) と OFFSET の読み飛ばしがないため、
+1日分の注文を順に取得しても各ページのコストは一定です（timestamp のインデックスを使用）。
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    注文一覧のカーソルページング
+
+    並び順はビューセットの ordering（既定は新しい順、?ordering=timestamp で古い順）。
+    同じ受付時刻の注文は DRF のカーソルが持つオフセットで区別します。
+    オフセットはページをまたいで同じ並びであることが前提のため、指定された並び順の
+    最後には常に id を付けます（?ordering=timestamp でも同じ時刻の行が重複・欠落しない）。
+    """
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-timestamp', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
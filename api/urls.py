@@ -15,4 +15,5 @@ router.register(r'shavedice-orders', views.ShavedIceOrderViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('health/', views.health_check, name='api_health_check'),
+    path('statistics/', views.order_statistics, name='api_order_statistics'),
 ]
\ No newline at end of file
@@ -6,6 +6,8 @@ DRF（Django REST Framework）を使用したAPI実装
 連携のためのREST APIを提供します。
 """
 
+from datetime import date, timedelta
+
 from rest_framework import serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -14,11 +16,27 @@ from django.db.models import Q
 from food.models import FoodOrder
 from ice.models import Order as IceOrder
 from shavedice.models import ShavedIceOrder
+from common.archive import business_day_start
+from common.idempotency import invalid_key, request_key, submit_once
+from common.ids import new_group_id
+from common.orders import complete_order, complete_orders, submit_order_group, update_groups_status
+from common.rollups import rollups_between, summarize, summarize_by
+from .pagination import OrderCursorPagination
 
 
 # ==================== シリアライザー ====================
 
-class FoodOrderSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """fields 引数で出力する項目を絞り込めるシリアライザー"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class FoodOrderSerializer(DynamicFieldsModelSerializer):
     """フード注文のシリアライザー"""
     
     class Meta:
@@ -39,7 +57,7 @@ class FoodOrderSerializer(serializers.ModelSerializer):
         return value
 
 
-class IceOrderSerializer(serializers.ModelSerializer):
+class IceOrderSerializer(DynamicFieldsModelSerializer):
     """アイスクリーム注文のシリアライザー"""
     
     class Meta:
@@ -54,7 +72,7 @@ class IceOrderSerializer(serializers.ModelSerializer):
         return data
 
 
-class ShavedIceOrderSerializer(serializers.ModelSerializer):
+class ShavedIceOrderSerializer(DynamicFieldsModelSerializer):
     """かき氷注文のシリアライザー"""
     
     class Meta:
@@ -65,11 +83,249 @@ class ShavedIceOrderSerializer(serializers.ModelSerializer):
 
 # ==================== ビューセット ====================
 
-class FoodOrderViewSet(viewsets.ModelViewSet):
+class OrderQueryMixin:
+    """
+    注文ビューセットの共通処理
+
+    - 一覧は受付時刻のカーソルでページングする（OrderCursorPagination）
+    - ?fields=id,menu,... で返す項目を絞り込み、読み込む列も同じ項目に限定する
+    - 一覧は既定で list_fields だけを返す（note などの長い項目を含めない）
+    - ?date=YYYY-MM-DD で受付日を指定する（timestamp の範囲条件でインデックスを使う）
+    """
+
+    pagination_class = OrderCursorPagination
+    ordering = ('-timestamp', '-id')
+    ordering_fields = ('timestamp',)
+    list_fields = ()
+
+    def requested_fields(self):
+        """出力する項目（None は全項目）"""
+        if self.request.method != 'GET':
+            return None
+        value = self.request.query_params.get('fields')
+        if not value:
+            return list(self.list_fields) if self.action in ('list', 'active_orders') else None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(fields) - set(self.serializer_class().fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': f"不明な項目です: {', '.join(sorted(unknown))}"})
+        return fields
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_orders(self, queryset):
+        """受付日の指定・読み込む列の限定・並び順を適用する（get_queryset の最後で呼ぶ）"""
+        day = self.request.query_params.get('date')
+        if day:
+            try:
+                start = business_day_start(date.fromisoformat(day))
+            except ValueError:
+                raise serializers.ValidationError({'date': '日付は YYYY-MM-DD で指定してください'})
+            queryset = queryset.filter(timestamp__gte=start, timestamp__lt=start + timedelta(days=1))
+        fields = self.requested_fields()
+        if fields:
+            concrete = {field.name for field in queryset.model._meta.concrete_fields}
+            queryset = queryset.only('id', 'timestamp', *(name for name in fields if name in concrete))
+        return queryset.order_by(*self.ordering)
+
+
+# 一括 API で1リクエストに指定できる件数の上限
+MAX_BULK_ITEMS = 100
+
+# 一括作成で全行に共通するフィールド
+BULK_SHARED_FIELDS = ('clip_color', 'clip_number', 'note')
+
+
+def _id_list(value, name, cast=str):
+    """リクエストのID配列を検証する"""
+    if value is None:
+        return []
+    if not isinstance(value, list) or len(value) > MAX_BULK_ITEMS:
+        raise serializers.ValidationError({name: f'{MAX_BULK_ITEMS}件以内の配列で指定してください'})
+    try:
+        return list(dict.fromkeys(cast(v) for v in value))
+    except (TypeError, ValueError):
+        raise serializers.ValidationError({name: '不正なIDが含まれています'})
+
+
+# 再送に以前の結果を返したことを示す応答ヘッダー
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotentCreateMixin:
+    """
+    Idempotency-Key ヘッダーによる作成の再送対策（common.idempotency）
+
+    同じキーの2回目以降の作成（create / bulk_create）は何も登録せず、最初に登録した
+    注文を同じ形の応答（201）で返し、Idempotent-Replayed: true を付けます。
+    """
+
+    def idempotency_key(self, request):
+        """リクエストの冪等キー（形式が正しくない場合は 400）"""
+        if invalid_key(request):
+            raise serializers.ValidationError(
+                {'Idempotency-Key': '英数字・ハイフン・アンダースコアの64文字以内で指定してください'}
+            )
+        return request_key(request)
+
+    def replayed_headers(self, replayed):
+        return {REPLAYED_HEADER: 'true'} if replayed else {}
+
+    def create(self, request, *args, **kwargs):
+        """注文を1件登録（同じ冪等キーの再送は以前の注文を返す）"""
+        serializer = self.get_serializer(data=request.data)
+
+        def submit():
+            serializer.is_valid(raise_exception=True)
+            return [serializer.save()]
+
+        orders, replayed = submit_once(self.queryset.model, self.idempotency_key(request), submit)
+        if not orders:
+            return Response({'error': '以前に登録した注文は削除されています'}, status=status.HTTP_409_CONFLICT)
+        data = self.get_serializer(orders[0]).data
+        headers = {**self.get_success_headers(data), **self.replayed_headers(replayed)}
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
+
+
+class BulkOrderMixin:
+    """
+    注文の一括操作（POS・モバイル連携用）
+
+    - bulk_create: 1グループ分の注文（複数商品）をまとめて登録
+    - bulk_complete: グループID・注文IDを指定してまとめて完了
+    - bulk_update_status: 複数グループの状態をまとめて変更
+
+    いずれも1リクエスト・1トランザクションで、書き込みは common.orders の
+    一括処理（bulk_create / UPDATE 1文）を使います。結果は行ごとに返します。
+    bulk_create は IdempotentCreateMixin の冪等キーに対応します。
+    """
+
+    # bulk_update_status で許可する状態（None は status フィールドの choices）
+    status_values = None
+
+    @action(detail=False, methods=['post'])
+    def bulk_create(self, request):
+        """1グループ分の注文をまとめて登録（1件でも不正なら何も登録しない）"""
+        key = self.idempotency_key(request)
+        items = request.data.get('items')
+        if not isinstance(items, list) or not items or len(items) > MAX_BULK_ITEMS:
+            return Response(
+                {'items': f'1〜{MAX_BULK_ITEMS}件の配列で指定してください'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        group_id = str(request.data.get('group_id') or new_group_id())
+        shared = {name: request.data[name] for name in BULK_SHARED_FIELDS if name in request.data}
+
+        rows, errors = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append({'index': index, 'errors': {'non_field_errors': ['オブジェクトで指定してください']}})
+                continue
+            serializer = self.get_serializer(data={**shared, **item, 'group_id': group_id})
+            if serializer.is_valid():
+                rows.append(serializer.validated_data)
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+        if errors:
+            return Response({'group_id': group_id, 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        for row in rows:
+            row.pop('group_id', None)
+        model = self.queryset.model
+        created, replayed = submit_once(model, key, lambda: submit_order_group(model, group_id, rows))
+        return Response({
+            'group_id': created[0].group_id if created else group_id,
+            'count': len(created),
+            'results': self.get_serializer(created, many=True).data,
+        }, status=status.HTTP_201_CREATED, headers=self.replayed_headers(replayed))
+
+    @action(detail=False, methods=['post'])
+    def bulk_complete(self, request):
+        """グループID・注文IDを指定してまとめて完了"""
+        group_ids = _id_list(request.data.get('group_ids'), 'group_ids')
+        ids = _id_list(request.data.get('ids'), 'ids', cast=int)
+        if not group_ids and not ids:
+            return Response(
+                {'error': 'group_ids または ids を指定してください'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        model = self.queryset.model
+        completed = complete_orders(model, group_ids=group_ids, ids=ids)
+        completed_ids = {order.id for order in completed}
+        completed_at = completed[0].completed_at if completed else None
+        # 完了にならなかった指定が「完了済み」か「存在しない」かを1クエリで判定する
+        existing = set(
+            model.objects.filter(Q(group_id__in=group_ids) | Q(id__in=ids)).values_list('id', 'group_id')
+        )
+        existing_ids = {pk for pk, _ in existing}
+        existing_groups = {g for _, g in existing}
+        completed_by_group = {}
+        for order in completed:
+            completed_by_group[order.group_id] = completed_by_group.get(order.group_id, 0) + 1
+
+        def result(found, count):
+            if count:
+                return 'completed'
+            return 'already_completed' if found else 'not_found'
+
+        return Response({
+            'completed_count': len(completed),
+            'completed_at': completed_at,
+            'groups': [
+                {
+                    'group_id': g,
+                    'completed': completed_by_group.get(g, 0),
+                    'result': result(g in existing_groups, completed_by_group.get(g, 0)),
+                }
+                for g in group_ids
+            ],
+            'orders': [
+                {'id': pk, 'result': result(pk in existing_ids, pk in completed_ids)}
+                for pk in ids
+            ],
+        })
+
+    @action(detail=False, methods=['post'])
+    def bulk_update_status(self, request):
+        """複数グループの状態をまとめて変更"""
+        group_ids = _id_list(request.data.get('group_ids'), 'group_ids')
+        new_status = request.data.get('status')
+        model = self.queryset.model
+        statuses = self.status_values
+        if statuses is None:
+            statuses = {value for value, _ in model._meta.get_field('status').choices or ()}
+        if not group_ids or new_status not in statuses:
+            return Response(
+                {'error': 'group_ids と有効な status を指定してください'}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        updated = update_groups_status(model, group_ids, new_status, statuses=statuses)
+        return Response({
+            'status': new_status,
+            'updated_count': sum(updated.values()),
+            'groups': [
+                {
+                    'group_id': g,
+                    'updated': updated.get(g, 0),
+                    'result': 'updated' if updated.get(g) else 'not_found',
+                }
+                for g in group_ids
+            ],
+        })
+
+
+class FoodOrderViewSet(OrderQueryMixin, IdempotentCreateMixin, BulkOrderMixin, viewsets.ModelViewSet):
     """フード注文のAPI ViewSet"""
     
     queryset = FoodOrder.objects.all()
     serializer_class = FoodOrderSerializer
+    status_values = {'ok', 'stop'}
+    list_fields = (
+        'id', 'group_id', 'menu', 'quantity', 'eat_in', 'clip_color', 'clip_number',
+        'status', 'is_completed', 'timestamp', 'completed_at',
+    )
     
     def get_queryset(self):
         """クエリセットのフィルタリング"""
@@ -87,15 +343,13 @@ class FoodOrderViewSet(viewsets.ModelViewSet):
         if group_id:
             queryset = queryset.filter(group_id=group_id)
         
-        return queryset.order_by('-timestamp')
+        return self.filter_orders(queryset)
     
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         """注文完了処理"""
         order = self.get_object()
-        order.is_completed = True
-        order.completed_at = timezone.now()
-        order.save()
+        complete_order(order)
         
         return Response({
             'message': '注文が完了しました。',
@@ -105,47 +359,56 @@ class FoodOrderViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def active_orders(self, request):
-        """未完了注文の取得"""
+        """未完了注文の取得（一覧と同じカーソルでページング。件数は最初のページだけ返す）"""
         active_orders = self.get_queryset().filter(is_completed=False)
-        serializer = self.get_serializer(active_orders, many=True)
-        return Response({
-            'count': active_orders.count(),
-            'results': serializer.data
-        })
+        page = self.paginate_queryset(active_orders)
+        serializer = self.get_serializer(page, many=True)
+        response = self.get_paginated_response(serializer.data)
+        # 続きのページ（cursor 指定）では COUNT を実行しない
+        if self.paginator.cursor_query_param not in request.query_params:
+            response.data['count'] = active_orders.count()
+        return response
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """注文統計の取得"""
-        today = timezone.now().date()
-        queryset = self.get_queryset()
+        """注文統計の取得（今日の件数は集計テーブルから読む）"""
+        today = timezone.localdate()
+        filters = {}
+        menu = request.query_params.get('menu')
+        if menu:
+            filters['item'] = menu
+        rollups = list(rollups_between('food', today, today, **filters))
+        summary = summarize(rollups)
         
         stats = {
-            'total_orders_today': queryset.filter(timestamp__date=today).count(),
-            'completed_orders_today': queryset.filter(
-                timestamp__date=today, 
-                is_completed=True
-            ).count(),
-            'pending_orders': queryset.filter(is_completed=False).count(),
-            'popular_menu': self._get_popular_menu(queryset.filter(timestamp__date=today))
+            'total_orders_today': summary['orders'],
+            'completed_orders_today': summary['completed'],
+            'pending_orders': self.get_queryset().filter(is_completed=False).count(),
+            'popular_menu': self._get_popular_menu(rollups),
+            'mean_service_seconds_today': summary['mean_service_seconds'],
+            'p90_service_seconds_today': summary['p90_service_seconds'],
         }
         
         return Response(stats)
     
-    def _get_popular_menu(self, queryset):
+    def _get_popular_menu(self, rollups):
         """人気メニューの取得"""
-        from django.db.models import Count
-        popular = queryset.values('menu').annotate(
-            count=Count('menu')
-        ).order_by('-count').first()
-        
-        return popular if popular else {'menu': 'なし', 'count': 0}
+        by_menu = summarize_by(rollups, 'item')
+        if not by_menu:
+            return {'menu': 'なし', 'count': 0}
+        popular = max(by_menu, key=lambda row: row['orders'])
+        return {'menu': popular['item'], 'count': popular['orders']}
 
 
-class IceOrderViewSet(viewsets.ModelViewSet):
+class IceOrderViewSet(OrderQueryMixin, IdempotentCreateMixin, BulkOrderMixin, viewsets.ModelViewSet):
     """アイスクリーム注文のAPI ViewSet"""
     
     queryset = IceOrder.objects.all()
     serializer_class = IceOrderSerializer
+    list_fields = (
+        'id', 'group_id', 'size', 'container', 'flavor1', 'flavor2', 'is_pudding',
+        'clip_color', 'clip_number', 'status', 'is_completed', 'timestamp', 'completed_at',
+    )
     
     def get_queryset(self):
         """クエリセットのフィルタリング"""
@@ -162,15 +425,13 @@ class IceOrderViewSet(viewsets.ModelViewSet):
         if is_completed is not None:
             queryset = queryset.filter(is_completed=is_completed.lower() == 'true')
         
-        return queryset.order_by('-timestamp')
+        return self.filter_orders(queryset)
     
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         """注文完了処理"""
         order = self.get_object()
-        order.is_completed = True
-        order.completed_at = timezone.now()
-        order.save()
+        complete_order(order)
         
         return Response({
             'message': 'アイス注文が完了しました。',
@@ -200,11 +461,15 @@ class IceOrderViewSet(viewsets.ModelViewSet):
         })
 
 
-class ShavedIceOrderViewSet(viewsets.ModelViewSet):
+class ShavedIceOrderViewSet(OrderQueryMixin, IdempotentCreateMixin, BulkOrderMixin, viewsets.ModelViewSet):
     """かき氷注文のAPI ViewSet"""
     
     queryset = ShavedIceOrder.objects.all()
     serializer_class = ShavedIceOrderSerializer
+    list_fields = (
+        'id', 'group_id', 'flavor', 'clip_color', 'clip_number',
+        'status', 'is_completed', 'timestamp', 'completed_at',
+    )
     
     def get_queryset(self):
         """クエリセットのフィルタリング"""
@@ -221,15 +486,13 @@ class ShavedIceOrderViewSet(viewsets.ModelViewSet):
         if is_completed is not None:
             queryset = queryset.filter(is_completed=is_completed.lower() == 'true')
         
-        return queryset.order_by('-timestamp')
+        return self.filter_orders(queryset)
     
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
         """注文完了処理"""
         order = self.get_object()
-        order.is_completed = True
-        order.completed_at = timezone.now()
-        order.save()
+        complete_order(order)
         
         return Response({
             'message': 'かき氷注文が完了しました。',
@@ -238,39 +501,91 @@ class ShavedIceOrderViewSet(viewsets.ModelViewSet):
         })
 
 
-# ==================== ヘルスチェック ====================
+# ==================== 期間指定の統計 ====================
 
 from rest_framework.decorators import api_view
-from django.db import connection
 from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from common.floor import apending_counts
+from common.revisions import BOARD_APPS
+
+# order_statistics の内訳の単位
+STATISTICS_GROUPS = ('day', 'hour', 'item')
+
+
+def _query_date(request, name, default):
+    value = request.query_params.get(name)
+    return date.fromisoformat(value) if value else default
+
 
 @api_view(['GET'])
-def health_check(request):
-    """システムヘルスチェック"""
+def order_statistics(request):
+    """
+    期間を指定した注文統計（集計テーブルを1回読むだけで返す）
+
+    クエリパラメータ:
+        app: ice / food / shavedice
+        from / to: 期間（YYYY-MM-DD、両端を含む。省略時は今日）
+        by: day / hour / item を指定すると内訳も返す
+    """
+    app_label = request.query_params.get('app')
+    if app_label not in BOARD_APPS:
+        return Response(
+            {'error': f"app は {' / '.join(BOARD_APPS)} のいずれかを指定してください"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    today = timezone.localdate()
     try:
-        # データベース接続確認
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-        
-        # 基本統計の取得
-        food_count = FoodOrder.objects.filter(is_completed=False).count()
-        ice_count = IceOrder.objects.filter(is_completed=False).count()
-        shavedice_count = ShavedIceOrder.objects.filter(is_completed=False).count()
+        start = _query_date(request, 'from', today)
+        end = _query_date(request, 'to', today)
+    except ValueError:
+        return Response({'error': '日付は YYYY-MM-DD で指定してください'}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end:
+        return Response({'error': 'from は to 以前の日付を指定してください'}, status=status.HTTP_400_BAD_REQUEST)
+    by = request.query_params.get('by')
+    if by and by not in STATISTICS_GROUPS:
+        return Response(
+            {'error': f"by は {' / '.join(STATISTICS_GROUPS)} のいずれかを指定してください"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    rollups = list(rollups_between(app_label, start, end))
+    data = {
+        'app': app_label,
+        'from': start,
+        'to': end,
+        'total': summarize(rollups),
+    }
+    if by:
+        data['by'] = by
+        data['groups'] = summarize_by(rollups, by)
+    return Response(data)
+
+
+# ==================== ヘルスチェック ====================
+
+
+@require_GET
+async def health_check(request):
+    """システムヘルスチェック（非同期ビュー。ロードバランサーからの頻繁な確認でもスレッドを使わない）"""
+    try:
+        # データベース接続の確認を兼ねて、3アプリの未完了件数を UNION 1回で数える
+        counts = await apending_counts()
         
-        return Response({
+        return JsonResponse({
             'status': 'healthy',
             'timestamp': timezone.now(),
             'pending_orders': {
-                'food': food_count,
-                'ice': ice_count,
-                'shavedice': shavedice_count,
-                'total': food_count + ice_count + shavedice_count
+                'food': counts['food'],
+                'ice': counts['ice'],
+                'shavedice': counts['shavedice'],
+                'total': counts['total']
             },
             'database': 'connected'
         })
         
     except Exception as e:
-        return Response({
+        return JsonResponse({
             'status': 'unhealthy',
             'timestamp': timezone.now(),
             'error': str(e)
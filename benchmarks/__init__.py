@@ -0,0 +1,9 @@
+"""
+cafeMuji - ベンチマーク集
+
+各スクリプトは使い捨てのテスト用データベースを作成して計測するため、
+開発用の db.sqlite3 や本番データには触れません。
+
+実行例:
+    python -m benchmarks.live_window
+"""
@@ -0,0 +1,105 @@
+"""
+非同期（ASGI）ポーリングの同時実行試験
+
+1つのイベントループから多数のタブレットのポーリングを同時に発行し、
+ASGI ハンドラー（AsyncClient）での所要時間を集計します。
+比較として、同期ワーカー（gthread）相当のスレッド数で同じ件数を処理した場合も計測します。
+
+ポーリングは3秒ごとに届く想定で、各クライアントは前回の ETag を送ります
+（変更がなければ 304、変更があればリビジョン単位のキャッシュから応答）。
+
+実行例:
+    python -m benchmarks.async_polls --clients 300 --rounds 5
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.service_day import percentile
+from benchmarks.support import setup_django, temporary_database
+
+POLL_NAMES = ('food_kitchen', 'food_wait_time', 'shavedice_kitchen', 'shavedice_wait_time', 'floor_status')
+
+
+def summarize(name, samples, elapsed):
+    samples.sort()
+    print(
+        f"{name:<28}{len(samples):>8}{statistics.median(samples):>10.2f}"
+        f"{percentile(samples, 0.95):>10.2f}{samples[-1]:>10.2f}{len(samples) / elapsed:>10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=300, help='同時にポーリングするクライアント数')
+    parser.add_argument('--rounds', type=int, default=5, help='クライアントごとのポーリング回数')
+    parser.add_argument('--threads', type=int, default=32, help='比較する同期ワーカーのスレッド数')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from asgiref.sync import ThreadSensitiveContext
+    from django.test import AsyncClient, Client
+    from django.urls import reverse
+
+    from common.orders import submit_order_group
+    from food.models import FoodOrder
+    from shavedice.models import ShavedIceOrder
+
+    with temporary_database():
+        for index in range(20):
+            submit_order_group(FoodOrder, f'f_{index}', [{'menu': 'からあげ丼'}],
+                               clip_color='white', clip_number=index % 16 + 1)
+            submit_order_group(ShavedIceOrder, f's_{index}', [{'flavor': '🍧いちご🍧'}],
+                               clip_color='white', clip_number=index % 16 + 1)
+        urls = [reverse(name) for name in POLL_NAMES]
+
+        async def async_client_loop(index):
+            client = AsyncClient()
+            url = urls[index % len(urls)]
+            etag, samples = None, []
+            for _ in range(args.rounds):
+                headers = {'If-None-Match': etag} if etag else {}
+                started = time.perf_counter()
+                # ASGIHandler と同じく、リクエストごとに同期処理用のスレッドを分ける
+                async with ThreadSensitiveContext():
+                    response = await client.get(url, {'format': 'json'}, headers=headers)
+                samples.append((time.perf_counter() - started) * 1000)
+                etag = response.get('ETag', etag)
+            return samples
+
+        async def run_async():
+            results = await asyncio.gather(*(async_client_loop(i) for i in range(args.clients)))
+            return [sample for samples in results for sample in samples]
+
+        def sync_client_loop(index):
+            client = Client()
+            url = urls[index % len(urls)]
+            etag, samples = None, []
+            for _ in range(args.rounds):
+                headers = {'If-None-Match': etag} if etag else {}
+                started = time.perf_counter()
+                response = client.get(url, {'format': 'json'}, headers=headers)
+                samples.append((time.perf_counter() - started) * 1000)
+                etag = response.get('ETag', etag)
+            return samples
+
+        print(f"\n== {args.clients} clients x {args.rounds} polls ==")
+        print(f"{'mode':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'req/s':>10}")
+
+        started = time.perf_counter()
+        samples = asyncio.run(run_async())
+        summarize('asgi (1 event loop)', samples, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            results = list(executor.map(sync_client_loop, range(args.clients)))
+        summarize(f'wsgi ({args.threads} threads)', [s for r in results for s in r],
+                  time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+データベース接続方式ごとのポーリングのレイテンシ
+
+キッチン画面の JSON ポーリングを複数スレッド（タブレット）から同時に実行し、
+接続方式ごとの1リクエストあたりの所要時間を比較します。
+
+- per-request: DB_CONN_MAX_AGE=0（リクエストごとに接続・認証・バックエンド起動）
+- persistent: DB_CONN_MAX_AGE=60（スレッドごとの持続接続＋死活確認）
+- pool: DB_POOL=psycopg（ワーカー内の接続プール。psycopg[pool] が必要）
+
+方式ごとに設定を環境変数で切り替えた子プロセスで計測します（設定は起動時に決まるため）。
+接続の確立コストを含めて比べるため、PostgreSQL（DATABASE_URL）が必要です。
+
+実行例:
+    DATABASE_URL=postgres://localhost/cafemuji python -m benchmarks.db_pool --threads 8 --requests 200
+    DATABASE_URL=postgres://localhost/cafemuji python -m benchmarks.db_pool --modes persistent pool
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.support import BASE_DIR, setup_django, temporary_database
+
+# 接続方式ごとの環境変数
+MODES = {
+    'per-request': {'DB_POOL': '', 'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_POOL': '', 'DB_CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': 'psycopg'},
+}
+
+
+def run_child(args):
+    """子プロセス: 現在の接続方式でポーリングを計測し、結果を JSON で出力する"""
+    setup_django()
+
+    from django.db import connection
+    from django.test import Client
+    from django.urls import reverse
+
+    from common.orders import submit_order_group
+    from food.models import FoodOrder
+
+    with temporary_database():
+        for index in range(args.groups):
+            submit_order_group(
+                FoodOrder, f'pool_{index}', [{'menu': 'からあげ丼', 'quantity': 1}],
+                clip_color='white', clip_number=index % 16 + 1,
+            )
+        connection.close()
+        url = reverse('food_kitchen')
+
+        def poll_loop(count):
+            client = Client()
+            samples = []
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(url, {'format': 'json'})
+                samples.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.status_code
+            connection.close()
+            return samples
+
+        per_thread = max(1, args.requests // args.threads)
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            # 最初の1周は接続・プールの立ち上げを含むため捨てる
+            list(executor.map(poll_loop, [args.warmup] * args.threads))
+            started = time.perf_counter()
+            results = list(executor.map(poll_loop, [per_thread] * args.threads))
+            elapsed = time.perf_counter() - started
+
+        samples = sorted(sample for thread_samples in results for sample in thread_samples)
+        result = {
+            'median_ms': statistics.median(samples),
+            'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'max_ms': samples[-1],
+            'rps': len(samples) / elapsed,
+        }
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            stats = pool.get_stats()
+            result['pool_wait_ms'] = stats.get('requests_wait_ms', 0)
+            result['pool_queued'] = stats.get('requests_queued', 0)
+            result['pool_connections'] = stats.get('pool_size', 0)
+            # テスト用データベースを削除できるよう、プールの接続を閉じる
+            connection.close_pool()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--threads', type=int, default=8, help='同時にポーリングするスレッド数')
+    parser.add_argument('--requests', type=int, default=400, help='計測するリクエストの合計')
+    parser.add_argument('--warmup', type=int, default=5, help='スレッドごとの捨てるリクエスト数')
+    parser.add_argument('--groups', type=int, default=20, help='事前に登録する未完了グループ数')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+    if not os.environ.get('DATABASE_URL'):
+        parser.error('PostgreSQL の DATABASE_URL を設定してください')
+
+    child_args = [
+        '--threads', str(args.threads), '--requests', str(args.requests),
+        '--warmup', str(args.warmup), '--groups', str(args.groups),
+    ]
+    print(f"\n== kitchen poll, {args.threads} threads, {args.requests} requests ==")
+    print(f"{'mode':<14}{'median ms':>12}{'p95 ms':>12}{'max ms':>12}{'req/s':>10}{'pool wait ms':>14}")
+    for mode in args.modes:
+        env = {**os.environ, **MODES[mode]}
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.db_pool', '--child', *child_args],
+            cwd=BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            print(f"{mode:<14}失敗: {completed.stderr.strip().splitlines()[-1]}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        wait = f"{result['pool_wait_ms']:.0f}" if 'pool_wait_ms' in result else '-'
+        print(
+            f"{mode:<14}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}"
+            f"{result['max_ms']:>12.2f}{result['rps']:>10.1f}{wait:>14}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+注文グループIDの採番の同時実行試験
+
+1. 複数プロセス・複数スレッドから common.ids.new_group_id() を同時に呼び、
+   重複がないこと（プロセス内で単調増加していること）と採番の速さを確認します。
+2. 以前の形式（「クリップ色-番号-ミリ秒」）と新しい形式で同じ件数の注文を登録し、
+   登録時間と group_id インデックスの大きさ（SQLite の dbstat）を比べます。
+
+実行例:
+    python -m benchmarks.group_ids --processes 8 --threads 4 --count 20000
+    python -m benchmarks.group_ids --orders 100000
+"""
+
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+
+from benchmarks.support import setup_django, temporary_database
+
+CLIP_COLORS = ('yellow', 'white', 'pink', 'blue', 'green')
+
+
+def _hammer(args):
+    """子プロセス: threads 本のスレッドで count 件ずつ採番する"""
+    threads, count = args
+    from common.ids import new_id
+
+    results = [[] for _ in range(threads)]
+
+    def worker(index):
+        append = results[index].append
+        for _ in range(count):
+            append(new_id())
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results
+
+
+def stress(args):
+    context = multiprocessing.get_context('fork')
+    started = time.perf_counter()
+    with context.Pool(processes=args.processes) as pool:
+        per_process = pool.map(_hammer, [(args.threads, args.count)] * args.processes)
+    elapsed = time.perf_counter() - started
+
+    ids = [value for chunks in per_process for chunk in chunks for value in chunk]
+    ordered = all(chunk == sorted(chunk) for chunks in per_process for chunk in chunks)
+    print(f"\n== {args.processes} processes x {args.threads} threads x {args.count} ids ==")
+    print(f"{'ids':<16}{len(ids):>12}")
+    print(f"{'duplicates':<16}{len(ids) - len(set(ids)):>12}")
+    print(f"{'per-thread order':<16}{'ok' if ordered else 'NG':>12}")
+    print(f"{'ids/s':<16}{len(ids) / elapsed:>12.0f}")
+
+
+def index_size(args):
+    from django.db import connection
+    from common.ids import new_group_id
+    from ice.models import Order
+
+    rng = random.Random(1)
+
+    def legacy_id(index):
+        return f"{rng.choice(CLIP_COLORS)}-{rng.randint(1, 16)}-{1760000000000 + index * 37}"
+
+    schemes = [('clip-color-ms (legacy)', legacy_id), ('snowflake base32', lambda index: new_group_id())]
+    print(f"\n== {args.orders} ice orders, 3 per group ==")
+    print(f"{'group_id':<26}{'insert s':>10}{'index KiB':>12}{'lookup us':>12}")
+    for name, make_id in schemes:
+        # 方式ごとに空のデータベースで計測する
+        with temporary_database():
+            group_ids = [make_id(index) for index in range(args.orders // 3)]
+            started = time.perf_counter()
+            for offset in range(0, len(group_ids), 2000):
+                Order.objects.bulk_create([
+                    Order(group_id=group_id, size='S', container='cup', flavor1='jersey',
+                          clip_color='white', clip_number=1)
+                    for group_id in group_ids[offset:offset + 2000]
+                    for _ in range(3)
+                ])
+            inserted = time.perf_counter() - started
+
+            size = '-'
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = 'ice_group_idx'")
+                    size = f"{cursor.fetchone()[0] / 1024:.0f}"
+
+            samples = rng.sample(group_ids, min(2000, len(group_ids)))
+            started = time.perf_counter()
+            for group_id in samples:
+                list(Order.objects.filter(group_id=group_id).values_list('id', flat=True))
+            lookup = (time.perf_counter() - started) / len(samples) * 1_000_000
+            print(f"{name:<26}{inserted:>10.2f}{size:>12}{lookup:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=8, help='採番するプロセス数')
+    parser.add_argument('--threads', type=int, default=4, help='プロセスごとのスレッド数')
+    parser.add_argument('--count', type=int, default=20000, help='スレッドごとの採番数')
+    parser.add_argument('--orders', type=int, default=60000, help='インデックス比較で登録する注文数')
+    args = parser.parse_args()
+
+    setup_django()
+    stress(args)
+    index_size(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+ice ボード画面のライブウィンドウ取得ベンチマーク
+
+完了済みの履歴注文を大量に投入した状態で、
+全件読み込み（従来方式）・注文行のサブクエリによるライブウィンドウ（以前の方式）・
+注文グループ（OrderGroup）によるライブウィンドウ取得を比較します。
+
+実行例:
+    python -m benchmarks.live_window --history 100000 --active 30
+"""
+
+import argparse
+from datetime import timedelta
+
+from benchmarks.support import measure, print_results, setup_django, temporary_database
+
+
+def seed_orders(history, active, batch_size=5000):
+    """履歴（完了済み）注文と未完了注文を投入する"""
+    from django.db.models import F
+    from django.utils import timezone
+    from common.groups import sync_groups
+    from ice.models import Order
+
+    now = timezone.now()
+    pending = []
+    for i in range(history):
+        completed_at = now - timedelta(minutes=5, seconds=i)
+        pending.append(Order(
+            group_id=f"h{i // 3}",
+            size='S',
+            container='cup',
+            flavor1='jersey',
+            clip_color='yellow',
+            clip_number=i % 16 + 1,
+            status='hold',
+            is_completed=True,
+            completed_at=completed_at,
+        ))
+        if len(pending) >= batch_size:
+            Order.objects.bulk_create(pending)
+            pending = []
+    if pending:
+        Order.objects.bulk_create(pending)
+    # 履歴の受付時刻を完了時刻に揃える（auto_now_add を上書き）
+    Order.objects.filter(is_completed=True).update(timestamp=F('completed_at'))
+
+    Order.objects.bulk_create([
+        Order(
+            group_id=f"a{i // 2}",
+            size='W',
+            container='cone',
+            flavor1='mango',
+            flavor2='mint',
+            clip_color='white',
+            clip_number=i % 16 + 1,
+            status='ok',
+        )
+        for i in range(active)
+    ])
+    # bulk_create はグループの行を作らないため、まとめて作り直す
+    sync_groups(Order, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--history', type=int, default=100_000, help='完了済み履歴注文の件数')
+    parser.add_argument('--active', type=int, default=30, help='未完了注文の件数')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db.models import Q
+    from django.test import Client
+    from django.utils import timezone
+    from common.board import summarize_groups
+    from common.orders import live_window_queryset
+    from ice.models import Order
+    from ice.views import ORDER_STATUS_VALUES
+
+    with temporary_database():
+        seed_orders(args.history, args.active)
+
+        def full_scan():
+            summarize_groups(Order.objects.order_by('timestamp'))
+
+        def row_subquery_window():
+            now = timezone.now()
+            active_rows = Order.objects.filter(is_completed=False, status__in=ORDER_STATUS_VALUES)
+            recent_rows = Order.objects.filter(completed_at__gte=now - timedelta(seconds=30))
+            summarize_groups(Order.objects.filter(
+                Q(group_id__in=active_rows.values('group_id'))
+                | Q(group_id__in=recent_rows.values('group_id'))
+            ).order_by('timestamp', 'id'))
+
+        def live_window():
+            now = timezone.now()
+            summarize_groups(live_window_queryset(Order, now, ORDER_STATUS_VALUES))
+
+        client = Client()
+        results = [
+            ('full table load (legacy)', measure(full_scan, repeat=args.repeat)),
+            ('live window (order rows)', measure(row_subquery_window, repeat=args.repeat)),
+            ('live window (order groups)', measure(live_window, repeat=args.repeat)),
+            ('GET /ice/ice/', measure(lambda: client.get('/ice/ice/'), repeat=args.repeat)),
+            ('GET /ice/deshap/', measure(lambda: client.get('/ice/deshap/'), repeat=args.repeat)),
+        ]
+        print_results(
+            f"ice board: {args.history} history rows / {args.active} active rows",
+            results,
+        )
+
+
+if __name__ == '__main__':
+    main()
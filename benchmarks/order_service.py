@@ -0,0 +1,75 @@
+"""
+注文ドメイン共通処理（common.orders / common.board）のベンチマーク
+
+アイス・フード・かき氷の3モデルについて、同じ共通処理
+（ボードの集計・注文確定・グループ完了・状態変更）の所要時間とクエリ数を計測します。
+3アプリが同じ経路を通るため、どのアプリでもクエリ数が揃うことを確認できます。
+DATABASE_URL を設定すると PostgreSQL で計測できます。
+
+実行例:
+    python -m benchmarks.order_service --groups 40 --items 3
+"""
+
+import argparse
+import itertools
+
+from benchmarks.support import measure, print_results, setup_django, temporary_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--groups', type=int, default=40, help='事前に登録する未完了グループ数')
+    parser.add_argument('--items', type=int, default=3, help='1グループあたりの注文数')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.utils import timezone
+
+    from common.board import build_board
+    from common.orders import complete_group, submit_order_group, update_group_status
+    from food.models import FoodOrder
+    from ice.models import Order
+    from shavedice.models import ShavedIceOrder
+
+    # モデルごとの1行分の注文内容
+    items = {
+        'ice': (Order, {'size': 'S', 'container': 'cup', 'flavor1': 'jersey'}),
+        'food': (FoodOrder, {'menu': 'からあげ丼', 'quantity': 1, 'eat_in': True}),
+        'shavedice': (ShavedIceOrder, {'flavor': '🍧いちご🍧'}),
+    }
+    shared = {'clip_color': 'yellow', 'clip_number': 1, 'note': ''}
+    counter = itertools.count()
+
+    def submit(model, item):
+        # アイスの group_id は20文字までのため短いIDを使う
+        group_id = f"b{next(counter)}"
+        submit_order_group(model, group_id, [item] * args.items, inherit_stop=False, **shared)
+        return group_id
+
+    with temporary_database():
+        results = []
+        for label, (model, item) in items.items():
+            for _ in range(args.groups):
+                submit(model, item)
+
+            results.append((f'{label}: build_board',
+                            measure(lambda: build_board(model, timezone.now()), repeat=args.repeat)))
+            results.append((f'{label}: submit_order_group',
+                            measure(lambda: submit(model, item), repeat=args.repeat)))
+            # 計測回数（ウォームアップ含む）分のグループを先に登録し、完了だけを計測する
+            pending = iter([submit(model, item) for _ in range(args.repeat + 2)])
+            results.append((f'{label}: complete_group',
+                            measure(lambda: complete_group(model, next(pending)), repeat=args.repeat)))
+            group_id = submit(model, item)
+            statuses = itertools.cycle(['stop', 'ok'])
+            results.append((f'{label}: update_group_status',
+                            measure(lambda: update_group_status(model, group_id, next(statuses),
+                                                                statuses={'ok', 'stop'}),
+                                    repeat=args.repeat)))
+        print_results('order service', results)
+
+
+if __name__ == '__main__':
+    main()
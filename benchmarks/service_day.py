@@ -0,0 +1,304 @@
+"""
+営業日シミュレーションによる負荷試験
+
+アイス・フード・かき氷のレジ、キッチン／デシャップのタブレット、待ち時間表示、
+保留解除ワーカーを1つのシナリオとして再生し、エンドポイントごとに
+レイテンシ（p50/p95/p99）・1リクエストあたりのクエリ数・スループットを集計します。
+
+- レジ: カート追加（add_temp_ice / add_temp_food）を数回行ってから注文確定
+- キッチン: 3秒ごとにポーリングし、受付から提供時間が経過したグループを完了
+- デシャップ: 3秒ごとにポーリングし、一部のグループを STOP → OK（アイスは保留）に変更
+- 待ち時間表示: 3秒ごとにポーリング
+
+リクエストは Django のテストクライアントで1本ずつ順に実行します（ネットワークを含まない
+サーバー側の処理時間）。--speed 倍速でシミュレーション時刻を進め、処理が追いつかない場合は
+遅延（lag）として表示します。表示期間などの判定は実時刻で行われるため、倍速を上げるほど
+直近完了グループが多めに表示されます。
+
+DATABASE_URL を設定すると PostgreSQL、未設定なら SQLite の使い捨てデータベースで計測します。
+
+実行例:
+    python -m benchmarks.service_day --minutes 30 --speed 20
+    DATABASE_URL=postgres://localhost/cafemuji python -m benchmarks.service_day
+"""
+
+import argparse
+import heapq
+import itertools
+import random
+import time
+from collections import defaultdict
+
+from benchmarks.support import setup_django, temporary_database
+
+POLL_HEADERS = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest', 'HTTP_ACCEPT': 'application/json'}
+
+
+def percentile(sorted_samples, ratio):
+    """昇順に並んだサンプルの百分位（最近傍順位法）"""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, int(round(ratio * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+class Recorder:
+    """エンドポイントごとの所要時間・クエリ数・エラー数を記録する"""
+
+    def __init__(self):
+        from django.db import connection
+
+        self.connection = connection
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, name, func):
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(self.connection) as ctx:
+            started = time.perf_counter()
+            response = func()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        self.samples[name].append((elapsed_ms, len(ctx.captured_queries)))
+        if getattr(response, 'status_code', 200) >= 400:
+            self.errors[name] += 1
+        return response
+
+
+class ServiceDay:
+    """シミュレーション時刻（秒）順にアクターを実行するスケジューラ"""
+
+    def __init__(self, args):
+        from django.test import Client
+
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.recorder = Recorder()
+        self.client_class = Client
+        self.queue = []
+        self.sequence = itertools.count()
+        self.clip_numbers = itertools.cycle(range(1, 100))
+        # アプリごとの未完了グループ: group_id → 受付時刻（シミュレーション秒）
+        self.open_groups = defaultdict(dict)
+        self.max_lag = 0.0
+
+    def schedule(self, at, actor):
+        heapq.heappush(self.queue, (at, next(self.sequence), actor))
+
+    def run(self):
+        end = self.args.minutes * 60
+        started = time.perf_counter()
+        while self.queue:
+            at, _, actor = heapq.heappop(self.queue)
+            if at > end:
+                break
+            target = started + at / self.args.speed
+            delay = target - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.max_lag = max(self.max_lag, -delay)
+            next_delay = actor(at)
+            if next_delay is not None:
+                self.schedule(at + next_delay, actor)
+        return time.perf_counter() - started
+
+    # --- レジ ---------------------------------------------------------------
+
+    def register(self, app):
+        client = self.client_class()
+        color = self.rng.choice(['yellow', 'white'])
+
+        def step(now):
+            clip_number = next(self.clip_numbers)
+            for _ in range(self.rng.randint(1, 3)):
+                self.add_to_cart(app, client)
+            self.recorder.call(
+                f'{app}: submit_order_group',
+                lambda: client.post(f'/{app}/submit_order_group/', {
+                    'clip_color': color, 'clip_number': clip_number, 'note': '',
+                }),
+            )
+            group_id = self.model(app).objects.order_by('-id').values_list('group_id', flat=True).first()
+            if group_id:
+                self.open_groups[app][group_id] = now
+            return self.rng.expovariate(1 / self.args.order_interval)
+
+        return step
+
+    def add_to_cart(self, app, client):
+        from food.views import FOOD_MENU_NAMES
+        from ice.views import FLAVORS
+        from shavedice.models import ShavedIceOrder
+
+        if app == 'ice':
+            data = {'flavor1': self.rng.choice(FLAVORS), 'size': 'S', 'container': 'cup'}
+            path = '/ice/add_temp_ice/'
+        elif app == 'food':
+            data = {'menu': self.rng.choice(sorted(FOOD_MENU_NAMES)), 'quantity': 1, 'eat_in': '1'}
+            path = '/food/add_temp_food/'
+        else:
+            data = {'flavor': self.rng.choice(ShavedIceOrder.FLAVOR_CHOICES)[0]}
+            path = '/shavedice/add_temp_ice/'
+        self.recorder.call(f'{app}: add to cart', lambda: client.post(path, data, **POLL_HEADERS))
+
+    # --- タブレット ---------------------------------------------------------
+
+    def tablet(self, app, role):
+        client = self.client_class()
+        state = {'since': None, 'etag': None}
+        url_name, params = BOARD_POLLS[app][role]
+
+        def step(now):
+            from django.urls import reverse
+
+            query = dict(params)
+            if state['since'] is not None:
+                query['since'] = state['since']
+            headers = dict(POLL_HEADERS)
+            if state['etag']:
+                headers['HTTP_IF_NONE_MATCH'] = state['etag']
+            response = self.recorder.call(
+                f'{app}: {role} poll',
+                lambda: client.get(reverse(url_name), query, **headers),
+            )
+            if response.status_code == 200:
+                state['etag'] = response.get('ETag')
+                state['since'] = response.json().get('revision', state['since'])
+
+            if role == 'kitchen':
+                self.complete_ready_groups(app, client, now)
+            elif role == 'deshap' and self.rng.random() < self.args.status_change_rate:
+                self.change_status(app, client)
+            return self.args.poll_interval
+
+        return step
+
+    def complete_ready_groups(self, app, client, now):
+        ready = [
+            group_id for group_id, created in self.open_groups[app].items()
+            if now - created >= self.args.service_seconds
+        ]
+        for group_id in ready:
+            del self.open_groups[app][group_id]
+            self.recorder.call(
+                f'{app}: complete_group',
+                lambda: client.post(COMPLETE_PATHS[app].format(group_id=group_id), **POLL_HEADERS),
+            )
+
+    def change_status(self, app, client):
+        if not self.open_groups[app]:
+            return
+        group_id = self.rng.choice(list(self.open_groups[app]))
+        new_status = 'hold' if app == 'ice' else self.rng.choice(['stop', 'ok'])
+        self.recorder.call(
+            f'{app}: update_status',
+            lambda: client.post(f'/{app}/update_status/{group_id}/{new_status}/'),
+        )
+
+    # --- ワーカー -----------------------------------------------------------
+
+    def hold_worker(self):
+        from ice.holds import resolve_hold_status
+
+        def step(now):
+            self.recorder.call('worker: resolve_hold_status', resolve_hold_status)
+            return 2
+
+        return step
+
+    @staticmethod
+    def model(app):
+        from food.models import FoodOrder
+        from ice.models import Order
+        from shavedice.models import ShavedIceOrder
+
+        return {'ice': Order, 'food': FoodOrder, 'shavedice': ShavedIceOrder}[app]
+
+
+# タブレットの役割ごとのポーリング先（URL名, クエリ）
+BOARD_POLLS = {
+    'ice': {
+        'kitchen': ('ice_changes', {}),
+        'deshap': ('deshap_changes', {}),
+    },
+    'food': {
+        'kitchen': ('food_kitchen', {'format': 'json'}),
+        'deshap': ('food_deshap', {'format': 'json'}),
+        'waittime': ('food_wait_time', {'format': 'json'}),
+    },
+    'shavedice': {
+        'kitchen': ('shavedice_kitchen_changes', {}),
+        'deshap': ('shavedice_deshap_changes', {}),
+        'waittime': ('shavedice_wait_time', {'format': 'json'}),
+    },
+}
+
+COMPLETE_PATHS = {
+    'ice': '/ice/complete_group/{group_id}/',
+    'food': '/food/complete_group/{group_id}/',
+    'shavedice': '/shavedice/complete_group/{group_id}/',
+}
+
+
+def print_report(title, recorder, wall_seconds, max_lag):
+    print(f"\n== {title} ==")
+    print(f"{'endpoint':<36}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'queries':>9}{'req/s':>9}{'errors':>8}")
+    total_count = 0
+    total_busy_ms = 0.0
+    for name in sorted(recorder.samples):
+        samples = recorder.samples[name]
+        latencies = sorted(ms for ms, _ in samples)
+        queries = sum(count for _, count in samples) / len(samples)
+        total_count += len(samples)
+        total_busy_ms += sum(latencies)
+        print(
+            f"{name:<36}{len(samples):>8}{percentile(latencies, 0.50):>10.2f}"
+            f"{percentile(latencies, 0.95):>10.2f}{percentile(latencies, 0.99):>10.2f}"
+            f"{latencies[-1]:>10.2f}{queries:>9.1f}{len(samples) / wall_seconds:>9.2f}"
+            f"{recorder.errors[name]:>8}"
+        )
+    print(f"\n合計 {total_count} リクエスト / 実時間 {wall_seconds:.1f} 秒"
+          f"（{total_count / wall_seconds:.1f} req/s、最大遅延 {max_lag:.2f} 秒）")
+    if total_busy_ms:
+        # 1スレッドで処理し続けた場合の上限（ネットワーク・ミドルウェア外の処理は含まない）
+        print(f"処理時間の合計 {total_busy_ms / 1000:.1f} 秒 → 1スレッドあたり約 "
+              f"{total_count / (total_busy_ms / 1000):.0f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=30, help='シミュレーションする営業時間（分）')
+    parser.add_argument('--speed', type=float, default=20, help='シミュレーション時刻の倍速')
+    parser.add_argument('--registers', type=int, default=1, help='アプリごとのレジ台数')
+    parser.add_argument('--tablets', type=int, default=2, help='役割ごとのタブレット台数')
+    parser.add_argument('--order-interval', type=float, default=40, help='レジ1台あたりの平均注文間隔（秒）')
+    parser.add_argument('--poll-interval', type=float, default=3, help='タブレットのポーリング間隔（秒）')
+    parser.add_argument('--service-seconds', type=float, default=180, help='受付から完了までの時間（秒）')
+    parser.add_argument('--status-change-rate', type=float, default=0.05,
+                        help='デシャップのポーリング1回あたりに状態変更する確率')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+
+    with temporary_database() as connection:
+        day = ServiceDay(args)
+        for app, roles in BOARD_POLLS.items():
+            for _ in range(args.registers):
+                day.schedule(day.rng.uniform(0, args.order_interval), day.register(app))
+            for role in roles:
+                for _ in range(args.tablets):
+                    day.schedule(day.rng.uniform(0, args.poll_interval), day.tablet(app, role))
+        day.schedule(0, day.hold_worker())
+
+        wall_seconds = day.run()
+        print_report(
+            f"service day: {args.minutes:g} min x{args.speed:g} on {connection.vendor}",
+            day.recorder, wall_seconds, day.max_lag,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+SQLite（LAN 営業）での同時アクセス試験
+
+ノートPC1台の SQLite で営業する場合を想定し、レジ2台（アイス・かき氷）と
+タブレット（キッチン・デシャップ・待ち時間表示）を別々のスレッドで同時に動かします。
+ファイル上の使い捨てデータベースを使い、エンドポイントごとのレイテンシと
+エラー（「database is locked」など）の件数を集計します。
+
+- lan: settings.SQLITE_LAN_PROFILE=True（WAL・busy timeout・書き込みの直列化）
+- default: SQLITE_LAN_PROFILE=False（Django の既定の SQLite 設定）
+
+設定は起動時に決まるため、プロファイルごとに子プロセスで計測します。
+
+実行例:
+    python -m benchmarks.sqlite_lan --tablets 10 --seconds 30
+    python -m benchmarks.sqlite_lan --profiles lan
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.service_day import BOARD_POLLS, COMPLETE_PATHS, POLL_HEADERS, percentile
+from benchmarks.support import BASE_DIR, setup_django, temporary_database
+
+PROFILES = {
+    'lan': {'SQLITE_LAN_PROFILE': 'True'},
+    'default': {'SQLITE_LAN_PROFILE': 'False'},
+}
+
+# タブレットの割り当て順（台数が多いほど先頭から繰り返す）
+TABLET_ROLES = [
+    ('ice', 'kitchen'), ('shavedice', 'kitchen'), ('ice', 'deshap'), ('shavedice', 'deshap'),
+    ('shavedice', 'waittime'),
+]
+
+CART_PATHS = {'ice': '/ice/add_temp_ice/', 'shavedice': '/shavedice/add_temp_ice/'}
+
+
+class Recorder:
+    """スレッドから呼ばれる計測値の記録"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, name, func):
+        started = time.perf_counter()
+        try:
+            response = func()
+            failed = response.status_code >= 500
+        except Exception:
+            response, failed = None, True
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.samples[name].append(elapsed_ms)
+            if failed:
+                self.errors[name] += 1
+        return response
+
+
+def run_child(args):
+    """子プロセス: 現在の設定で同時アクセスを再生し、結果を JSON で出力する"""
+    setup_django()
+
+    from django.db import connection
+    from django.test import Client
+    from django.urls import reverse
+    from django.utils import timezone
+
+    from ice.models import Order
+    from ice.views import FLAVORS
+    from shavedice.models import ShavedIceOrder
+
+    models = {'ice': Order, 'shavedice': ShavedIceOrder}
+    recorder = Recorder()
+    stop = threading.Event()
+
+    def cart_item(app, rng):
+        if app == 'ice':
+            return {'flavor1': rng.choice(FLAVORS), 'size': 'S', 'container': 'cup'}
+        return {'flavor': rng.choice(ShavedIceOrder.FLAVOR_CHOICES)[0]}
+
+    def register(app, seed):
+        rng = random.Random(seed)
+        client = Client()
+        clip_number = 0
+        while not stop.is_set():
+            clip_number = clip_number % 16 + 1
+            for _ in range(rng.randint(1, 3)):
+                recorder.call(f'{app}: add to cart', lambda: client.post(
+                    CART_PATHS[app], cart_item(app, rng), **POLL_HEADERS))
+            recorder.call(f'{app}: submit_order_group', lambda: client.post(
+                f'/{app}/submit_order_group/', {'clip_color': 'white', 'clip_number': clip_number}))
+            stop.wait(rng.expovariate(1 / args.order_interval))
+        connection.close()
+
+    def tablet(app, role, seed):
+        rng = random.Random(seed)
+        client = Client()
+        url_name, params = BOARD_POLLS[app][role]
+        stop.wait(rng.random() * args.poll_interval)
+        while not stop.is_set():
+            recorder.call(f'{app}: {role} poll', lambda: client.get(
+                reverse(url_name), params, **POLL_HEADERS))
+            if role == 'kitchen':
+                ready_before = timezone.now() - timezone.timedelta(seconds=args.service_seconds)
+                group_ids = list(
+                    models[app].objects.filter(is_completed=False, timestamp__lte=ready_before)
+                    .order_by().values_list('group_id', flat=True).distinct()[:2]
+                )
+                for group_id in group_ids:
+                    recorder.call(f'{app}: complete_group', lambda: client.post(
+                        COMPLETE_PATHS[app].format(group_id=group_id), **POLL_HEADERS))
+            stop.wait(args.poll_interval)
+        connection.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        with temporary_database(test_name=str(Path(directory) / 'lan.sqlite3')):
+            connection.close()
+            threads = [
+                threading.Thread(target=register, args=(app, index))
+                for index, app in enumerate(['ice', 'shavedice'][:args.registers])
+            ]
+            for index in range(args.tablets):
+                app, role = TABLET_ROLES[index % len(TABLET_ROLES)]
+                threads.append(threading.Thread(target=tablet, args=(app, role, 100 + index)))
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            orders = sum(model.objects.count() for model in models.values())
+
+    print(json.dumps({
+        'orders': orders,
+        'endpoints': {
+            name: {
+                'count': len(samples),
+                'p50_ms': percentile(sorted(samples), 0.50),
+                'p95_ms': percentile(sorted(samples), 0.95),
+                'max_ms': max(samples),
+                'errors': recorder.errors[name],
+            }
+            for name, samples in sorted(recorder.samples.items())
+        },
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--seconds', type=float, default=30, help='計測する秒数')
+    parser.add_argument('--registers', type=int, default=2, choices=[1, 2], help='レジ台数')
+    parser.add_argument('--tablets', type=int, default=10, help='タブレット台数')
+    parser.add_argument('--order-interval', type=float, default=1.0, help='レジ1台あたりの平均注文間隔（秒）')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='タブレットのポーリング間隔（秒）')
+    parser.add_argument('--service-seconds', type=float, default=3.0, help='受付から完了までの秒数')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+    if os.environ.get('DATABASE_URL'):
+        parser.error('SQLite で計測するため DATABASE_URL を外して実行してください')
+
+    child_args = [
+        '--seconds', str(args.seconds), '--registers', str(args.registers),
+        '--tablets', str(args.tablets), '--order-interval', str(args.order_interval),
+        '--poll-interval', str(args.poll_interval), '--service-seconds', str(args.service_seconds),
+    ]
+    for profile in args.profiles:
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.sqlite_lan', '--child', *child_args],
+            cwd=BASE_DIR, env={**os.environ, **PROFILES[profile]}, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            print(f"\n== {profile}: 失敗 ==\n{completed.stderr.strip()}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"\n== {profile}: registers={args.registers} tablets={args.tablets} "
+              f"seconds={args.seconds:g} orders={result['orders']} ==")
+        print(f"{'endpoint':<32}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}")
+        for name, row in result['endpoints'].items():
+            print(
+                f"{name:<32}{row['count']:>8}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+                f"{row['max_ms']:>10.2f}{row['errors']:>8}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+注文確定（submit_order_group）の書き込み方式ベンチマーク
+
+1行ずつ objects.create() する従来方式と、共通処理
+common.orders.submit_order_group() による1トランザクション・bulk_create を
+カートの行数ごとに比較します。DATABASE_URL を設定すると PostgreSQL で計測できます。
+
+実行例:
+    python -m benchmarks.submit_paths --items 1 10 30
+"""
+
+import argparse
+import itertools
+
+from benchmarks.support import measure, print_results, setup_django, temporary_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, nargs='+', default=[1, 10, 30], help='カートの行数')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from common.orders import submit_order_group
+    from food.models import FoodOrder
+
+    counter = itertools.count()
+    shared = {'clip_color': 'yellow', 'clip_number': 1, 'note': ''}
+
+    def legacy(count):
+        # 変更前の food.views.submit_order_group と同じ書き込み方
+        group_id = f"legacy-{next(counter)}"
+        has_stop = FoodOrder.objects.filter(is_completed=False, status='stop').exists()
+        status = 'stop' if has_stop else 'ok'
+        for _ in range(count):
+            FoodOrder.objects.create(
+                menu='からあげ丼', quantity=1, eat_in=True,
+                group_id=group_id, status=status, **shared,
+            )
+
+    def bulk(count):
+        submit_order_group(
+            FoodOrder, f"bulk-{next(counter)}",
+            [{'menu': 'からあげ丼', 'quantity': 1, 'eat_in': True}] * count,
+            **shared,
+        )
+
+    with temporary_database():
+        results = []
+        for count in args.items:
+            results.append((f'{count} items: create() per row (legacy)',
+                            measure(lambda: legacy(count), repeat=args.repeat)))
+            results.append((f'{count} items: bulk_create service',
+                            measure(lambda: bulk(count), repeat=args.repeat)))
+        print_results('order submission', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+cafeMuji - ベンチマーク共通処理
+
+Django の初期化、使い捨てデータベースの作成、計測結果の集計を提供します。
+"""
+
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """ベンチマーク用に Django を初期化する"""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def temporary_database(test_name=None):
+    """
+    テスト用データベースを作成し、終了時に破棄するコンテキストマネージャ
+
+    DATABASE_URL が設定されていれば PostgreSQL 上に、なければ SQLite 上に作成されます。
+    SQLite の既定はメモリ上のデータベースです。ファイルでの挙動（WAL・ロック）を
+    計測する場合は test_name にファイルパスを指定します。
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if test_name:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, repeat=20, warmup=2):
+    """
+    関数を繰り返し実行し、所要時間とクエリ数を集計する
+
+    Returns:
+        dict: 中央値・p95・最小値（ミリ秒）と1回あたりのクエリ数
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        func()
+
+    samples = []
+    query_counts = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - started) * 1000)
+        query_counts.append(len(ctx.captured_queries))
+
+    samples.sort()
+    return {
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'min_ms': samples[0],
+        'queries': max(query_counts),
+    }
+
+
+def print_results(title, rows):
+    """計測結果を表形式で出力する"""
+    print(f"\n== {title} ==")
+    print(f"{'case':<40}{'median ms':>12}{'p95 ms':>12}{'min ms':>12}{'queries':>10}")
+    for name, result in rows:
+        print(
+            f"{name:<40}{result['median_ms']:>12.2f}{result['p95_ms']:>12.2f}"
+            f"{result['min_ms']:>12.2f}{result['queries']:>10}"
+        )
@@ -0,0 +1,22 @@
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'common'
+
+    def ready(self):
+        # シグナルは登録順に実行される。自動コミットの1件保存では各書き込みが個別に
+        # コミットされるため、注文グループ・集計を先に更新し、リビジョンは最後に進める
+        # （新しいリビジョンを読んだポーリングが古いグループでボードを作ってキャッシュしない）
+        # 1件ずつ保存・削除される注文を注文グループ（OrderGroup）に反映するシグナルを登録
+        from . import groups
+        groups.connect_signals()
+        # 1件ずつ作成・削除される注文を集計（ロールアップ）に反映するシグナルを登録
+        from . import rollups
+        rollups.connect_signals()
+        # 注文モデルの保存・削除でボードのリビジョンを進めるシグナルを登録
+        from . import revisions
+        revisions.connect_signals()
+        # リビジョン単位のキャッシュ（ボードのスナップショット・待ち時間）を登録
+        from . import board, service_times  # noqa: F401
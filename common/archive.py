@@ -0,0 +1,152 @@
+"""
+cafeMuji - 注文のアーカイブ
+
+前日以前に完了した注文グループを注文テーブルから ArchivedOrder へ移します
+（毎晩 `python manage.py archive_orders` で実行）。注文テーブルの大きさが
+「当日の注文」程度に保たれるため、ボード・統計・管理画面のクエリが
+シーズン後半に遅くなりません。
+
+- グループ単位で移します。未完了の注文を含むグループ・当日に完了したグループは残します。
+- 移動はバッチごとに1トランザクション（INSERT → DELETE）で行い、途中で止まっても
+  同じ注文が二重に残ったり消えたりしません（再実行は (app_label, original_id) の
+  一意制約で重複を無視します）。
+- 削除は保存・削除シグナルを通さないため、ボードのリビジョンは進みません
+  （アーカイブ対象はボードに表示されていない注文だけです）。移したグループの
+  OrderGroup の行は同じトランザクションで削除します。
+- 過去の注文は order_history() で注文テーブルとアーカイブをまとめて読めます。
+"""
+
+from datetime import datetime, time as dt_time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import Coalesce
+from django.forms.models import model_to_dict
+from django.utils import timezone
+
+from .groups import delete_groups
+from .models import ArchivedOrder
+from .service_times import service_key
+
+# 生の DELETE 1文で削除する行数（SQLite のパラメータ数の上限 999 より小さくする）
+DELETE_CHUNK_ROWS = 500
+
+
+def business_day_start(day=None):
+    """営業日の開始時刻（その日のローカル時刻 0:00、省略時は今日）"""
+    day = day or timezone.localdate()
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def archivable_group_ids(model, cutoff, group_ids=None):
+    """
+    すべての注文が cutoff より前に完了したグループID
+
+    Args:
+        group_ids: 指定時はこのグループだけを集計する（group_id のインデックスで読む）
+    """
+    rows = model.objects.order_by()
+    if group_ids is not None:
+        rows = rows.filter(group_id__in=list(group_ids))
+    return (
+        rows.values('group_id')
+        .annotate(
+            open_count=Count('id', filter=Q(is_completed=False)),
+            last_at=Coalesce(Max('completed_at'), Max('timestamp')),
+        )
+        .filter(open_count=0, last_at__lt=cutoff)
+        .values_list('group_id', flat=True)
+    )
+
+
+def _archive_row(order):
+    return ArchivedOrder(
+        app_label=order._meta.app_label,
+        original_id=order.pk,
+        group_id=order.group_id,
+        item=service_key(order),
+        quantity=getattr(order, 'quantity', 1) or 1,
+        status=order.status,
+        timestamp=order.timestamp,
+        completed_at=order.completed_at,
+        data=model_to_dict(order),
+    )
+
+
+def _delete_rows(model, ids):
+    # QuerySet.delete() は1行ずつ削除シグナルを送る（リビジョンが行数分進む）ため直接削除する
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        for offset in range(0, len(ids), DELETE_CHUNK_ROWS):
+            chunk = ids[offset:offset + DELETE_CHUNK_ROWS]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', chunk)
+
+
+def batch_size(batch_groups=None):
+    """1トランザクションで移すグループ数（settings.ARCHIVE_MAX_BATCH_GROUPS までに抑える）"""
+    if batch_groups is None:
+        batch_groups = settings.ARCHIVE_BATCH_GROUPS
+    return max(1, min(batch_groups, settings.ARCHIVE_MAX_BATCH_GROUPS))
+
+
+def archive_orders(model, cutoff, batch_groups=None, dry_run=False):
+    """
+    cutoff より前に完了したグループをアーカイブへ移す
+
+    Args:
+        model: 注文モデル
+        cutoff: この時刻より前に完了したグループを移す
+        batch_groups: 1トランザクションで移すグループ数
+            （省略時は settings.ARCHIVE_BATCH_GROUPS。ARCHIVE_MAX_BATCH_GROUPS が上限）
+        dry_run: True のときは件数を数えるだけ
+
+    Returns:
+        int: 移した（dry_run では対象の）注文の件数
+    """
+    if dry_run:
+        return model.objects.filter(group_id__in=archivable_group_ids(model, cutoff)).count()
+
+    # 対象の一覧は全体の集計1回で作り、バッチごとには集計し直さない
+    candidates = list(archivable_group_ids(model, cutoff))
+    batch_groups = batch_size(batch_groups)
+    moved = 0
+    for offset in range(0, len(candidates), batch_groups):
+        with transaction.atomic():
+            # 一覧を作った後に注文が追加されたグループを除く（バッチのグループだけを確認する）
+            group_ids = list(archivable_group_ids(model, cutoff, candidates[offset:offset + batch_groups]))
+            if not group_ids:
+                continue
+            orders = list(model.objects.select_for_update().filter(group_id__in=group_ids))
+            ArchivedOrder.objects.bulk_create(
+                [_archive_row(order) for order in orders], ignore_conflicts=True
+            )
+            _delete_rows(model, [order.pk for order in orders])
+            delete_groups(model, group_ids)
+        moved += len(orders)
+    return moved
+
+
+def order_history(model, start, end):
+    """
+    期間内に受け付けた注文を、注文テーブルとアーカイブの両方から読む
+
+    Args:
+        model: 注文モデル
+        start / end: 受付時刻の範囲（start 以上 end 未満）
+
+    Yields:
+        dict: item / quantity / status / timestamp / completed_at
+    """
+    for order in model.objects.filter(timestamp__gte=start, timestamp__lt=end).iterator():
+        yield {
+            'item': service_key(order),
+            'quantity': getattr(order, 'quantity', 1) or 1,
+            'status': order.status,
+            'timestamp': order.timestamp,
+            'completed_at': order.completed_at,
+        }
+    yield from ArchivedOrder.objects.filter(
+        app_label=model._meta.app_label, timestamp__gte=start, timestamp__lt=end,
+    ).values('item', 'quantity', 'status', 'timestamp', 'completed_at').iterator()
@@ -0,0 +1,179 @@
+"""
+cafeMuji - ボード画面のビューモデル
+
+キッチン・デシャップ画面に表示するグループを、注文の一覧を1回だけ走査して
+GroupSummary にまとめます。まとめた結果はアプリのリビジョンをキーにキャッシュし、
+同じリビジョンを表示している複数のタブレットで1回分の集計を共有します。
+
+経過時間と完了済みグループの表示期限だけは時刻に依存するため、
+キャッシュには含めず、読み出すたびに計算します。
+
+非同期ビュー（ASGI）からは alive_board() を使います（キャッシュと ORM を非同期で読む）。
+"""
+
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .orders import COMPLETED_DISPLAY_SECONDS, live_window_queryset
+from .revisions import BOARD_APPS, register_revision_cache, revision_cache_key
+
+_build_lock = threading.Lock()
+
+for _app_label in BOARD_APPS:
+    register_revision_cache('board', _app_label)
+
+
+class GroupSummary:
+    """
+    ボードに表示する1グループ分の集計
+
+    テンプレートはこのオブジェクトの属性だけで1枚のカードを描画します
+    （get_item による dict 参照は不要）。
+    """
+
+    __slots__ = (
+        'group_id', 'clip_color', 'clip_number', 'status', 'is_auto_stopped', 'note',
+        'orders', 'items', 'pudding_count', 'open_count', 'open_quantity',
+        'oldest_timestamp', 'latest_completed_at', 'is_completed',
+        'elapsed_seconds', 'elapsed_minutes',
+    )
+
+    def __init__(self, first_order):
+        self.group_id = first_order.group_id
+        self.clip_color = first_order.clip_color
+        self.clip_number = first_order.clip_number
+        self.status = first_order.status
+        self.is_auto_stopped = getattr(first_order, 'is_auto_stopped', False)
+        self.note = first_order.note
+        self.orders = []
+        self.items = []
+        self.pudding_count = 0
+        self.open_count = 0
+        self.open_quantity = 0
+        self.oldest_timestamp = first_order.timestamp
+        self.latest_completed_at = None
+        self.is_completed = True
+        self.elapsed_seconds = 0
+        self.elapsed_minutes = 0
+
+    def add(self, order):
+        """注文を1件取り込む（timestamp 昇順で渡す）"""
+        self.orders.append(order)
+        if getattr(order, 'is_pudding', False):
+            self.pudding_count += 1
+        else:
+            self.items.append(order)
+        if order.is_completed:
+            if order.completed_at and (
+                self.latest_completed_at is None or order.completed_at > self.latest_completed_at
+            ):
+                self.latest_completed_at = order.completed_at
+        else:
+            self.open_count += 1
+            self.open_quantity += getattr(order, 'quantity', 1)
+            self.is_completed = False
+
+    def set_elapsed(self, now):
+        """最初の注文からの経過時間を設定する"""
+        self.elapsed_seconds = int((now - self.oldest_timestamp).total_seconds())
+        self.elapsed_minutes = self.elapsed_seconds // 60
+
+
+def summarize_groups(orders):
+    """
+    timestamp 昇順の注文を1回だけ走査し、group_id → GroupSummary の dict を作る
+    """
+    groups = {}
+    for order in orders:
+        summary = groups.get(order.group_id)
+        if summary is None:
+            summary = groups[order.group_id] = GroupSummary(order)
+        summary.add(order)
+    return groups
+
+
+def build_board(model, now, status_values=None, completed_seconds=COMPLETED_DISPLAY_SECONDS):
+    """
+    ライブウィンドウの注文からボードのスナップショットを作る
+
+    Returns:
+        dict: active（未完了グループ）と completed（直近完了グループ）の
+            GroupSummary リスト
+    """
+    groups = summarize_groups(live_window_queryset(model, now, status_values, completed_seconds))
+    return _split_board(groups, now, completed_seconds)
+
+
+async def abuild_board(model, now, status_values=None, completed_seconds=COMPLETED_DISPLAY_SECONDS):
+    """build_board() の非同期版"""
+    orders = [
+        order async for order in live_window_queryset(model, now, status_values, completed_seconds)
+    ]
+    return _split_board(summarize_groups(orders), now, completed_seconds)
+
+
+def _split_board(groups, now, completed_seconds):
+    window = timedelta(seconds=completed_seconds)
+    active = []
+    completed = []
+    for summary in groups.values():
+        if not summary.is_completed:
+            active.append(summary)
+        elif summary.latest_completed_at and now - summary.latest_completed_at <= window:
+            completed.append(summary)
+    return {'active': active, 'completed': completed}
+
+
+def live_board(model, revision, now, status_values=None,
+               completed_seconds=COMPLETED_DISPLAY_SECONDS):
+    """
+    リビジョン単位でキャッシュしたボードを、現在時刻に合わせて返す
+
+    Args:
+        model: 注文モデル
+        revision: 集計前に読んだアプリのリビジョン
+        now: 経過時間・表示期限の基準時刻
+        status_values: live_window_queryset() に渡す状態値
+        completed_seconds: 完了済みグループを表示しておく秒数
+
+    Returns:
+        tuple: (active, completed) の GroupSummary リスト（表示順）
+    """
+    key = revision_cache_key('board', model._meta.app_label, revision)
+    board = cache.get(key)
+    if board is None:
+        with _build_lock:
+            board = cache.get(key)
+            if board is None:
+                board = build_board(model, now, status_values, completed_seconds)
+                cache.set(key, board, settings.BOARD_CACHE_SECONDS)
+    return _board_at(board, now, completed_seconds)
+
+
+async def alive_board(model, revision, now, status_values=None,
+                      completed_seconds=COMPLETED_DISPLAY_SECONDS):
+    """
+    live_board() の非同期版
+
+    イベントループをまたぐロックは取らないため、キャッシュが切れた直後に
+    同時に届いたポーリングは、それぞれが集計することがあります。
+    """
+    key = revision_cache_key('board', model._meta.app_label, revision)
+    board = await cache.aget(key)
+    if board is None:
+        board = await abuild_board(model, now, status_values, completed_seconds)
+        await cache.aset(key, board, settings.BOARD_CACHE_SECONDS)
+    return _board_at(board, now, completed_seconds)
+
+
+def _board_at(board, now, completed_seconds):
+    """キャッシュしたボードに、現在時刻の経過時間と表示期限を当てはめる"""
+    window = timedelta(seconds=completed_seconds)
+    active = board['active']
+    for summary in active:
+        summary.set_elapsed(now)
+    completed = [s for s in board['completed'] if now - s.latest_completed_at <= window]
+    return active, completed
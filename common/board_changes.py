@@ -0,0 +1,66 @@
+"""
+cafeMuji - ボードの差分更新
+
+キッチン・デシャップ画面を再読み込みせずに更新するための共通処理です。
+クライアントは前回受け取ったリビジョンを ?since= で送り、
+サーバーはそれ以降に変更されたグループのカードだけを HTML 断片で返します。
+ブラウザは data-group-id を持つカードを差し替え・削除・並べ替えて画面を更新します。
+"""
+
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .revisions import changed_group_ids, requested_since
+
+ACTIVE_SECTION = 'active'
+COMPLETED_SECTION = 'completed'
+
+
+def board_changes_response(request, app_label, revision, active, completed,
+                           render_group, extra=None):
+    """
+    前回のリビジョン以降に変わったグループの HTML 断片を返す
+
+    Args:
+        request: リクエスト（?since=<リビジョン> を含む）
+        app_label: 'ice' / 'food' / 'shavedice'
+        revision: 集計前に読んだ現在のリビジョン
+        active: 未完了グループ（group_id → 注文リスト、表示順）
+        completed: 直近完了グループ（group_id → 注文リスト、表示順）
+        render_group: (group_id, orders, section) を受け取りカードの HTML を返す関数
+        extra: レスポンスに追加する値（件数表示など）
+
+    Returns:
+        JsonResponse: groups に変更カード、order に各セクションの表示順を含む JSON。
+            full が True の場合は groups に全カードが入る
+    """
+    changed = changed_group_ids(app_label, requested_since(request), revision)
+    full = changed is None
+    sections = {ACTIVE_SECTION: active, COMPLETED_SECTION: completed}
+
+    if full:
+        targets = list(active) + list(completed)
+    else:
+        targets = sorted(changed)
+
+    groups = []
+    for group_id in targets:
+        for section, section_groups in sections.items():
+            if group_id in section_groups:
+                html = render_group(group_id, section_groups[group_id], section)
+                groups.append({'group_id': group_id, 'section': section, 'html': html})
+                break
+        else:
+            # 削除された・表示期間を過ぎたグループ
+            groups.append({'group_id': group_id, 'section': None, 'html': ''})
+
+    payload = {
+        'changed': True,
+        'full': full,
+        'revision': revision,
+        'groups': groups,
+        'order': {section: list(section_groups) for section, section_groups in sections.items()},
+        'timestamp': timezone.now().isoformat(),
+    }
+    payload.update(extra or {})
+    return JsonResponse(payload)
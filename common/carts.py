@@ -0,0 +1,122 @@
+"""
+cafeMuji - レジの仮オーダー（カート）
+
+仮オーダーを CartItem テーブルに1行ずつ保存します。
+追加・削除・全削除はそれぞれ1回の INSERT / DELETE で済み、セッションは書き換えません。
+レジ画面は fetch で操作し、cart_response() が返す HTML 断片で一覧を差し替えます。
+"""
+
+from datetime import timedelta
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import redirect
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import CartItem
+
+# アプリごとのレジ画面（JS を使わない操作のリダイレクト先）
+CART_REGISTER_VIEWS = {
+    'ice': 'register_view',
+    'food': 'food_register',
+    'shavedice': 'shavedice_register',
+}
+
+# 注文確定のたびに、これより古い放置カート（ログアウト済みなど）を削除する
+STALE_CART_HOURS = 24
+
+
+class Cart:
+    """セッション・アプリごとの仮オーダー"""
+
+    def __init__(self, request, app_label):
+        self.request = request
+        self.app_label = app_label
+
+    @property
+    def key(self):
+        session = self.request.session
+        if session.session_key is None:
+            # 初回のみセッションを作成し、Cookie を返すようにする
+            session.save()
+            session.modified = True
+        return session.session_key
+
+    def _queryset(self):
+        return CartItem.objects.filter(cart_key=self.key, app_label=self.app_label)
+
+    def items(self):
+        """追加順の行（各 dict に行の id を含む）"""
+        return [
+            {**item.data, 'id': item.id}
+            for item in self._queryset().order_by('id').only('id', 'data')
+        ]
+
+    def add(self, data, count=1):
+        """同じ内容の行を count 行追加する"""
+        key = self.key
+        CartItem.objects.bulk_create(
+            [CartItem(cart_key=key, app_label=self.app_label, data=data) for _ in range(count)]
+        )
+
+    def remove(self, item_id):
+        """指定した行を削除する"""
+        return self._queryset().filter(id=item_id).delete()[0]
+
+    def remove_at(self, index):
+        """追加順で index 番目の行を削除する（旧URLの互換用）"""
+        if index < 0:
+            return 0
+        item_id = self._queryset().order_by('id').values_list('id', flat=True)[index:index + 1].first()
+        return self.remove(item_id) if item_id is not None else 0
+
+    def clear(self, **data_filters):
+        """
+        行を削除する
+
+        Args:
+            **data_filters: 内容で絞り込む条件（例: is_pudding=True）。
+                指定しない場合はカートを空にし、放置された古いカートも削除する
+        """
+        if data_filters:
+            return self._queryset().filter(
+                **{f'data__{field}': value for field, value in data_filters.items()}
+            ).delete()[0]
+        cutoff = timezone.now() - timedelta(hours=STALE_CART_HOURS)
+        return CartItem.objects.filter(
+            Q(cart_key=self.key, app_label=self.app_label) | Q(created_at__lt=cutoff)
+        ).delete()[0]
+
+
+def cart_context(items):
+    """カート断片テンプレート（<app>/_cart.html）に渡す値"""
+    return {
+        'cart_items': items,
+        'pudding_count': sum(1 for item in items if item.get('is_pudding')),
+    }
+
+
+def wants_cart_json(request):
+    return (
+        request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('accept', '')
+    )
+
+
+def cart_response(request, cart):
+    """
+    カート操作の応答
+
+    fetch からの呼び出しには一覧の HTML 断片と件数を JSON で返し、
+    それ以外はレジ画面へリダイレクトする。
+    """
+    if not wants_cart_json(request):
+        return redirect(CART_REGISTER_VIEWS[cart.app_label])
+    items = cart.items()
+    return JsonResponse({
+        'status': 'ok',
+        'count': len(items),
+        'items': items,
+        'html': render_to_string(f'{cart.app_label}/_cart.html', cart_context(items), request=request),
+    })
@@ -0,0 +1,41 @@
+"""
+cafeMuji - 書き込みトランザクションの直列化（SQLite）
+
+SQLite は同時に1つの接続しか書き込めません。runserver などのスレッドごとに
+接続を持つ構成で、レジ2台の注文確定とキッチンの完了が重なると、ロックの
+取り合いで「database is locked」になることがあります。
+
+write_transaction() は、SQLite の LAN 営業設定（settings.SQLITE_LAN_PROFILE）が
+有効なとき、書き込みトランザクションをプロセス内のロックで1つずつ実行します。
+WAL により読み取り（ボードのポーリング）は書き込みを待たず、書き込み同士は
+ロックの順に並ぶため、busy timeout 切れのエラーになりません。
+PostgreSQL などでは transaction.atomic() と同じです。
+
+- 同じスレッドでの入れ子は可能です（RLock）
+- 別プロセスからの書き込みは SQLite の busy timeout で待ちます
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+_write_lock = threading.RLock()
+
+
+def serialized_writes(using=DEFAULT_DB_ALIAS):
+    """書き込みを直列化するか（SQLite かつ LAN 営業設定が有効）"""
+    return settings.SQLITE_LAN_PROFILE and connections[using].vendor == 'sqlite'
+
+
+@contextmanager
+def write_transaction(using=DEFAULT_DB_ALIAS):
+    """書き込みトランザクション（SQLite ではプロセス内で1つずつ実行する）"""
+    if not serialized_writes(using):
+        with transaction.atomic(using=using):
+            yield
+        return
+    with _write_lock:
+        with transaction.atomic(using=using):
+            yield
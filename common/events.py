@@ -0,0 +1,236 @@
+"""
+cafeMuji - 注文イベント配信
+
+注文の作成・完了・状態変更・削除を、ボード画面へ Server-Sent Events で
+即時に届けるためのブローカーを提供します。
+
+- LocalEventBroker: プロセス内のブローカー（単一ノード・gthread ワーカー向け）
+- RedisEventBroker: Redis Streams を使うブローカー（複数ワーカー・複数ノード向け）
+
+使用するブローカーは settings.ORDER_EVENT_BROKER（クラスのドット区切りパス）で切り替えます。
+どちらのブローカーも、同期ワーカー用の listen() と ASGI 用の alisten()（待機中にスレッドを
+使わない）を持ちます。
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import weakref
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('cafeMuji')
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class LocalEventBroker:
+    """
+    プロセス内のイベントブローカー
+
+    直近のイベントをリングバッファに保持し、購読側は最後に受け取った
+    イベントIDより新しいものを待ち受けます。
+    非同期の購読者はイベントループごとに1つの asyncio.Event を共有し、発行時には
+    ループごとに1回だけ起こします（購読者の数だけスレッドやコールバックを使わない）。
+    """
+
+    def __init__(self, history=500):
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._seq = 0
+        # イベントループ -> そのループの非同期購読者が待つ asyncio.Event
+        self._loop_events = weakref.WeakKeyDictionary()
+
+    def publish(self, channel, event):
+        """イベントを発行する"""
+        with self._condition:
+            self._seq += 1
+            self._events.append((str(self._seq), channel, event))
+            self._condition.notify_all()
+            loops = list(self._loop_events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:
+                # 終了したイベントループ
+                with self._condition:
+                    self._loop_events.pop(loop, None)
+
+    def _wake_loop(self, loop):
+        # ループのスレッドで実行される。待機中の購読者をまとめて起こし、次回用に作り直させる
+        with self._condition:
+            waiter = self._loop_events.pop(loop, None)
+        if waiter is not None:
+            waiter.set()
+
+    def latest_id(self, channel):
+        """最新のイベントIDを返す"""
+        with self._condition:
+            return str(self._seq)
+
+    async def alatest_id(self, channel):
+        """latest_id() の非同期版"""
+        return self.latest_id(channel)
+
+    def _last_seq(self, last_id):
+        try:
+            last_seq = int(last_id)
+        except (TypeError, ValueError):
+            return self._seq
+        # 再起動前など別のブローカーで採番されたIDは現在位置として扱う
+        return min(last_seq, self._seq)
+
+    def _collect(self, channel, last_seq):
+        events = [
+            (event_id, event)
+            for event_id, event_channel, event in self._events
+            if int(event_id) > last_seq and event_channel == channel
+        ]
+        return str(max(self._seq, last_seq)), events
+
+    def listen(self, channel, last_id, timeout):
+        """
+        last_id より新しいイベントを最大 timeout 秒待って返す
+
+        Returns:
+            tuple: (次回の last_id, [(イベントID, イベント dict), ...])
+                タイムアウト時はイベントが空リストになる
+        """
+        with self._condition:
+            last_seq = self._last_seq(last_id)
+            self._condition.wait_for(lambda: self._seq > last_seq, timeout=timeout)
+            return self._collect(channel, last_seq)
+
+    async def alisten(self, channel, last_id, timeout):
+        """listen() の非同期版（イベントループ上で待機し、スレッドを使わない）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        with self._condition:
+            last_seq = self._last_seq(last_id)
+        while True:
+            with self._condition:
+                if self._seq > last_seq:
+                    return self._collect(channel, last_seq)
+                waiter = self._loop_events.get(loop)
+                if waiter is None:
+                    waiter = self._loop_events[loop] = asyncio.Event()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                with self._condition:
+                    return self._collect(channel, last_seq)
+            try:
+                await asyncio.wait_for(waiter.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+class RedisEventBroker:
+    """
+    Redis Streams を使うイベントブローカー
+
+    複数の gunicorn ワーカーやノードから同じストリームを読むため、
+    どのプロセスで発行したイベントも全ての購読者に届きます。
+    """
+
+    def __init__(self, url=None, max_length=1000):
+        import redis
+
+        self._url = url or settings.ORDER_EVENT_REDIS_URL
+        self._client = redis.Redis.from_url(self._url)
+        self._max_length = max_length
+        # redis.asyncio の接続はイベントループに結び付くため、ループごとに作る
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_client(self):
+        import redis.asyncio
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = redis.asyncio.Redis.from_url(self._url)
+        return client
+
+    @staticmethod
+    def _key(channel):
+        return f"cafemuji:order-events:{channel}"
+
+    def publish(self, channel, event):
+        self._client.xadd(
+            self._key(channel),
+            {'data': json.dumps(event)},
+            maxlen=self._max_length,
+            approximate=True,
+        )
+
+    @staticmethod
+    def _latest(entries):
+        if not entries:
+            return '0-0'
+        event_id = entries[0][0]
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+    @staticmethod
+    def _block_ms(timeout):
+        # XREAD の BLOCK 0 は無期限の待機になるため、最短でも1ミリ秒待つ
+        return max(int(timeout * 1000), 1)
+
+    def latest_id(self, channel):
+        return self._latest(self._client.xrevrange(self._key(channel), count=1))
+
+    async def alatest_id(self, channel):
+        return self._latest(await self._async_client().xrevrange(self._key(channel), count=1))
+
+    def listen(self, channel, last_id, timeout):
+        last_id = last_id or self.latest_id(channel)
+        response = self._client.xread(
+            {self._key(channel): last_id},
+            block=self._block_ms(timeout),
+        )
+        return self._entries(response, last_id)
+
+    async def alisten(self, channel, last_id, timeout):
+        """listen() の非同期版（redis.asyncio の XREAD BLOCK で待機する）"""
+        last_id = last_id or await self.alatest_id(channel)
+        response = await self._async_client().xread(
+            {self._key(channel): last_id},
+            block=self._block_ms(timeout),
+        )
+        return self._entries(response, last_id)
+
+    @staticmethod
+    def _entries(response, last_id):
+        events = []
+        for _, entries in response or []:
+            for event_id, fields in entries:
+                if isinstance(event_id, bytes):
+                    event_id = event_id.decode()
+                data = fields.get(b'data') or fields.get('data')
+                events.append((event_id, json.loads(data)))
+                last_id = event_id
+        return last_id, events
+
+
+def get_broker():
+    """設定されたブローカーのインスタンス（プロセス内で共有）を返す"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(settings.ORDER_EVENT_BROKER)
+                _broker = broker_class()
+    return _broker
+
+
+def publish_order_event(app_label, event_type, group_id=None):
+    """注文イベントを発行する（発行失敗はボード更新を妨げない）"""
+    event = {'app': app_label, 'type': event_type}
+    if group_id:
+        event['group_id'] = group_id
+    try:
+        get_broker().publish(app_label, event)
+    except Exception:
+        logger.exception("Failed to publish order event: %s", event)
@@ -0,0 +1,150 @@
+"""
+cafeMuji - フロア全体の状況
+
+アイス・フード・かき氷の3ステーションの未完了グループ・件数・待ち時間の見積もり
+（common.service_times）を1回の問い合わせでまとめて返します
+（マネージャー用のフロア画面・API が使用）。
+
+- リビジョンは get_revisions() の1クエリでまとめて読みます。
+- グループの集計は各アプリのキッチン画面と同じ live_board() のキャッシュを共有するため、
+  追加のクエリはリビジョンが進んだステーションの分（最大3回）だけです。
+- 未完了件数だけが必要なヘルスチェック向けに、UNION 1回で数える pending_counts() を提供します。
+- 非同期ビュー（ASGI）向けに afloor_status() / apending_counts() を提供します。
+"""
+
+from django.db.models import CharField, Count, Value
+
+from food.models import FoodOrder
+from ice.models import Order
+from shavedice.models import ShavedIceOrder
+
+from .board import alive_board, live_board
+from .revisions import BOARD_APPS, aget_revisions, combined_revision, get_revisions
+from .service_times import aestimate_wait, estimate_wait
+
+# ステーションごとのモデル・表示名
+STATIONS = {
+    'ice': {'model': Order, 'name': 'アイスクリーム'},
+    'food': {'model': FoodOrder, 'name': 'フード'},
+    'shavedice': {'model': ShavedIceOrder, 'name': 'かき氷'},
+}
+
+
+def _status_values(model):
+    """ボードに表示する未完了グループの状態値一覧（live_group_filter() が OrderGroup の状態で絞り込む）"""
+    choices = model._meta.get_field('status').choices
+    return [value for value, _ in choices] if choices else None
+
+
+def _group_payload(group):
+    return {
+        'group_id': group.group_id,
+        'clip_color': group.clip_color,
+        'clip_number': group.clip_number,
+        'status': group.status,
+        'note': group.note or '',
+        'open_count': group.open_count,
+        'open_quantity': group.open_quantity,
+        'elapsed_minutes': group.elapsed_minutes,
+    }
+
+
+def station_status(app_label, revision, now):
+    """1ステーション分の状況（live_board のキャッシュから作る）"""
+    model = STATIONS[app_label]['model']
+    active_groups, _ = live_board(model, revision, now, status_values=_status_values(model))
+    estimate = estimate_wait(app_label, revision, active_groups)
+    return _station_payload(app_label, revision, active_groups, estimate)
+
+
+async def astation_status(app_label, revision, now):
+    """station_status() の非同期版"""
+    model = STATIONS[app_label]['model']
+    active_groups, _ = await alive_board(model, revision, now, status_values=_status_values(model))
+    estimate = await aestimate_wait(app_label, revision, active_groups)
+    return _station_payload(app_label, revision, active_groups, estimate)
+
+
+def _station_payload(app_label, revision, active_groups, estimate):
+    station = STATIONS[app_label]
+    open_items = estimate['open_items']
+    return {
+        'app_label': app_label,
+        'name': station['name'],
+        'revision': revision,
+        'active_count': len(active_groups),
+        'open_items': open_items,
+        'stop_count': sum(1 for group in active_groups if group.status == 'stop'),
+        'wait_minutes': estimate['wait_minutes'],
+        'oldest_elapsed_minutes': max((group.elapsed_minutes for group in active_groups), default=0),
+        'groups': [_group_payload(group) for group in active_groups],
+    }
+
+
+def floor_status(now, revisions=None):
+    """
+    3ステーションの状況をまとめて返す
+
+    Args:
+        now: 経過時間の基準時刻
+        revisions: 読み込み済みのリビジョン（省略時は get_revisions() で1クエリ）
+
+    Returns:
+        dict: ステーションごとの状況と合計
+    """
+    if revisions is None:
+        revisions = get_revisions()
+    stations = [station_status(label, revisions[label], now) for label in BOARD_APPS]
+    return _floor_payload(revisions, stations)
+
+
+async def afloor_status(now, revisions=None):
+    """floor_status() の非同期版"""
+    if revisions is None:
+        revisions = await aget_revisions()
+    stations = [await astation_status(label, revisions[label], now) for label in BOARD_APPS]
+    return _floor_payload(revisions, stations)
+
+
+def _floor_payload(revisions, stations):
+    return {
+        'revision': combined_revision(revisions),
+        'revisions': revisions,
+        'stations': stations,
+        'active_count': sum(s['active_count'] for s in stations),
+        'open_items': sum(s['open_items'] for s in stations),
+    }
+
+
+def pending_counts():
+    """
+    ステーションごとの未完了注文数を UNION 1回で数える
+
+    Returns:
+        dict: app_label → 未完了注文数（'total' に合計）
+    """
+    counts = dict.fromkeys(BOARD_APPS, 0)
+    counts.update(_pending_count_query())
+    counts['total'] = sum(counts[label] for label in BOARD_APPS)
+    return counts
+
+
+async def apending_counts():
+    """pending_counts() の非同期版"""
+    counts = dict.fromkeys(BOARD_APPS, 0)
+    counts.update([row async for row in _pending_count_query()])
+    counts['total'] = sum(counts[label] for label in BOARD_APPS)
+    return counts
+
+
+def _pending_count_query():
+    querysets = [
+        STATIONS[label]['model'].objects.filter(is_completed=False)
+        .annotate(station=Value(label, output_field=CharField()))
+        .values('station')
+        .annotate(count=Count('id'))
+        .values_list('station', 'count')
+        .order_by()
+        for label in BOARD_APPS
+    ]
+    return querysets[0].union(*querysets[1:], all=True)
@@ -0,0 +1,240 @@
+"""
+cafeMuji - 注文グループ（OrderGroup）の同期
+
+注文の各行に group_id の文字列を持たせるだけでは、グループの状態（未完了か・
+いつ完了したか・STOP か）を知るたびに所属する全行を読む必要があります。
+グループごとに1行の OrderGroup を持ち、注文の書き込みと同じトランザクションで更新します。
+
+- 受付: submit_order_group() から record_group_created()（INSERT 1回、同じグループへの追加は UPDATE 1文）
+- 完了: complete_group() / complete_orders() から record_group_completed()（グループごとに UPDATE 1文）
+- 状態変更: update_group_status() / update_groups_status() から record_group_status()（UPDATE 1文）
+- 1件ずつの保存・削除（API・管理画面・complete_order()）: シグナルから sync_groups() で数え直す
+- アーカイブ: archive_orders() から delete_groups()
+
+ボードの対象グループの絞り込み（live_group_filter()）と STOP の判定（has_open_stop()）は
+この表だけを読みます。ずれたときは sync_groups() で注文から作り直せます。
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, Min, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_save
+
+from .models import OrderGroup
+
+# 数え直しで更新する列
+SYNC_FIELDS = (
+    'clip_color', 'clip_number', 'status', 'item_count', 'quantity', 'pudding_count',
+    'completed_count', 'is_completed', 'first_timestamp', 'completed_at',
+)
+
+
+def _has_field(model, name):
+    return any(field.name == name for field in model._meta.concrete_fields)
+
+
+def _units(order):
+    return getattr(order, 'quantity', 1) or 1
+
+
+def _groups(model):
+    return OrderGroup.objects.filter(app_label=model._meta.app_label)
+
+
+def record_group_created(orders):
+    """
+    同じグループとして受け付けた注文をグループに加える
+
+    新しいグループは INSERT 1回、既存のグループ（同じ group_id への追加）は
+    件数を F() で加算する UPDATE 1文です。
+    """
+    if not orders:
+        return
+    first = orders[0]
+    model = type(first)
+    amounts = {
+        'item_count': len(orders),
+        'quantity': sum(_units(order) for order in orders),
+        'pudding_count': sum(1 for order in orders if getattr(order, 'is_pudding', False)),
+    }
+    rows = _groups(model).filter(group_id=first.group_id)
+    changes = {name: F(name) + value for name, value in amounts.items()}
+    if rows.update(is_completed=False, **changes):
+        return
+    try:
+        with transaction.atomic():
+            OrderGroup.objects.create(
+                app_label=model._meta.app_label,
+                group_id=first.group_id,
+                clip_color=first.clip_color or '',
+                clip_number=first.clip_number or 0,
+                status=first.status,
+                first_timestamp=min(order.timestamp for order in orders),
+                **amounts,
+            )
+    except IntegrityError:
+        # 同時に同じグループIDの受付が行を作成した
+        rows.update(is_completed=False, **changes)
+
+
+def record_group_completed(orders, completed_at, status=None):
+    """
+    完了にした注文の件数をグループの完了数に加える
+
+    完了数が注文件数に達したグループは is_completed を立てます（同じ UPDATE 文の中で判定）。
+
+    Args:
+        orders: 完了にした注文インスタンス
+        completed_at: 完了時刻
+        status: 完了と同時に変更した状態（アイスの 'hold' など）
+    """
+    if not orders:
+        return
+    model = type(orders[0])
+    extra = {'status': status} if status else {}
+    for group_id, count in Counter(order.group_id for order in orders).items():
+        _groups(model).filter(group_id=group_id).update(
+            completed_count=F('completed_count') + count,
+            completed_at=completed_at,
+            is_completed=Case(
+                When(item_count__lte=F('completed_count') + count, then=Value(True)),
+                default=Value(False),
+            ),
+            **extra,
+        )
+
+
+def record_group_status(model, group_ids, status):
+    """グループの状態を UPDATE 1文で変更する"""
+    return _groups(model).filter(group_id__in=list(group_ids)).update(status=status)
+
+
+def delete_groups(model, group_ids):
+    """グループの行を削除する（アーカイブで注文を移したとき）"""
+    return _groups(model).filter(group_id__in=list(group_ids)).delete()[0]
+
+
+def sync_groups(model, group_ids):
+    """
+    注文を数え直してグループの行を作り直す
+
+    グループごとの集計を GROUP BY 1回で読み、まとめて upsert します。
+    注文が残っていないグループの行は削除します。
+
+    Args:
+        model: 注文モデル
+        group_ids: 対象グループIDのリスト（None のときは全グループ）
+
+    Returns:
+        int: 作成・更新したグループ数
+    """
+    rows = model.objects.order_by()
+    if group_ids is not None:
+        group_ids = list(set(group_ids))
+        if not group_ids:
+            return 0
+        rows = rows.filter(group_id__in=group_ids)
+
+    open_rows = Q(is_completed=False)
+    summary = rows.values('group_id').annotate(
+        clip_color=Min('clip_color'),
+        clip_number=Min('clip_number'),
+        open_status=Max('status', filter=open_rows),
+        last_status=Max('status'),
+        item_count=Count('id'),
+        quantity=Sum('quantity') if _has_field(model, 'quantity') else Count('id'),
+        pudding_count=(
+            Count('id', filter=Q(is_pudding=True)) if _has_field(model, 'is_pudding') else Value(0)
+        ),
+        completed_count=Count('id', filter=Q(is_completed=True)),
+        first_timestamp=Min('timestamp'),
+        completed_at=Max('completed_at'),
+    )
+    app_label = model._meta.app_label
+    groups = [
+        OrderGroup(
+            app_label=app_label,
+            group_id=row['group_id'],
+            clip_color=row['clip_color'] or '',
+            clip_number=row['clip_number'] or 0,
+            # 状態は未完了の注文のもの（すべて完了済みなら最後に設定されたもの）
+            status=row['open_status'] or row['last_status'],
+            item_count=row['item_count'],
+            quantity=row['quantity'] or 0,
+            pudding_count=row['pudding_count'],
+            completed_count=row['completed_count'],
+            is_completed=row['completed_count'] >= row['item_count'],
+            first_timestamp=row['first_timestamp'],
+            completed_at=row['completed_at'],
+        )
+        for row in summary
+    ]
+
+    with transaction.atomic():
+        if groups:
+            OrderGroup.objects.bulk_create(
+                groups, batch_size=500, update_conflicts=True,
+                unique_fields=['app_label', 'group_id'], update_fields=list(SYNC_FIELDS),
+            )
+        stale = _groups(model).exclude(group_id__in=[group.group_id for group in groups])
+        if group_ids is not None:
+            stale = stale.filter(group_id__in=group_ids)
+        stale.delete()
+    return len(groups)
+
+
+def live_group_filter(model, now, completed_seconds, status_values=None):
+    """
+    ボードに表示するグループ（未完了のグループと、直近に完了したグループ）の注文を選ぶ条件
+
+    OrderGroup を未完了 (app_label, is_completed) と直近完了 (app_label, completed_at) の
+    2つのサブクエリで引きます（1つの OR にするとどちらのインデックスも範囲で使えず、
+    アプリの全グループを走査するため）。どちらも1グループ1行だけを読みます。
+
+    Args:
+        model: 注文モデル
+        now: 判定の基準時刻
+        completed_seconds: 完了済みグループを表示しておく秒数
+        status_values: 指定時は未完了グループをこの状態に限る
+
+    Returns:
+        Q: 注文モデルの group_id に対する条件
+    """
+    open_groups = _groups(model).filter(is_completed=False)
+    if status_values:
+        open_groups = open_groups.filter(status__in=list(status_values))
+    recent_groups = _groups(model).filter(
+        completed_at__gte=now - timedelta(seconds=completed_seconds)
+    )
+    return (
+        Q(group_id__in=open_groups.values('group_id'))
+        | Q(group_id__in=recent_groups.values('group_id'))
+    )
+
+
+def has_open_stop(model):
+    """STOP 中の未完了グループがあるか"""
+    return _groups(model).filter(is_completed=False, status='stop').exists()
+
+
+def _saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_groups(sender, [instance.group_id])
+
+
+def _deleted(sender, instance, **kwargs):
+    sync_groups(sender, [instance.group_id])
+
+
+def connect_signals():
+    """1件ずつ保存・削除される注文（API・管理画面など）をグループに反映する"""
+    from food.models import FoodOrder
+    from ice.models import Order
+    from shavedice.models import ShavedIceOrder
+
+    for model in (Order, FoodOrder, ShavedIceOrder):
+        label = model._meta.label
+        post_save.connect(_saved, sender=model, dispatch_uid=f'order_group_save_{label}')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'order_group_delete_{label}')
@@ -0,0 +1,134 @@
+"""
+cafeMuji - 注文の確定の冪等キー
+
+レジのタブレットの Wi-Fi が確定（submit_order_group）の送信中に切れると、
+スタッフがもう一度押して同じカートが2グループ登録されることがありました。
+確定に冪等キーを付けると、同じキーの2回目以降は何も登録せず、最初に登録した
+注文を結果として返します（INSERT は発生しません）。
+
+- キーはリクエストの Idempotency-Key ヘッダー、またはフォームの idempotency_key
+  フィールドで受け取ります（レジ画面はページを表示するたびに新しいキーを埋め込みます）。
+- キーと登録した注文IDは IdempotencyKey に、注文と同じトランザクションで記録します。
+  同じキーの確定が同時に届いた場合は、後から記録しようとした側の登録を取り消して
+  先に記録された結果を返します（(app_label, key) の一意制約）。
+- キーは settings.IDEMPOTENCY_KEY_SECONDS（既定24時間）だけ有効です。
+  古い行は PRUNE_INTERVAL 件の記録ごとにまとめて削除します。
+"""
+
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .db_writer import write_transaction
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+
+# 受け付けるキー（英数字・ハイフン・アンダースコアの64文字以内。UUID をそのまま使える）
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# この件数の記録ごとに期限切れのキーを削除する
+PRUNE_INTERVAL = 100
+
+
+def new_idempotency_key():
+    """レジ画面に埋め込む新しいキー"""
+    return uuid.uuid4().hex
+
+
+def request_key(request):
+    """
+    リクエストの冪等キー
+
+    Returns:
+        str | None: キー（指定がない・形式が正しくない場合は None）
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None and request.method == 'POST':
+        key = request.POST.get(IDEMPOTENCY_FIELD)
+    key = (key or '').strip()
+    return key if KEY_PATTERN.match(key) else None
+
+
+def invalid_key(request):
+    """Idempotency-Key ヘッダーが指定されているが形式が正しくないか（API の 400 用）"""
+    return IDEMPOTENCY_HEADER in request.headers and request_key(request) is None
+
+
+def _expires_before():
+    return timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_SECONDS)
+
+
+def recorded_submission(app_label, key):
+    """
+    記録済みのキーの結果
+
+    期限切れのキーは削除し、未記録として扱います。
+
+    Returns:
+        IdempotencyKey | None
+    """
+    entry = IdempotencyKey.objects.filter(app_label=app_label, key=key).first()
+    if entry is not None and entry.created_at < _expires_before():
+        entry.delete()
+        return None
+    return entry
+
+
+def replayed_submission(request, app_label):
+    """リクエストが記録済みのキーを持つ再送か（レジ画面のカートが空でも成功として扱う）"""
+    key = request_key(request)
+    return key is not None and recorded_submission(app_label, key) is not None
+
+
+def _recorded_orders(model, entry):
+    return list(model.objects.filter(id__in=entry.order_ids).order_by('id'))
+
+
+def submit_once(model, key, submit):
+    """
+    キーが未記録なら submit() で登録してキーを記録し、記録済みなら以前の注文を返す
+
+    Args:
+        model: 注文モデル
+        key: 冪等キー（None のときは記録せずに submit() だけを実行する）
+        submit: 注文を登録して注文インスタンスのリストを返す関数
+            （write_transaction の中で呼ばれる）
+
+    Returns:
+        tuple: (注文インスタンスのリスト, 再送として以前の結果を返した場合 True)
+    """
+    if key is None:
+        # キーがなくても1トランザクション（SQLite では書き込みの列）で登録する
+        with write_transaction():
+            return submit(), False
+
+    app_label = model._meta.app_label
+    entry = recorded_submission(app_label, key)
+    if entry is not None:
+        return _recorded_orders(model, entry), True
+
+    try:
+        with write_transaction():
+            orders = submit()
+            entry = IdempotencyKey.objects.create(
+                app_label=app_label,
+                key=key,
+                group_id=orders[0].group_id if orders else '',
+                order_ids=[order.pk for order in orders],
+            )
+    except IntegrityError:
+        # 同じキーの確定が同時に記録された（こちらの登録はロールバック済み）
+        entry = recorded_submission(app_label, key)
+        if entry is None:
+            raise
+        return _recorded_orders(model, entry), True
+
+    if entry.pk % PRUNE_INTERVAL == 0:
+        IdempotencyKey.objects.filter(created_at__lt=_expires_before()).delete()
+    return orders, False
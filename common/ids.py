@@ -0,0 +1,180 @@
+"""
+cafeMuji - 注文グループIDの採番
+
+グループIDは以前、アイス・かき氷・モバイルでは「クリップ色-番号-ミリ秒」、
+フードでは秒単位の時刻で作っていたため、同じ秒（ミリ秒）に2台のレジから確定すると
+同じIDになり、別々の注文が1つのグループにまとまっていました。
+また長い文字列の先頭がクリップ色でばらつくため、group_id のインデックスも大きくなります。
+
+snowflake 方式の64ビット整数で採番し、URL にそのまま使える13文字の文字列にして使います。
+
+ビット構成（63ビット、正の BIGINT に収まる）:
+    41ビット: EPOCH_MS（2025-01-01 0:00 JST）からのミリ秒（約69年）
+     5ビット: ノードID（settings.ID_NODE_ID、0〜31。サーバー・ノートPCごとに変える）
+     5ビット: プロセススロット（同じノードのプロセスごとに 0〜31）
+    12ビット: 同じミリ秒内の連番（1ミリ秒に4096件まで）
+
+- プロセススロットは ID_LOCK_DIR のロックファイルを flock で確保し、プロセスが
+  終了するまで保持します（gunicorn のワーカーが再起動しても重複しません）。
+  flock が使えない環境（Windows）ではプロセスIDから決めます。
+- 同じプロセス内ではロックで直列化し、値は単調に増えます。時計が戻った場合や
+  1ミリ秒の連番を使い切った場合は、前回の時刻を1ミリ秒ずつ進めて採番を続けます。
+- 文字列は Crockford Base32（小文字）の固定13文字です。文字列の並び順が数値の順と
+  一致するため、group_id のインデックスには常に末尾から追加されます。
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# 採番の基準時刻（2025-01-01 00:00:00+09:00 のミリ秒）
+EPOCH_MS = 1735657200000
+
+NODE_BITS = 5
+SLOT_BITS = 5
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SLOT = (1 << SLOT_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford Base32（I・L・O・U を除く）。ASCII 順に並んでいる
+ALPHABET = '0123456789abcdefghjkmnpqrstvwxyz'
+ENCODED_LENGTH = 13
+_DECODE = {char: index for index, char in enumerate(ALPHABET)}
+
+
+def encode(value):
+    """64ビットの ID を固定13文字の文字列にする"""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    """encode() の文字列を ID に戻す（不正な文字列は ValueError）"""
+    if len(text) != ENCODED_LENGTH:
+        raise ValueError(f'ID は{ENCODED_LENGTH}文字です: {text!r}')
+    value = 0
+    for char in text.lower():
+        if char not in _DECODE:
+            raise ValueError(f'ID に使えない文字です: {text!r}')
+        value = value * 32 + _DECODE[char]
+    return value
+
+
+def id_timestamp_ms(value):
+    """ID を採番した時刻（UNIX 時刻のミリ秒）"""
+    return (value >> (NODE_BITS + SLOT_BITS + SEQUENCE_BITS)) + EPOCH_MS
+
+
+class SnowflakeGenerator:
+    """
+    1プロセス分の採番器
+
+    Args:
+        node_id: ノードID（0〜31）
+        slot: プロセススロット（0〜31）
+        clock: 現在時刻（秒）を返す関数
+    """
+
+    def __init__(self, node_id, slot, clock=time.time):
+        if not 0 <= node_id <= MAX_NODE:
+            raise ImproperlyConfigured(f'ID_NODE_ID は 0〜{MAX_NODE} で指定してください')
+        if not 0 <= slot <= MAX_SLOT:
+            raise ValueError(f'プロセススロットは 0〜{MAX_SLOT} です')
+        self.worker_bits = (node_id << SLOT_BITS | slot) << SEQUENCE_BITS
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self):
+        """次の ID を返す（同じプロセス内では単調増加）"""
+        with self._lock:
+            now_ms = int(self.clock() * 1000)
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                # 同じミリ秒（または時計が戻った）: 前回の時刻のまま連番を進める
+                self._sequence += 1
+            else:
+                self._last_ms += 1
+                self._sequence = 0
+            return (self._last_ms - EPOCH_MS) << (NODE_BITS + SLOT_BITS + SEQUENCE_BITS) \
+                | self.worker_bits | self._sequence
+
+
+def _claim_slot(node_id):
+    """
+    このプロセスのスロットを確保する
+
+    Returns:
+        tuple: (スロット, ロックを保持するファイル。flock が使えない場合は None)
+    """
+    if fcntl is None:
+        return os.getpid() % (MAX_SLOT + 1), None
+    directory = settings.ID_LOCK_DIR or os.path.join(tempfile.gettempdir(), 'cafemuji-ids')
+    os.makedirs(directory, exist_ok=True)
+    for slot in range(MAX_SLOT + 1):
+        handle = open(os.path.join(directory, f'{node_id}-{slot}.lock'), 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        return slot, handle
+    raise ImproperlyConfigured(
+        f'ノード {node_id} のプロセススロット（{MAX_SLOT + 1}個）がすべて使用中です'
+    )
+
+
+_generator = None
+_slot_handle = None
+_setup_lock = threading.Lock()
+
+
+def get_generator():
+    """このプロセスの採番器（初回にスロットを確保する）"""
+    global _generator, _slot_handle
+    if _generator is None:
+        with _setup_lock:
+            if _generator is None:
+                slot, _slot_handle = _claim_slot(settings.ID_NODE_ID)
+                _generator = SnowflakeGenerator(settings.ID_NODE_ID, slot)
+    return _generator
+
+
+def _reset_after_fork():
+    # 親プロセスのスロットを引き継がないよう、子プロセスでは確保し直す
+    global _generator, _slot_handle, _setup_lock
+    if _slot_handle is not None:
+        _slot_handle.close()
+    _generator = None
+    _slot_handle = None
+    _setup_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def new_id():
+    """64ビットの ID を採番する"""
+    return get_generator().next_id()
+
+
+def new_group_id():
+    """注文グループID（13文字の文字列）を採番する"""
+    return encode(new_id())
@@ -0,0 +1,46 @@
+"""
+前日以前に完了した注文をアーカイブテーブルへ移すコマンド
+
+営業終了後（毎晩）に実行し、注文テーブルを当日の注文だけの大きさに保ちます。
+
+実行例:
+    python manage.py archive_orders                      # 今日より前に完了した注文を移す
+    python manage.py archive_orders --before 2026-08-01  # 指定日より前に完了した注文を移す
+    python manage.py archive_orders --dry-run            # 件数の確認だけ
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from common.archive import archive_orders, batch_size, business_day_start
+from food.models import FoodOrder
+from ice.models import Order
+from shavedice.models import ShavedIceOrder
+
+
+class Command(BaseCommand):
+    help = '前日以前に完了した注文をアーカイブテーブルへ移します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='この日（YYYY-MM-DD）より前に完了した注文を移す（既定: 今日）')
+        parser.add_argument('--batch-groups', type=int,
+                            help='1トランザクションで移すグループ数（既定: ARCHIVE_BATCH_GROUPS、上限 ARCHIVE_MAX_BATCH_GROUPS）')
+        parser.add_argument('--dry-run', action='store_true', help='移さずに件数だけ表示する')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['before']) if options['before'] else None
+        except ValueError:
+            raise CommandError('--before は YYYY-MM-DD で指定してください')
+        cutoff = business_day_start(day)
+        batch_groups = batch_size(options['batch_groups'])
+        if options['batch_groups'] and batch_groups != options['batch_groups']:
+            self.stdout.write(f"--batch-groups は {batch_groups} に抑えました")
+
+        for model in (Order, FoodOrder, ShavedIceOrder):
+            count = archive_orders(
+                model, cutoff, batch_groups=batch_groups, dry_run=options['dry_run'],
+            )
+            verb = '対象' if options['dry_run'] else '移動'
+            self.stdout.write(f"{model._meta.app_label}: {count} 件{verb}（{cutoff:%Y-%m-%d %H:%M} より前）")
@@ -0,0 +1,60 @@
+"""
+注文の集計（OrderRollup）を注文テーブルとアーカイブから作り直すコマンド
+
+導入前の注文を集計に含めるときや、集計がずれたときに実行します。
+指定した期間の集計行を削除してから作り直すため、何度実行しても同じ結果になります。
+
+実行例:
+    python manage.py backfill_rollups                                   # 全期間
+    python manage.py backfill_rollups --from 2026-08-01 --to 2026-08-31
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from common.models import ArchivedOrder
+from common.rollups import rebuild_rollups
+from food.models import FoodOrder
+from ice.models import Order
+from shavedice.models import ShavedIceOrder
+
+
+def _parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'{name} は YYYY-MM-DD で指定してください')
+
+
+class Command(BaseCommand):
+    help = '注文の集計を注文テーブルとアーカイブから作り直します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='開始日（YYYY-MM-DD、既定: 最も古い注文の日）')
+        parser.add_argument('--to', dest='end', help='終了日（YYYY-MM-DD、既定: 今日）')
+
+    def handle(self, *args, **options):
+        end_day = _parse_day(options['end'], '--to') if options['end'] else timezone.localdate()
+
+        for model in (Order, FoodOrder, ShavedIceOrder):
+            if options['start']:
+                start_day = _parse_day(options['start'], '--from')
+            else:
+                start_day = self._first_day(model) or end_day
+            if start_day > end_day:
+                raise CommandError('--from は --to 以前の日付を指定してください')
+            count = rebuild_rollups(model, start_day, end_day)
+            self.stdout.write(f"{model._meta.app_label}: {start_day}〜{end_day} の集計 {count} 行を作成")
+
+    def _first_day(self, model):
+        """注文テーブルとアーカイブで最も古い受付日"""
+        candidates = [
+            model.objects.aggregate(first=Min('timestamp'))['first'],
+            ArchivedOrder.objects.filter(app_label=model._meta.app_label)
+            .aggregate(first=Min('timestamp'))['first'],
+        ]
+        candidates = [c for c in candidates if c]
+        return timezone.localtime(min(candidates)).date() if candidates else None
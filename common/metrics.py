@@ -0,0 +1,207 @@
+"""
+cafeMuji - リクエスト計測値の集計
+
+RequestMetricsMiddleware が記録したビューごとの処理時間・クエリ数・DB時間・
+レスポンスサイズをプロセス内に保持し、Prometheus のテキスト形式で出力します。
+
+- ヒストグラム・カウンタ: プロセス起動からの累積値（Prometheus の rate() で使う）
+- ウィンドウ値: 直近 METRICS_WINDOW_SECONDS 秒の合計。ラッシュ中にどのポーリングが
+  DB 時間を占めているかを Prometheus なしでも確認できる
+- 接続プール: DB_POOL=psycopg のとき、プールの大きさと接続の貸し出し待ちを出力する
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# ウィンドウ値を集計する単位（秒）
+WINDOW_SLOT_SECONDS = 10
+
+
+class Histogram:
+    """累積バケットのヒストグラム（ラベルの組ごと）"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, count, total) in sorted(self._series.items()):
+            base = _format_labels(label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound:g}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{base}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """プロセス内のリクエスト計測値"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.duration = Histogram(
+                'cafemuji_request_duration_seconds', 'ビューの処理時間（秒）', DURATION_BUCKETS)
+            self.db_time = Histogram(
+                'cafemuji_request_db_seconds', '1リクエストあたりの DB 時間（秒）', DURATION_BUCKETS)
+            self.queries = Histogram(
+                'cafemuji_request_db_queries', '1リクエストあたりのクエリ数', QUERY_BUCKETS)
+            self.size = Histogram(
+                'cafemuji_response_size_bytes', 'レスポンス本文のサイズ（バイト）', SIZE_BUCKETS)
+            self.requests = defaultdict(int)
+            self.window = deque()
+
+    def record(self, view, method, status, duration, db_time, queries, size=None):
+        """1リクエスト分の計測値を記録する"""
+        slot = int(time.time() // WINDOW_SLOT_SECONDS)
+        with self._lock:
+            self.duration.observe((view, method), duration)
+            self.db_time.observe((view,), db_time)
+            self.queries.observe((view,), queries)
+            if size is not None:
+                self.size.observe((view,), size)
+            self.requests[(view, method, str(status))] += 1
+
+            if not self.window or self.window[-1][0] != slot:
+                self.window.append((slot, defaultdict(lambda: [0, 0.0, 0.0, 0])))
+            totals = self.window[-1][1][view]
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += db_time
+            totals[3] += queries
+
+    def window_totals(self):
+        """
+        直近 METRICS_WINDOW_SECONDS 秒のビューごとの合計
+
+        Returns:
+            dict: view → [リクエスト数, 処理時間, DB時間, クエリ数]
+        """
+        oldest = int((time.time() - settings.METRICS_WINDOW_SECONDS) // WINDOW_SLOT_SECONDS)
+        totals = defaultdict(lambda: [0, 0.0, 0.0, 0])
+        with self._lock:
+            while self.window and self.window[0][0] <= oldest:
+                self.window.popleft()
+            for _, views in self.window:
+                for view, values in views.items():
+                    for index, value in enumerate(values):
+                        totals[view][index] += value
+        return totals
+
+    def render(self):
+        """Prometheus のテキスト形式で出力する"""
+        window = self.window_totals()
+        with self._lock:
+            lines = [
+                '# HELP cafemuji_requests_total 処理したリクエスト数',
+                '# TYPE cafemuji_requests_total counter',
+            ]
+            for labels, count in sorted(self.requests.items()):
+                lines.append(
+                    f"cafemuji_requests_total{{{_format_labels(('view', 'method', 'status'), labels)}}} {count}"
+                )
+            lines += self.duration.render(('view', 'method'))
+            lines += self.db_time.render(('view',))
+            lines += self.queries.render(('view',))
+            lines += self.size.render(('view',))
+
+        seconds = settings.METRICS_WINDOW_SECONDS
+        gauges = (
+            ('cafemuji_window_requests', f'直近{seconds}秒のリクエスト数', 0, '{:d}'),
+            ('cafemuji_window_duration_seconds', f'直近{seconds}秒の処理時間の合計（秒）', 1, '{:.6f}'),
+            ('cafemuji_window_db_seconds', f'直近{seconds}秒の DB 時間の合計（秒）', 2, '{:.6f}'),
+            ('cafemuji_window_db_queries', f'直近{seconds}秒のクエリ数の合計', 3, '{:d}'),
+        )
+        for name, help_text, index, value_format in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for view, values in sorted(window.items()):
+                lines.append(f"{name}{{{_format_labels(('view',), (view,))}}} {value_format.format(values[index])}")
+        return "\n".join(lines) + "\n"
+
+
+# 接続プールの統計（psycopg_pool の get_stats() のキー）と出力名
+POOL_GAUGES = (
+    ('pool_size', 'cafemuji_db_pool_connections', 'プールが保持している接続数'),
+    ('pool_available', 'cafemuji_db_pool_available', '貸し出せる空き接続数'),
+    ('pool_max', 'cafemuji_db_pool_max', 'プールの最大接続数'),
+    ('requests_waiting', 'cafemuji_db_pool_requests_waiting', '接続の空きを待っているリクエスト数'),
+)
+POOL_COUNTERS = (
+    ('requests_num', 'cafemuji_db_pool_requests_total', '接続の貸し出し回数', 1),
+    ('requests_queued', 'cafemuji_db_pool_requests_queued_total', '空きを待った貸し出し回数', 1),
+    ('requests_wait_ms', 'cafemuji_db_pool_wait_seconds_total', '貸し出しの待ち時間の合計（秒）', 1000),
+    ('requests_errors', 'cafemuji_db_pool_timeouts_total', '待ち時間切れ・エラーで貸し出せなかった回数', 1),
+    ('connections_lost', 'cafemuji_db_pool_connections_lost_total', '死活確認で破棄した接続数', 1),
+)
+
+
+def pool_stats_lines(stats_by_alias):
+    """
+    接続プールの統計を Prometheus のテキスト形式の行にする
+
+    Args:
+        stats_by_alias: データベース別名 → ConnectionPool.get_stats() の dict
+    """
+    lines = []
+    for key, name, help_text in POOL_GAUGES:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for alias, stats in sorted(stats_by_alias.items()):
+            lines.append(f"{name}{{{_format_labels(('database',), (alias,))}}} {stats.get(key, 0)}")
+    for key, name, help_text, divisor in POOL_COUNTERS:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for alias, stats in sorted(stats_by_alias.items()):
+            value = stats.get(key, 0) / divisor
+            lines.append(f"{name}{{{_format_labels(('database',), (alias,))}}} {value:g}")
+    return lines
+
+
+def render_pool_stats():
+    """接続プールを使うデータベースの統計（プールを使っていなければ空文字列）"""
+    from django.db import connections
+
+    stats_by_alias = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats_by_alias[alias] = pool.get_stats()
+    if not stats_by_alias:
+        return ""
+    return "\n".join(pool_stats_lines(stats_by_alias)) + "\n"
+
+
+def _format_labels(names, values):
+    return ",".join(
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values)
+    )
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,116 @@
+"""
+cafeMuji - リクエスト計測ミドルウェア
+
+ビューごとの処理時間・クエリ数・DB時間・レスポンスサイズを common.metrics に記録し、
+遅いクエリとメモリ使用量を PerformanceMonitor でログに残します。
+DEBUG の設定に関係なく、DB ドライバへの実行をラップしてクエリを計測します。
+ASGI では非同期ミドルウェアとして動作します（非同期ビューの前後でスレッドを挟まない）。
+"""
+
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connections
+
+from .error_handlers import PerformanceMonitor
+from .metrics import registry
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# メモリ使用量を確認する間隔（秒）
+MEMORY_CHECK_SECONDS = 60
+
+
+class _QueryTimer:
+    """connection.execute_wrapper() に渡し、クエリ数と所要時間を数える"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            PerformanceMonitor.log_slow_query(elapsed, sql)
+
+
+def _install_timer(stack, timer):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+
+
+class RequestMetricsMiddleware:
+    """リクエストごとの計測値を記録するミドルウェア"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._memory_checked_at = 0.0
+        self._is_async = iscoroutinefunction(get_response)
+        if self._is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self._is_async:
+            return self._acall(request)
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            _install_timer(stack, timer)
+            response = self.get_response(request)
+        return self._record(request, response, timer, time.perf_counter() - started)
+
+    async def _acall(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        stack = ExitStack()
+        # 非同期 ORM のクエリはリクエストごとの同期スレッドの接続で実行されるため、
+        # そのスレッドの接続に計測を取り付ける
+        await sync_to_async(_install_timer)(stack, timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._record(request, response, timer, time.perf_counter() - started)
+
+    def _record(self, request, response, timer, duration):
+        registry.record(
+            _view_name(request),
+            request.method,
+            response.status_code,
+            duration,
+            timer.seconds,
+            timer.count,
+            None if response.streaming else len(response.content),
+        )
+        self._check_memory(request)
+        return response
+
+    def _check_memory(self, request):
+        now = time.monotonic()
+        if resource is None or now - self._memory_checked_at < MEMORY_CHECK_SECONDS:
+            return
+        self._memory_checked_at = now
+        # Linux の ru_maxrss は KB 単位
+        memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        PerformanceMonitor.log_memory_usage(memory_mb, context=_view_name(request))
+
+
+def _view_name(request):
+    """ラベルに使うビュー名（URL に一致しなかった場合は 'unmatched'）"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = match.func
+    return f"{func.__module__}.{getattr(func, '__name__', type(func).__name__)}"
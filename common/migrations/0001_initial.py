@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardRevision',
+            fields=[
+                ('app_label', models.CharField(max_length=20, primary_key=True, serialize=False, verbose_name='アプリ')),
+                ('revision', models.BigIntegerField(default=0, verbose_name='リビジョン')),
+            ],
+            options={
+                'verbose_name': 'ボード更新リビジョン',
+                'verbose_name_plural': 'ボード更新リビジョン',
+            },
+        ),
+    ]
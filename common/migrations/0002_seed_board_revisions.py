@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:36
+
+from django.db import migrations
+
+BOARD_APPS = ('ice', 'food', 'shavedice')
+
+
+def seed_revisions(apps, schema_editor):
+    BoardRevision = apps.get_model('common', 'BoardRevision')
+    for app_label in BOARD_APPS:
+        BoardRevision.objects.get_or_create(app_label=app_label)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_revisions, migrations.RunPython.noop),
+    ]
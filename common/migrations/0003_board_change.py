@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_seed_board_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('revision', models.BigIntegerField(verbose_name='リビジョン')),
+                ('group_id', models.CharField(blank=True, default='', max_length=64, verbose_name='グループID')),
+            ],
+            options={
+                'verbose_name': 'ボード変更ログ',
+                'verbose_name_plural': 'ボード変更ログ',
+                'indexes': [models.Index(fields=['app_label', 'revision'], name='board_change_app_rev_idx')],
+            },
+        ),
+    ]
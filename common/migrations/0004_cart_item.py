@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_board_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_key', models.CharField(max_length=64, verbose_name='カートキー')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('data', models.JSONField(verbose_name='内容')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='追加時刻')),
+            ],
+            options={
+                'verbose_name': '仮オーダー',
+                'verbose_name_plural': '仮オーダー',
+                'indexes': [models.Index(fields=['cart_key', 'app_label'], name='cart_item_key_app_idx'), models.Index(fields=['created_at'], name='cart_item_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_cart_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceTimeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('key', models.CharField(max_length=100, verbose_name='商品キー')),
+                ('samples', models.PositiveIntegerField(default=0, verbose_name='学習した商品数')),
+                ('mean_seconds', models.FloatField(verbose_name='平均提供時間（秒）')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時刻')),
+            ],
+            options={
+                'verbose_name': '提供時間の統計',
+                'verbose_name_plural': '提供時間の統計',
+                'constraints': [models.UniqueConstraint(fields=('app_label', 'key'), name='service_time_app_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:07
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+def create_brin_index(apps, schema_editor):
+    # PostgreSQL では受付時刻順に追記されるアーカイブに BRIN インデックスを付け、
+    # 日付範囲の集計で古い日のブロックを読み飛ばせるようにする
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS archived_order_ts_brin '
+            'ON common_archivedorder USING brin (timestamp)'
+        )
+
+
+def drop_brin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS archived_order_ts_brin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_service_time_stat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('original_id', models.BigIntegerField(verbose_name='元の注文ID')),
+                ('group_id', models.CharField(max_length=64, verbose_name='グループID')),
+                ('item', models.CharField(max_length=100, verbose_name='商品キー')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='数量')),
+                ('status', models.CharField(max_length=10, verbose_name='注文状態')),
+                ('timestamp', models.DateTimeField(verbose_name='注文受付時刻')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='完了時刻')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='アーカイブ時刻')),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='元の注文')),
+            ],
+            options={
+                'verbose_name': 'アーカイブ済み注文',
+                'verbose_name_plural': 'アーカイブ済み注文',
+                'indexes': [models.Index(fields=['app_label', 'timestamp'], name='archived_order_app_ts_idx')],
+                'constraints': [models.UniqueConstraint(fields=('app_label', 'original_id'), name='archived_order_app_id_uniq')],
+            },
+        ),
+        migrations.RunPython(create_brin_index, drop_brin_index),
+    ]
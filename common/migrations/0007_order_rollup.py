@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0006_archived_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('day', models.DateField(verbose_name='受付日')),
+                ('hour', models.PositiveSmallIntegerField(verbose_name='受付時間帯')),
+                ('item', models.CharField(max_length=100, verbose_name='商品キー')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='受付件数')),
+                ('items', models.PositiveIntegerField(default=0, verbose_name='商品数')),
+                ('completed', models.PositiveIntegerField(default=0, verbose_name='完了件数')),
+                ('service_seconds_total', models.FloatField(default=0, verbose_name='提供時間の合計（秒）')),
+                ('service_histogram', models.JSONField(default=dict, verbose_name='提供時間のヒストグラム')),
+            ],
+            options={
+                'verbose_name': '注文の集計',
+                'verbose_name_plural': '注文の集計',
+                'constraints': [models.UniqueConstraint(fields=('app_label', 'day', 'hour', 'item'), name='order_rollup_slot_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0007_order_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('group_id', models.CharField(max_length=64, verbose_name='グループID')),
+                ('clip_color', models.CharField(max_length=10, verbose_name='クリップ色')),
+                ('clip_number', models.IntegerField(default=0, verbose_name='クリップ番号')),
+                ('status', models.CharField(default='ok', max_length=10, verbose_name='注文状態')),
+                ('item_count', models.PositiveIntegerField(default=0, verbose_name='注文件数')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='商品数')),
+                ('pudding_count', models.PositiveIntegerField(default=0, verbose_name='プリン件数')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='完了件数')),
+                ('is_completed', models.BooleanField(default=False, verbose_name='完了フラグ')),
+                ('first_timestamp', models.DateTimeField(verbose_name='最初の注文受付時刻')),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='完了時刻')),
+            ],
+            options={
+                'verbose_name': '注文グループ',
+                'verbose_name_plural': '注文グループ',
+                'indexes': [models.Index(condition=models.Q(('is_completed', False)), fields=['app_label', 'status'], name='order_group_app_open_idx'), models.Index(fields=['app_label', 'completed_at'], name='order_group_app_done_idx')],
+                'constraints': [models.UniqueConstraint(fields=('app_label', 'group_id'), name='order_group_app_group_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:26
+
+from django.db import migrations
+from django.db.models import Count, Max, Min, Q, Sum, Value
+
+# (app_label, モデル名)
+ORDER_MODELS = (('ice', 'Order'), ('food', 'FoodOrder'), ('shavedice', 'ShavedIceOrder'))
+
+
+def backfill_groups(apps, schema_editor):
+    """既存の注文の group_id ごとに OrderGroup の行を作る"""
+    OrderGroup = apps.get_model('common', 'OrderGroup')
+    for app_label, model_name in ORDER_MODELS:
+        model = apps.get_model(app_label, model_name)
+        field_names = {field.name for field in model._meta.concrete_fields}
+        summary = model.objects.order_by().values('group_id').annotate(
+            clip_color=Min('clip_color'),
+            clip_number=Min('clip_number'),
+            open_status=Max('status', filter=Q(is_completed=False)),
+            last_status=Max('status'),
+            item_count=Count('id'),
+            quantity=Sum('quantity') if 'quantity' in field_names else Count('id'),
+            pudding_count=Count('id', filter=Q(is_pudding=True)) if 'is_pudding' in field_names else Value(0),
+            completed_count=Count('id', filter=Q(is_completed=True)),
+            first_timestamp=Min('timestamp'),
+            completed_at=Max('completed_at'),
+        )
+        OrderGroup.objects.bulk_create(
+            [
+                OrderGroup(
+                    app_label=app_label,
+                    group_id=row['group_id'],
+                    clip_color=row['clip_color'] or '',
+                    clip_number=row['clip_number'] or 0,
+                    status=row['open_status'] or row['last_status'],
+                    item_count=row['item_count'],
+                    quantity=row['quantity'] or 0,
+                    pudding_count=row['pudding_count'],
+                    completed_count=row['completed_count'],
+                    is_completed=row['completed_count'] >= row['item_count'],
+                    first_timestamp=row['first_timestamp'],
+                    completed_at=row['completed_at'],
+                )
+                for row in summary.iterator()
+            ],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+def clear_groups(apps, schema_editor):
+    apps.get_model('common', 'OrderGroup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0008_order_group'),
+        ('food', '0006_foodorder_food_status_completed_idx_and_more'),
+        ('ice', '0008_order_ice_completed_at_idx'),
+        ('shavedice', '0006_shavediceorder_status_modified_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_groups, clear_groups),
+    ]
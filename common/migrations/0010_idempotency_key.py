@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0009_backfill_order_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=20, verbose_name='アプリ')),
+                ('key', models.CharField(max_length=64, verbose_name='冪等キー')),
+                ('group_id', models.CharField(max_length=64, verbose_name='グループID')),
+                ('order_ids', models.JSONField(default=list, verbose_name='登録した注文ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='記録時刻')),
+            ],
+            options={
+                'verbose_name': '冪等キー',
+                'verbose_name_plural': '冪等キー',
+                'indexes': [models.Index(fields=['created_at'], name='idempotency_key_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('app_label', 'key'), name='idempotency_key_app_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,249 @@
+"""
+cafeMuji - 共通モデル定義
+
+各注文アプリで共有する小さな管理用テーブルを定義します。
+"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+class BoardRevision(models.Model):
+    """
+    注文ボードの更新リビジョン
+
+    アプリ（ice / food / shavedice）ごとに1行だけ持ち、注文の作成・完了・
+    状態変更・削除のたびに revision を1ずつ進めます。
+    画面のポーリングはこの整数を比べるだけで変更の有無を判定できます。
+    """
+
+    app_label = models.CharField(max_length=20, primary_key=True, verbose_name="アプリ")
+    revision = models.BigIntegerField(default=0, verbose_name="リビジョン")
+
+    def __str__(self):
+        return f"{self.app_label}: {self.revision}"
+
+    class Meta:
+        verbose_name = "ボード更新リビジョン"
+        verbose_name_plural = "ボード更新リビジョン"
+
+
+class BoardChange(models.Model):
+    """
+    ボード変更ログ
+
+    リビジョンを進めるたびに、そのリビジョンで変更されたグループIDを記録します。
+    画面は「前回のリビジョン以降に変わったグループ」だけを取得して差し替えます。
+    group_id が空の行は対象グループが特定できない変更（全体の再描画が必要）を表します。
+    """
+
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    revision = models.BigIntegerField(verbose_name="リビジョン")
+    group_id = models.CharField(max_length=64, blank=True, default='', verbose_name="グループID")
+
+    def __str__(self):
+        return f"{self.app_label}@{self.revision}: {self.group_id or '*'}"
+
+    class Meta:
+        verbose_name = "ボード変更ログ"
+        verbose_name_plural = "ボード変更ログ"
+        indexes = [
+            models.Index(fields=['app_label', 'revision'], name='board_change_app_rev_idx'),
+        ]
+
+
+class CartItem(models.Model):
+    """
+    レジの仮オーダー（カート）の1行
+
+    以前はセッションにリストで保存していたため、1回の追加・削除のたびに
+    セッション全体を書き直していました。1行ずつ保存することで、追加は INSERT 1回、
+    削除は DELETE 1回で済みます。cart_key にはセッションキーを使います。
+    """
+
+    cart_key = models.CharField(max_length=64, verbose_name="カートキー")
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    data = models.JSONField(verbose_name="内容")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="追加時刻")
+
+    def __str__(self):
+        return f"{self.app_label}/{self.cart_key[:8]}: {self.data}"
+
+    class Meta:
+        verbose_name = "仮オーダー"
+        verbose_name_plural = "仮オーダー"
+        indexes = [
+            models.Index(fields=['cart_key', 'app_label'], name='cart_item_key_app_idx'),
+            models.Index(fields=['created_at'], name='cart_item_created_idx'),
+        ]
+
+
+class ServiceTimeStat(models.Model):
+    """
+    商品ごとの提供時間の統計
+
+    注文を完了するたびに、アプリ（ice / food / shavedice）と商品キー
+    （フードはメニュー、かき氷はフレーバー、アイスはサイズ）ごとの1商品あたりの
+    提供時間を指数移動平均で更新します。待ち時間表示は全件を集計し直さず、
+    この平均と未完了の注文から待ち時間を見積もります。
+    """
+
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    key = models.CharField(max_length=100, verbose_name="商品キー")
+    samples = models.PositiveIntegerField(default=0, verbose_name="学習した商品数")
+    mean_seconds = models.FloatField(verbose_name="平均提供時間（秒）")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新時刻")
+
+    def __str__(self):
+        return f"{self.app_label}/{self.key}: {self.mean_seconds:.0f}s ({self.samples})"
+
+    class Meta:
+        verbose_name = "提供時間の統計"
+        verbose_name_plural = "提供時間の統計"
+        constraints = [
+            models.UniqueConstraint(fields=['app_label', 'key'], name='service_time_app_key_uniq'),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    """
+    アーカイブ済みの注文
+
+    前日以前に完了した注文グループを、毎晩 archive_orders コマンドで
+    注文テーブル（Order / FoodOrder / ShavedIceOrder）から移します。
+    注文テーブルには当日分だけが残るため、ボードや管理画面のクエリは
+    シーズンを通して同じ速さを保ちます。
+
+    集計に使う列（商品キー・数量・時刻）は列として持ち、元の行の全項目は data に残します。
+    """
+
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    original_id = models.BigIntegerField(verbose_name="元の注文ID")
+    group_id = models.CharField(max_length=64, verbose_name="グループID")
+    item = models.CharField(max_length=100, verbose_name="商品キー")
+    quantity = models.PositiveIntegerField(default=1, verbose_name="数量")
+    status = models.CharField(max_length=10, verbose_name="注文状態")
+    timestamp = models.DateTimeField(verbose_name="注文受付時刻")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="完了時刻")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="アーカイブ時刻")
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="元の注文")
+
+    def __str__(self):
+        return f"{self.app_label}#{self.original_id}: {self.item} x{self.quantity}"
+
+    class Meta:
+        verbose_name = "アーカイブ済み注文"
+        verbose_name_plural = "アーカイブ済み注文"
+        constraints = [
+            models.UniqueConstraint(fields=['app_label', 'original_id'], name='archived_order_app_id_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['app_label', 'timestamp'], name='archived_order_app_ts_idx'),
+        ]
+
+
+class OrderRollup(models.Model):
+    """
+    注文の集計（日・時間帯・ステーション・商品キーごと）
+
+    注文の受付・完了のたびに該当する行の件数を増やします（common.rollups）。
+    統計 API は注文テーブルを数え直さず、この表を (app_label, day) の範囲で
+    1回読むだけで集計できます。作り直しは backfill_rollups コマンドで行います。
+
+    提供時間（受付から完了まで）は合計と30秒刻みのヒストグラムで持ち、
+    平均とパーセンタイルを計算します。
+    """
+
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    day = models.DateField(verbose_name="受付日")
+    hour = models.PositiveSmallIntegerField(verbose_name="受付時間帯")
+    item = models.CharField(max_length=100, verbose_name="商品キー")
+    orders = models.PositiveIntegerField(default=0, verbose_name="受付件数")
+    items = models.PositiveIntegerField(default=0, verbose_name="商品数")
+    completed = models.PositiveIntegerField(default=0, verbose_name="完了件数")
+    service_seconds_total = models.FloatField(default=0, verbose_name="提供時間の合計（秒）")
+    service_histogram = models.JSONField(default=dict, verbose_name="提供時間のヒストグラム")
+
+    def __str__(self):
+        return f"{self.app_label} {self.day} {self.hour}時 {self.item}: {self.orders}"
+
+    class Meta:
+        verbose_name = "注文の集計"
+        verbose_name_plural = "注文の集計"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['app_label', 'day', 'hour', 'item'], name='order_rollup_slot_uniq',
+            ),
+        ]
+
+
+class OrderGroup(models.Model):
+    """
+    注文グループ（カート1件分の注文）
+
+    注文の各行が group_id の文字列で同じグループに属することを表すだけだったため、
+    グループの状態を知るには所属する全行を読む必要がありました。
+    グループごとに1行を持ち、クリップ・状態・商品数・完了数・最初の受付時刻・
+    完了時刻を注文と同じトランザクションで更新します（common.groups）。
+    ボードの対象グループの絞り込みや状態の判定は、この表を1グループ1行で読みます。
+    """
+
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    group_id = models.CharField(max_length=64, verbose_name="グループID")
+    clip_color = models.CharField(max_length=10, verbose_name="クリップ色")
+    clip_number = models.IntegerField(default=0, verbose_name="クリップ番号")
+    status = models.CharField(max_length=10, default='ok', verbose_name="注文状態")
+    item_count = models.PositiveIntegerField(default=0, verbose_name="注文件数")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="商品数")
+    pudding_count = models.PositiveIntegerField(default=0, verbose_name="プリン件数")
+    completed_count = models.PositiveIntegerField(default=0, verbose_name="完了件数")
+    is_completed = models.BooleanField(default=False, verbose_name="完了フラグ")
+    first_timestamp = models.DateTimeField(verbose_name="最初の注文受付時刻")
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name="完了時刻")
+
+    def __str__(self):
+        return f"{self.app_label}/{self.group_id}: {self.completed_count}/{self.item_count}"
+
+    class Meta:
+        verbose_name = "注文グループ"
+        verbose_name_plural = "注文グループ"
+        constraints = [
+            models.UniqueConstraint(fields=['app_label', 'group_id'], name='order_group_app_group_uniq'),
+        ]
+        indexes = [
+            # 未完了のグループだけの部分インデックス（ボードの対象・STOP の判定に使う）
+            models.Index(
+                fields=['app_label', 'status'], condition=models.Q(is_completed=False),
+                name='order_group_app_open_idx',
+            ),
+            models.Index(fields=['app_label', 'completed_at'], name='order_group_app_done_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    注文の確定に付けられた冪等キー
+
+    レジのタブレットの Wi-Fi が確定の送信中に切れて再送されたとき、同じキーの確定は
+    新しく登録せず、最初に登録した注文を結果として返します（common.idempotency）。
+    キーは settings.IDEMPOTENCY_KEY_SECONDS の間だけ有効で、古い行は記録のついでに削除します。
+    """
+
+    app_label = models.CharField(max_length=20, verbose_name="アプリ")
+    key = models.CharField(max_length=64, verbose_name="冪等キー")
+    group_id = models.CharField(max_length=64, verbose_name="グループID")
+    order_ids = models.JSONField(default=list, verbose_name="登録した注文ID")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="記録時刻")
+
+    def __str__(self):
+        return f"{self.app_label}/{self.key}: {self.group_id}"
+
+    class Meta:
+        verbose_name = "冪等キー"
+        verbose_name_plural = "冪等キー"
+        constraints = [
+            models.UniqueConstraint(fields=['app_label', 'key'], name='idempotency_key_app_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_key_created_idx'),
+        ]
@@ -0,0 +1,299 @@
+"""
+cafeMuji - 注文共通処理
+
+アイス・フード・かき氷の3つの注文モデルで共通の操作を、モデルを引数に取る
+1つの実装として提供します。クエリの絞り込みや一括書き込みなどの最適化は
+ここに入れれば全ステーションに適用されます。
+
+- live_window_queryset(): ボード表示対象（未完了・直近完了）の注文だけを読み込む
+  （グループ化・未完了／完了の振り分けは common.board）
+- submit_order_group(): カート1件を1グループとして1回の bulk_create で登録する
+  （冪等キーを付けた再送は登録せずに以前の結果を返す）
+- complete_group() / update_group_status(): グループ単位の UPDATE 1文
+- complete_orders() / update_groups_status(): 複数グループ・注文IDの一括更新（一括 API 用）
+- complete_order(): 1件の完了
+- board_metrics(): 画面の更新判定用の値
+
+受付・完了・状態変更のたびに、グループの行（common.groups）・提供時間の学習
+（common.service_times）・注文の集計（common.rollups）も同じトランザクションで更新します。書き込みは common.db_writer の
+write_transaction() で行います（SQLite では1つずつ実行）。
+"""
+
+from collections import Counter
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .db_writer import write_transaction
+from .idempotency import submit_once
+from .groups import (
+    has_open_stop, live_group_filter, record_group_completed, record_group_created,
+    record_group_status,
+)
+from .revisions import bump_revision
+from .rollups import record_completed, record_created
+from .service_times import record_completion
+
+# 完了済みグループをボードに残しておく秒数
+COMPLETED_DISPLAY_SECONDS = 30
+
+
+def live_window_queryset(model, now, status_values=None,
+                         completed_seconds=COMPLETED_DISPLAY_SECONDS):
+    """
+    ボード表示対象の注文だけを返すクエリセット
+
+    対象グループ（未完了のグループと、直近 completed_seconds 秒以内に完了したグループ）は
+    OrderGroup から1グループ1行で絞り込み（common.groups.live_group_filter）、
+    その所属注文を受付順で返します。履歴がどれだけ増えても、
+    読み込む行数はライブキューの大きさだけに比例します。
+
+    Args:
+        model: group_id / is_completed / completed_at / timestamp を持つ注文モデル
+        now: 判定の基準時刻
+        status_values: 指定時は未完了グループをこの状態に限る
+        completed_seconds: 完了済みグループを表示しておく秒数
+
+    Returns:
+        QuerySet: 対象グループの注文（timestamp 昇順）
+    """
+    return model.objects.filter(
+        live_group_filter(model, now, completed_seconds, status_values)
+    ).order_by('timestamp', 'id')
+
+
+def submit_order_group(model, group_id, items, inherit_stop=True, idempotency_key=None, **shared):
+    """
+    カートの内容を1つの注文グループとしてまとめて登録する
+
+    全行のインスタンスを組み立ててから（不正なフィールドがあればここで失敗し、
+    何も書き込まない）、1つのトランザクションの中で STOP 判定・bulk_create・
+    リビジョン更新を行います。カートの行数によらずクエリ数は一定です。
+
+    リビジョン行の更新を最初に行うため、同時に確定された注文はこの行ロックで
+    直列化され、STOP 判定と登録の間に別の注文が割り込むことはありません。
+
+    idempotency_key を指定すると、同じキーで記録済みの確定（再送）は何も登録せず、
+    最初に登録した注文を返します（common.idempotency）。
+
+    Args:
+        model: 注文モデル（Order / FoodOrder / ShavedIceOrder）
+        group_id: 登録するグループID
+        items: 行ごとのフィールド dict のリスト
+        inherit_stop: True のとき、未完了の STOP 注文があれば新しい注文も STOP にする
+        idempotency_key: 確定の冪等キー（省略時は常に登録する）
+        **shared: 全行に共通するフィールド（clip_color / clip_number / note など）
+
+    Returns:
+        list: 登録した注文インスタンス（再送の場合は以前に登録した注文）
+
+    Raises:
+        ValueError: カートが空の場合
+    """
+    if not items:
+        raise ValueError("カートが空です")
+
+    orders = [model(group_id=group_id, **{**shared, **item}) for item in items]
+    field_names = {field.name for field in model._meta.concrete_fields}
+
+    def submit():
+        with write_transaction():
+            bump_revision(model._meta.app_label, 'created', group_id)
+            if inherit_stop:
+                has_stop = has_open_stop(model)
+                for order in orders:
+                    order.status = 'stop' if has_stop else 'ok'
+                    if 'is_auto_stopped' in field_names:
+                        order.is_auto_stopped = has_stop
+            created = model.objects.bulk_create(orders)
+            # bulk_create は保存シグナルを送らないため、グループと集計はここで加える
+            record_group_created(created)
+            record_created(created)
+            return created
+
+    return submit_once(model, idempotency_key, submit)[0]
+
+
+def complete_group(model, group_id, now=None, **fields):
+    """
+    グループの未完了の注文を UPDATE 1文で完了にする
+
+    完了済みの注文は対象外なので、同じグループを二重に完了しても
+    completed_at は上書きされません。実際に完了した注文があるときだけ
+    リビジョンを1つ進めます。
+
+    Args:
+        model: 注文モデル
+        group_id: 完了にするグループID
+        now: 完了時刻（省略時は現在時刻）
+        **fields: 同時に更新するフィールド（アイスの status='hold' など）
+
+    Returns:
+        int: 完了にした注文の件数
+    """
+    now = now or timezone.now()
+    with write_transaction():
+        completed = model.objects.filter(group_id=group_id, is_completed=False).update(
+            is_completed=True, completed_at=now, **fields
+        )
+        if completed:
+            bump_revision(model._meta.app_label, 'completed', group_id)
+            orders = list(model.objects.filter(group_id=group_id, completed_at=now))
+            record_group_completed(orders, now, fields.get('status'))
+            record_completion(model, orders, now)
+            record_completed(orders, now)
+    return completed
+
+
+def complete_orders(model, group_ids=(), ids=(), now=None, **fields):
+    """
+    指定したグループ・注文IDの未完了の注文を UPDATE 1文で完了にする
+
+    complete_group() の複数グループ・注文ID版です。完了済みの注文は対象外で、
+    リビジョンは件数によらず1つだけ進めます。
+
+    Args:
+        model: 注文モデル
+        group_ids: 完了にするグループIDのリスト
+        ids: 完了にする注文IDのリスト
+        now: 完了時刻（省略時は現在時刻）
+        **fields: 同時に更新するフィールド
+
+    Returns:
+        list: 完了にした注文インスタンス
+    """
+    group_ids, ids = list(group_ids), list(ids)
+    if not group_ids and not ids:
+        return []
+    now = now or timezone.now()
+    target = Q(group_id__in=group_ids) | Q(id__in=ids)
+    with write_transaction():
+        completed = model.objects.filter(target, is_completed=False).update(
+            is_completed=True, completed_at=now, **fields
+        )
+        if not completed:
+            return []
+        orders = list(model.objects.filter(target, completed_at=now))
+        bump_revision(model._meta.app_label, 'completed', [order.group_id for order in orders])
+        record_group_completed(orders, now, fields.get('status'))
+        record_completion(model, orders, now)
+        record_completed(orders, now)
+    return orders
+
+
+def complete_order(order, now=None, **fields):
+    """
+    注文を1件完了にする（完了済みの注文は変更しない）
+
+    Args:
+        order: 注文インスタンス
+        now: 完了時刻（省略時は現在時刻）
+        **fields: 同時に更新するフィールド（アイスの status='hold' など）
+
+    Returns:
+        bool: 完了にした場合 True
+    """
+    if order.is_completed:
+        return False
+    now = now or timezone.now()
+    order.is_completed = True
+    order.completed_at = now
+    for name, value in fields.items():
+        setattr(order, name, value)
+    with write_transaction():
+        # 保存（シグナル）でリビジョンが進み、グループの行も数え直す
+        order.save()
+        record_completion(type(order), [order], now)
+        record_completed([order], now)
+    return True
+
+
+def update_group_status(model, group_id, status, statuses=None, open_only=False):
+    """
+    グループの状態（ok / stop / hold）を UPDATE 1文で変更する
+
+    注文の行と OrderGroup の行（1行）を同じトランザクションで変更します。
+
+    Args:
+        model: 注文モデル
+        group_id: 対象グループID
+        status: 新しい状態
+        statuses: 許可する状態（省略時は status フィールドの choices）
+        open_only: True のとき未完了の注文だけを変更する
+
+    Returns:
+        int: 変更した注文の件数（許可されない状態の場合は何もせず 0）
+    """
+    fields = _status_fields(model, status, statuses)
+    if fields is None:
+        return 0
+
+    rows = model.objects.filter(group_id=group_id)
+    if open_only:
+        rows = rows.filter(is_completed=False)
+    with write_transaction():
+        updated = rows.update(**fields)
+        if updated:
+            record_group_status(model, [group_id], status)
+            bump_revision(model._meta.app_label, 'status_changed', group_id)
+    return updated
+
+
+def update_groups_status(model, group_ids, status, statuses=None, open_only=False):
+    """
+    複数グループの状態を1つのトランザクションでまとめて変更する
+
+    対象行をロックして読み、UPDATE 1文で変更します。リビジョンは1つだけ進めます。
+
+    Args:
+        model: 注文モデル
+        group_ids: 対象グループIDのリスト
+        status / statuses / open_only: update_group_status() と同じ
+
+    Returns:
+        dict: グループIDごとの変更件数（許可されない状態の場合は空）
+    """
+    fields = _status_fields(model, status, statuses)
+    if fields is None or not group_ids:
+        return {}
+
+    rows = model.objects.filter(group_id__in=list(group_ids))
+    if open_only:
+        rows = rows.filter(is_completed=False)
+    with write_transaction():
+        targets = list(rows.select_for_update().values_list('id', 'group_id'))
+        if targets:
+            model.objects.filter(id__in=[pk for pk, _ in targets]).update(**fields)
+            record_group_status(model, {g for _, g in targets}, status)
+            bump_revision(model._meta.app_label, 'status_changed', [g for _, g in targets])
+    return dict(Counter(g for _, g in targets))
+
+
+def _status_fields(model, status, statuses):
+    """状態の変更で更新するフィールド（許可されない状態の場合は None）"""
+    if statuses is None:
+        statuses = {value for value, _ in model._meta.get_field('status').choices or ()}
+    if status not in statuses:
+        return None
+    fields = {'status': status}
+    if any(field.name == 'status_modified_at' for field in model._meta.concrete_fields):
+        fields['status_modified_at'] = timezone.now()
+    return fields
+
+
+def board_metrics(active_groups, revision):
+    """
+    ボード画面の更新判定用の値
+
+    Args:
+        active_groups: 未完了グループ（common.board.GroupSummary のリスト）
+        revision: 集計前に読んだリビジョン
+
+    Returns:
+        dict: active_order_total（未完了の商品数）・revision・refresh_value
+    """
+    return {
+        'active_order_total': sum(group.open_quantity for group in active_groups),
+        'revision': revision,
+        'refresh_value': str(revision),
+    }
@@ -0,0 +1,172 @@
+"""
+cafeMuji - ポーリング応答のキャッシュ
+
+ボード画面・待ち時間表示の JSON ポーリングは、同じ時刻に問い合わせた
+タブレットすべてに同じ内容を返します。cached_poll() を付けたビューは、
+応答をアプリのリビジョンをキーにキャッシュし、2台目以降は集計せずに返します。
+
+- 応答には ETag（リビジョン）を付け、If-None-Match が一致すれば本文なしの 304 を返します。
+- 書き込みでリビジョンが進むとキーが変わるため、古い応答は使われません。
+- キャッシュは settings.CACHES の default を使います。複数の gunicorn ワーカーで
+  共有したい場合は CACHE_REDIS_URL を設定して Redis を使います。
+- 非同期ビュー（async def）に付けた場合は、リビジョンの参照・キャッシュの読み書きも
+  非同期で行います（ASGI で1プロセスが多数のポーリングを同時に待てる）。
+"""
+
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.shortcuts import render
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from .revisions import (
+    aget_revision,
+    aget_revisions,
+    combined_revision,
+    get_revision,
+    get_revisions,
+    register_revision_cache,
+    revision_cache_key,
+    unchanged_response,
+)
+
+
+def wants_json(request):
+    """ポーリング（JSON）での問い合わせかどうか"""
+    return (
+        request.headers.get('x-requested-with') == 'XMLHttpRequest'
+        or request.GET.get('format') == 'json'
+    )
+
+
+async def arender(request, template_name, context):
+    """
+    非同期ビューから画面（HTML）を描画する
+
+    コンテキストプロセッサがセッション・認証情報（DB）を読むため、描画は同期で実行します。
+    """
+    return await sync_to_async(render)(request, template_name, context)
+
+
+def _etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # 弱い比較（W/ の有無は区別しない）
+    target = etag.removeprefix('W/')
+    return any(tag.removeprefix('W/') == target for tag in parse_etags(header))
+
+
+def cached_poll(app_label, per_minute=False):
+    """
+    JSON ポーリング応答をリビジョン単位でキャッシュするデコレータ
+
+    HTML での表示（通常のページ読み込み）はそのままビューを呼び出します。
+
+    Args:
+        app_label: リビジョンを参照するアプリ（'ice' / 'food' / 'shavedice'）。
+            複数アプリのタプルを渡すと、各リビジョンの合計（combined_revision）で
+            キャッシュを分ける
+        per_minute: 経過時間（分）など時刻に依存する値を含む応答の場合 True。
+            リビジョンに加えて分単位でもキャッシュを分ける
+    """
+    app_labels = (app_label,) if isinstance(app_label, str) else tuple(app_label)
+    label = '+'.join(app_labels)
+
+    def current_revision():
+        if len(app_labels) == 1:
+            return get_revision(app_labels[0])
+        return combined_revision(get_revisions(app_labels))
+
+    async def acurrent_revision():
+        if len(app_labels) == 1:
+            return await aget_revision(app_labels[0])
+        return combined_revision(await aget_revisions(app_labels))
+
+    def make_etag(revision):
+        minute = int(time.time() // 60) if per_minute else None
+        etag = f'W/"{label}-{revision}"' if minute is None else f'W/"{label}-{revision}-{minute}"'
+        return etag, minute
+
+    def decorator(view_func):
+        prefix = f"poll.{view_func.__module__}.{view_func.__name__}"
+        if len(app_labels) == 1:
+            # 合計リビジョンのキーは巻き戻し時の破棄対象にせず、有効期限に任せる
+            register_revision_cache(prefix, app_label)
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if not wants_json(request):
+                    return await view_func(request, *args, **kwargs)
+
+                revision = await acurrent_revision()
+                etag, minute = make_etag(revision)
+                response = _cached_response(request, revision, etag)
+                if response is None:
+                    key = revision_cache_key(prefix, label, revision)
+                    response = _from_cache(await cache.aget(key), minute)
+                    if response is None:
+                        response = await view_func(request, *args, **kwargs)
+                        if _cacheable(response):
+                            await cache.aset(key, _cache_entry(response, minute), settings.POLL_CACHE_SECONDS)
+                return _finish(response, etag)
+
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not wants_json(request):
+                return view_func(request, *args, **kwargs)
+
+            revision = current_revision()
+            etag, minute = make_etag(revision)
+            response = _cached_response(request, revision, etag)
+            if response is None:
+                key = revision_cache_key(prefix, label, revision)
+                response = _from_cache(cache.get(key), minute)
+                if response is None:
+                    response = view_func(request, *args, **kwargs)
+                    if _cacheable(response):
+                        cache.set(key, _cache_entry(response, minute), settings.POLL_CACHE_SECONDS)
+            return _finish(response, etag)
+
+        return wrapper
+
+    return decorator
+
+
+def _cached_response(request, revision, etag):
+    """ETag 一致（304）または ?since= が最新（軽量 JSON）の応答。どちらでもなければ None"""
+    if _etag_matches(request, etag):
+        return HttpResponseNotModified()
+    return unchanged_response(request, revision)
+
+
+def _from_cache(entry, minute):
+    if entry is not None and entry[0] == minute:
+        return HttpResponse(entry[1], content_type=entry[2])
+    return None
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.streaming
+
+
+def _cache_entry(response, minute):
+    return (minute, response.content, response['Content-Type'])
+
+
+def _finish(response, etag):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True, private=True)
+    return response
@@ -0,0 +1,228 @@
+"""
+cafeMuji - ボード更新リビジョン
+
+注文ボード（キッチン・デシャップ・待ち時間表示）の変更検知に使う
+アプリごとの単調増加カウンタを扱います。
+
+- 注文の保存・削除（シグナル）と、update() / bulk_create() による一括更新の後で
+  bump_revision() を呼び、リビジョンを1つ進めます。
+- ポーリングは ?since=<リビジョン> を送り、値が変わっていなければ
+  unchanged_response() が集計クエリなしの軽量な JSON を返します。
+- リビジョンを進めると、コミット後に注文イベント（common.events）も発行します。
+- 変更されたグループIDは BoardChange に記録し、changed_group_ids() で
+  「指定リビジョン以降に変わったグループ」を引けるようにします。
+- 非同期ビュー（ASGI）からは aget_revision() / aget_revisions() を使います。
+"""
+
+from collections import defaultdict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .events import publish_order_event
+from .models import BoardChange, BoardRevision
+
+# リビジョンを管理する注文アプリ
+BOARD_APPS = ('ice', 'food', 'shavedice')
+
+# 変更ログを残すリビジョン数と、古いログを削除する間隔
+CHANGE_LOG_REVISIONS = 500
+CHANGE_LOG_PRUNE_INTERVAL = 100
+
+
+def get_revision(app_label):
+    """現在のリビジョンを返す（主キー1件の参照のみ）"""
+    revision = (
+        BoardRevision.objects.filter(app_label=app_label)
+        .values_list('revision', flat=True)
+        .first()
+    )
+    return revision or 0
+
+
+def get_revisions(app_labels=BOARD_APPS):
+    """複数アプリのリビジョンを1クエリで返す（app_label → リビジョンの dict）"""
+    revisions = dict.fromkeys(app_labels, 0)
+    revisions.update(
+        BoardRevision.objects.filter(app_label__in=app_labels).values_list('app_label', 'revision')
+    )
+    return revisions
+
+
+async def aget_revision(app_label):
+    """get_revision() の非同期版"""
+    revision = await (
+        BoardRevision.objects.filter(app_label=app_label)
+        .values_list('revision', flat=True)
+        .afirst()
+    )
+    return revision or 0
+
+
+async def aget_revisions(app_labels=BOARD_APPS):
+    """get_revisions() の非同期版"""
+    revisions = dict.fromkeys(app_labels, 0)
+    async for app_label, revision in BoardRevision.objects.filter(
+        app_label__in=app_labels
+    ).values_list('app_label', 'revision'):
+        revisions[app_label] = revision
+    return revisions
+
+
+def combined_revision(revisions):
+    """
+    複数アプリをまとめて扱うときのリビジョン
+
+    各アプリのリビジョンは単調増加のため、合計はどれか1つが進めば必ず増えます。
+    """
+    return sum(revisions.values())
+
+
+# リビジョン単位でキャッシュしている値のキー接頭辞（アプリごと）
+_revision_cache_prefixes = defaultdict(set)
+
+
+def revision_cache_key(prefix, app_label, revision):
+    """リビジョン単位でキャッシュする値のキー"""
+    return f"{prefix}:{app_label}:{revision}"
+
+
+def register_revision_cache(prefix, app_label):
+    """
+    リビジョン単位でキャッシュする値の接頭辞を登録する
+
+    登録した接頭辞のキーは、リビジョンを進めたときに新しいリビジョン番号の分が
+    破棄されます（巻き戻ったリビジョン番号に古い値を残さないため）。
+    """
+    _revision_cache_prefixes[app_label].add(prefix)
+
+
+def _discard_revision_caches(app_label, revision):
+    prefixes = _revision_cache_prefixes.get(app_label)
+    if prefixes:
+        cache.delete_many([revision_cache_key(p, app_label, revision) for p in prefixes])
+
+
+def bump_revision(app_label, event='changed', group_id=None):
+    """
+    リビジョンを1つ進めて変更ログを記録し、コミット後に注文イベントを発行する
+
+    Args:
+        app_label: 'ice' / 'food' / 'shavedice'
+        event: created / completed / status_changed / deleted / changed
+        group_id: 対象グループID（分かる場合）。複数の場合はリスト
+    """
+    if isinstance(group_id, (list, tuple, set)):
+        group_ids = sorted({g for g in group_id if g})
+    else:
+        group_ids = [group_id] if group_id else []
+
+    with transaction.atomic():
+        updated = BoardRevision.objects.filter(app_label=app_label).update(
+            revision=F('revision') + 1
+        )
+        if not updated:
+            _, created = BoardRevision.objects.get_or_create(
+                app_label=app_label, defaults={'revision': 1}
+            )
+            if not created:
+                BoardRevision.objects.filter(app_label=app_label).update(
+                    revision=F('revision') + 1
+                )
+        revision = get_revision(app_label)
+        # 巻き戻ったリビジョン番号（ロールバック・DB復元）に古いキャッシュを残さない
+        _discard_revision_caches(app_label, revision)
+        BoardChange.objects.bulk_create([
+            BoardChange(app_label=app_label, revision=revision, group_id=g)
+            for g in group_ids or ['']
+        ])
+        if revision % CHANGE_LOG_PRUNE_INTERVAL == 0:
+            BoardChange.objects.filter(
+                app_label=app_label,
+                revision__lte=revision - CHANGE_LOG_REVISIONS,
+            ).delete()
+    transaction.on_commit(partial(publish_order_event, app_label, event, group_id))
+
+
+def changed_group_ids(app_label, since, revision):
+    """
+    since より後、revision までに変更されたグループIDを返す
+
+    Returns:
+        set | None: 変更されたグループIDの集合。ログが残っていない・
+            対象グループが特定できない変更を含むなど、全体の再描画が
+            必要な場合は None
+    """
+    if since is None or since > revision:
+        return None
+    rows = list(
+        BoardChange.objects.filter(
+            app_label=app_label, revision__gt=since, revision__lte=revision,
+        ).values_list('revision', 'group_id')
+    )
+    if len({rev for rev, _ in rows}) != revision - since:
+        return None
+    if any(not group_id for _, group_id in rows):
+        return None
+    return {group_id for _, group_id in rows}
+
+
+def requested_since(request):
+    """クエリパラメータ since で送られたリビジョンを返す（不正値は None）"""
+    try:
+        return int(request.GET['since'])
+    except (KeyError, ValueError):
+        return None
+
+
+def unchanged_response(request, revision):
+    """
+    クライアントのリビジョンが最新なら軽量な JSON を返す
+
+    Returns:
+        JsonResponse | None: 変更がない場合のレスポンス。変更がある場合は None
+    """
+    if requested_since(request) != revision:
+        return None
+    return JsonResponse({
+        'changed': False,
+        'revision': revision,
+        'timestamp': timezone.now().isoformat(),
+    })
+
+
+def _bump_for_saved(sender, instance, created=False, **kwargs):
+    if created:
+        event = 'created'
+    elif instance.is_completed:
+        event = 'completed'
+    else:
+        event = 'status_changed'
+    bump_revision(sender._meta.app_label, event, instance.group_id)
+
+
+def _bump_for_deleted(sender, instance, **kwargs):
+    bump_revision(sender._meta.app_label, 'deleted', instance.group_id)
+
+
+def connect_signals():
+    """各注文モデルの保存・削除にリビジョン更新を接続する"""
+    from food.models import FoodOrder
+    from ice.models import Order
+    from shavedice.models import ShavedIceOrder
+
+    for model in (Order, FoodOrder, ShavedIceOrder):
+        label = model._meta.label
+        post_save.connect(
+            _bump_for_saved, sender=model,
+            dispatch_uid=f'board_revision_save_{label}',
+        )
+        post_delete.connect(
+            _bump_for_deleted, sender=model,
+            dispatch_uid=f'board_revision_delete_{label}',
+        )
@@ -0,0 +1,201 @@
+"""
+cafeMuji - 注文の集計（ロールアップ）
+
+日・時間帯・ステーション・商品キーごとの件数と提供時間を OrderRollup に
+積み上げます。統計 API は注文テーブルを数え直さず、この表を1回読むだけで済みます。
+
+- 受付: submit_order_group()（bulk_create）と、注文の作成シグナル（API など）で件数を加算
+- 完了: complete_group() / complete_order() で完了件数と提供時間を加算
+- 削除: 未完了の注文の削除（取り消し）は件数を減算
+- 作り直し: `python manage.py backfill_rollups`（注文テーブルとアーカイブから再集計）
+
+時間帯は受付時刻のローカル時刻（settings.TIME_ZONE）で分けます。
+提供時間は受付から完了までの秒数で、30秒刻みのヒストグラムからパーセンタイルを求めます。
+"""
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .archive import business_day_start, order_history
+from .models import OrderRollup
+from .service_times import service_key
+
+# ヒストグラムの刻み（秒）と最後のバケット（これ以上はまとめる。60分）
+BUCKET_SECONDS = 30
+MAX_BUCKET = 119
+
+# 集計結果に含めるパーセンタイル
+PERCENTILES = (50, 90, 95)
+
+
+def _slot(app_label, timestamp, item):
+    local = timezone.localtime(timestamp)
+    return app_label, local.date(), local.hour, item
+
+
+def _order_slot(order):
+    return _slot(order._meta.app_label, order.timestamp, service_key(order))
+
+
+def _units(order):
+    return getattr(order, 'quantity', 1) or 1
+
+
+def _slot_filter(slot):
+    app_label, day, hour, item = slot
+    return {'app_label': app_label, 'day': day, 'hour': hour, 'item': item}
+
+
+def _increment(slot, create=True, **amounts):
+    """行の件数を F() で加算する（行がなければ作成）"""
+    rows = OrderRollup.objects.filter(**_slot_filter(slot))
+    changes = {name: F(name) + value for name, value in amounts.items()}
+    if rows.update(**changes) or not create:
+        return
+    try:
+        with transaction.atomic():
+            OrderRollup.objects.create(**_slot_filter(slot), **amounts)
+    except IntegrityError:
+        # 同時に別の受付が行を作成した
+        rows.update(**changes)
+
+
+def _add_service_time(rollup, seconds):
+    seconds = max(seconds, 0)
+    bucket = str(min(int(seconds // BUCKET_SECONDS), MAX_BUCKET))
+    rollup.completed += 1
+    rollup.service_seconds_total += seconds
+    rollup.service_histogram[bucket] = rollup.service_histogram.get(bucket, 0) + 1
+
+
+def record_created(orders):
+    """受け付けた注文を集計に加える"""
+    amounts = defaultdict(Counter)
+    for order in orders:
+        slot_amounts = amounts[_order_slot(order)]
+        slot_amounts['orders'] += 1
+        slot_amounts['items'] += _units(order)
+    for slot, slot_amounts in amounts.items():
+        _increment(slot, **slot_amounts)
+
+
+def record_completed(orders, completed_at):
+    """完了した注文の完了件数と提供時間を集計に加える"""
+    samples = defaultdict(list)
+    for order in orders:
+        samples[_order_slot(order)].append((completed_at - order.timestamp).total_seconds())
+    with transaction.atomic():
+        for slot, seconds_list in samples.items():
+            rollup, _ = OrderRollup.objects.select_for_update().get_or_create(**_slot_filter(slot))
+            for seconds in seconds_list:
+                _add_service_time(rollup, seconds)
+            rollup.save(update_fields=['completed', 'service_seconds_total', 'service_histogram'])
+
+
+def _created(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        record_created([instance])
+
+
+def _deleted(sender, instance, **kwargs):
+    # 取り消し（未完了の注文の削除）だけを減らす。完了済みの実績は残す
+    if not instance.is_completed:
+        _increment(_order_slot(instance), create=False, orders=-1, items=-_units(instance))
+
+
+def connect_signals():
+    """1件ずつ作成・削除される注文（API・管理画面など）を集計に反映する"""
+    from food.models import FoodOrder
+    from ice.models import Order
+    from shavedice.models import ShavedIceOrder
+
+    for model in (Order, FoodOrder, ShavedIceOrder):
+        label = model._meta.label
+        post_save.connect(_created, sender=model, dispatch_uid=f'order_rollup_save_{label}')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'order_rollup_delete_{label}')
+
+
+def rollups_between(app_label, start_day, end_day, **filters):
+    """期間（両端を含む）の集計行（(app_label, day) の範囲で1クエリ）"""
+    return OrderRollup.objects.filter(
+        app_label=app_label, day__gte=start_day, day__lte=end_day, **filters,
+    )
+
+
+def _percentile(histogram, total, percentile):
+    if not total:
+        return None
+    threshold = total * percentile / 100
+    cumulative = 0
+    for bucket in sorted(histogram, key=int):
+        cumulative += histogram[bucket]
+        if cumulative >= threshold:
+            # バケットの中央値で代表する
+            return (int(bucket) + 0.5) * BUCKET_SECONDS
+    return None
+
+
+def summarize(rollups):
+    """
+    集計行を合算する
+
+    Returns:
+        dict: orders / items / completed / mean_service_seconds / p50・p90・p95_service_seconds
+    """
+    summary = {'orders': 0, 'items': 0, 'completed': 0}
+    total_seconds = 0.0
+    histogram = Counter()
+    for rollup in rollups:
+        summary['orders'] += rollup.orders
+        summary['items'] += rollup.items
+        summary['completed'] += rollup.completed
+        total_seconds += rollup.service_seconds_total
+        histogram.update(rollup.service_histogram)
+    completed = summary['completed']
+    summary['mean_service_seconds'] = round(total_seconds / completed, 1) if completed else None
+    for percentile in PERCENTILES:
+        summary[f'p{percentile}_service_seconds'] = _percentile(histogram, completed, percentile)
+    return summary
+
+
+def summarize_by(rollups, field):
+    """集計行を field（day / hour / item）ごとに合算する（field の昇順）"""
+    groups = defaultdict(list)
+    for rollup in rollups:
+        groups[getattr(rollup, field)].append(rollup)
+    return [{field: key, **summarize(rows)} for key, rows in sorted(groups.items())]
+
+
+def rebuild_rollups(model, start_day, end_day):
+    """
+    期間（両端を含む）の集計を注文テーブルとアーカイブから作り直す
+
+    Returns:
+        int: 作成した集計行の数
+    """
+    app_label = model._meta.app_label
+    rollups = {}
+    start = business_day_start(start_day)
+    end = business_day_start(end_day + timedelta(days=1))
+    for row in order_history(model, start, end):
+        slot = _slot(app_label, row['timestamp'], row['item'])
+        rollup = rollups.get(slot)
+        if rollup is None:
+            rollup = rollups[slot] = OrderRollup(
+                **_slot_filter(slot), orders=0, items=0, completed=0,
+                service_seconds_total=0, service_histogram={},
+            )
+        rollup.orders += 1
+        rollup.items += row['quantity']
+        if row['completed_at']:
+            _add_service_time(rollup, (row['completed_at'] - row['timestamp']).total_seconds())
+
+    with transaction.atomic():
+        rollups_between(app_label, start_day, end_day).delete()
+        OrderRollup.objects.bulk_create(rollups.values(), batch_size=500)
+    return len(rollups)
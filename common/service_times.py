@@ -0,0 +1,184 @@
+"""
+cafeMuji - 提供時間の学習と待ち時間の見積もり
+
+待ち時間表示は以前「フード1商品1分」「かき氷1杯3分」の固定値を使っていました。
+このモジュールは注文の完了時に1商品あたりの提供時間を学習し（ServiceTimeStat）、
+未完了の注文と組み合わせて待ち時間を見積もります。
+
+- 学習は完了のたびに増分で行います（指数移動平均。全履歴の再集計はしない）。
+  提供時間は「直前の完了（または注文の受付）から今回の完了まで」の時間で、
+  1グループに複数の商品があるときは現在の平均の比で按分します。
+  直前の完了時刻は注文ではなく OrderGroup の (app_label, completed_at) インデックスから
+  読みます（注文の履歴を走査しない）。
+- 見積もりはボードの未完了グループ（live_board のキャッシュ）から計算し、
+  リビジョン単位でキャッシュします。同じリビジョンの間のポーリングはキャッシュを
+  読むだけで済みます。
+"""
+
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import OrderGroup, ServiceTimeStat
+from .revisions import BOARD_APPS, register_revision_cache, revision_cache_key
+
+# 学習前に使う1商品あたりの提供時間（秒）。以前の固定値と同じ
+DEFAULT_SERVICE_SECONDS = {
+    'ice': 60,
+    'food': 60,
+    'shavedice': 180,
+}
+
+# 指数移動平均の重み（新しい完了をどれだけ反映するか）
+SMOOTHING = 0.2
+
+# これより長い提供時間は押し忘れなどとみなして学習しない（秒）
+MAX_SAMPLE_SECONDS = 30 * 60
+
+for _app_label in BOARD_APPS:
+    register_revision_cache('wait', _app_label)
+
+
+def service_key(order):
+    """提供時間を分ける商品キー（フードはメニュー、かき氷はフレーバー、アイスはサイズ）"""
+    app_label = order._meta.app_label
+    if app_label == 'food':
+        return order.menu
+    if app_label == 'shavedice':
+        return order.flavor
+    return 'pudding' if getattr(order, 'is_pudding', False) else order.size
+
+
+def _units(order):
+    return getattr(order, 'quantity', 1) or 1
+
+
+def service_means(app_label):
+    """商品キー → 平均提供時間（秒）"""
+    return dict(
+        ServiceTimeStat.objects.filter(app_label=app_label).values_list('key', 'mean_seconds')
+    )
+
+
+async def aservice_means(app_label):
+    """service_means() の非同期版"""
+    return {
+        key: mean async for key, mean in
+        ServiceTimeStat.objects.filter(app_label=app_label).values_list('key', 'mean_seconds')
+    }
+
+
+def record_completion(model, orders, completed_at):
+    """
+    同時に完了した注文から提供時間を学習する
+
+    Args:
+        model: 注文モデル
+        orders: 今回完了した注文（1グループ分、または1件）
+        completed_at: 完了時刻
+    """
+    if not orders:
+        return
+    app_label = model._meta.app_label
+    default = DEFAULT_SERVICE_SECONDS.get(app_label, 60)
+    units = Counter()
+    for order in orders:
+        units[service_key(order)] += _units(order)
+
+    # 直前の完了より前に受け付けた注文は、直前の完了から作り始めたとみなす
+    previous = OrderGroup.objects.filter(
+        app_label=app_label, completed_at__lt=completed_at,
+    ).aggregate(latest=Max('completed_at'))['latest']
+    started = min(order.timestamp for order in orders)
+    if previous and previous > started:
+        started = previous
+    duration = (completed_at - started).total_seconds()
+    if duration <= 0 or duration > MAX_SAMPLE_SECONDS:
+        return
+
+    with transaction.atomic():
+        stats = {
+            stat.key: stat
+            for stat in ServiceTimeStat.objects.select_for_update().filter(
+                app_label=app_label, key__in=list(units)
+            )
+        }
+        expected = {key: stats[key].mean_seconds if key in stats else default for key in units}
+        expected_total = sum(expected[key] * count for key, count in units.items())
+
+        now = timezone.now()
+        for key, count in units.items():
+            # グループの所要時間を現在の平均の比で按分し、1商品あたりに直す
+            sample = duration * expected[key] / expected_total
+            stat = stats.get(key) or ServiceTimeStat(
+                app_label=app_label, key=key, samples=0, mean_seconds=default
+            )
+            # 学習が少ない間は単純平均に近い重みで早く収束させる
+            weight = max(SMOOTHING, count / (stat.samples + count))
+            stat.mean_seconds += weight * (sample - stat.mean_seconds)
+            stat.samples += count
+            stat.updated_at = now
+            stats[key] = stat
+
+        fields = ['samples', 'mean_seconds', 'updated_at']
+        ServiceTimeStat.objects.bulk_update([s for s in stats.values() if s.pk], fields)
+        # 初めての商品キー（同時に別の完了が作成した場合は上書き）
+        ServiceTimeStat.objects.bulk_create(
+            [s for s in stats.values() if not s.pk],
+            update_conflicts=True,
+            unique_fields=['app_label', 'key'],
+            update_fields=fields,
+        )
+
+
+def estimate_wait(app_label, revision, active_groups):
+    """
+    未完了グループの待ち時間を見積もる
+
+    Args:
+        app_label: 'ice' / 'food' / 'shavedice'
+        revision: active_groups を集計したリビジョン
+        active_groups: live_board() の未完了グループ
+
+    Returns:
+        dict: wait_seconds / wait_minutes（切り上げ）/ open_items
+    """
+    key = revision_cache_key('wait', app_label, revision)
+    estimate = cache.get(key)
+    if estimate is None:
+        estimate = _estimate(app_label, service_means(app_label), active_groups)
+        cache.set(key, estimate, settings.BOARD_CACHE_SECONDS)
+    return estimate
+
+
+async def aestimate_wait(app_label, revision, active_groups):
+    """estimate_wait() の非同期版"""
+    key = revision_cache_key('wait', app_label, revision)
+    estimate = await cache.aget(key)
+    if estimate is None:
+        estimate = _estimate(app_label, await aservice_means(app_label), active_groups)
+        await cache.aset(key, estimate, settings.BOARD_CACHE_SECONDS)
+    return estimate
+
+
+def _estimate(app_label, means, active_groups):
+    default = DEFAULT_SERVICE_SECONDS.get(app_label, 60)
+    seconds = 0.0
+    open_items = 0
+    for group in active_groups:
+        for order in group.orders:
+            if order.is_completed:
+                continue
+            count = _units(order)
+            open_items += count
+            seconds += means.get(service_key(order), default) * count
+    return {
+        'wait_seconds': int(seconds),
+        'wait_minutes': math.ceil(seconds / 60),
+        'open_items': open_items,
+    }
@@ -0,0 +1,1184 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ice.models import Order
+from food.models import FoodOrder
+from shavedice.models import ShavedIceOrder
+from django.utils import timezone
+from .archive import archive_orders, batch_size, business_day_start, order_history
+from .board import live_board
+from .db_writer import serialized_writes, write_transaction
+from .models import ArchivedOrder, CartItem, IdempotencyKey, OrderGroup, OrderRollup, ServiceTimeStat
+from . import events as order_events
+from .events import LocalEventBroker, get_broker
+from .floor import pending_counts
+from .groups import sync_groups
+from .idempotency import submit_once
+from .ids import ENCODED_LENGTH, SnowflakeGenerator, decode, encode, new_id
+from .metrics import pool_stats_lines, registry
+from .orders import (
+    complete_group, complete_order, complete_orders, live_window_queryset, submit_order_group,
+    update_group_status, update_groups_status,
+)
+from .service_times import estimate_wait, service_means
+from .revisions import bump_revision, changed_group_ids, get_revision
+
+
+class BoardRevisionTest(TestCase):
+    """ボード更新リビジョンのテスト"""
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_bump_is_monotonic(self):
+        """bump_revision でリビジョンが1ずつ増えること"""
+        before = get_revision('ice')
+        bump_revision('ice')
+        bump_revision('ice')
+        self.assertEqual(get_revision('ice'), before + 2)
+
+    def test_order_changes_bump_revision(self):
+        """注文の作成・状態変更・削除でリビジョンが進むこと"""
+        before = get_revision('ice')
+        order = Order.objects.create(
+            group_id='rev_001', size='S', container='cup',
+            flavor1='jersey', clip_color='yellow', clip_number=1,
+        )
+        after_create = get_revision('ice')
+        self.assertGreater(after_create, before)
+
+        self.client.post(reverse('update_status', args=['rev_001', 'stop']))
+        after_status = get_revision('ice')
+        self.assertGreater(after_status, after_create)
+
+        order.delete()
+        self.assertGreater(get_revision('ice'), after_status)
+
+    def test_unchanged_poll_skips_queries(self):
+        """since が最新リビジョンなら集計せずに changed=false を返すこと"""
+        FoodOrder.objects.create(
+            menu='からあげ', clip_color='yellow', clip_number=1, group_id='rev_food',
+        )
+        revision = get_revision('food')
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('food_kitchen'), {'format': 'json', 'since': revision}
+            )
+        payload = response.json()
+        self.assertFalse(payload['changed'])
+        self.assertEqual(payload['revision'], revision)
+
+    def test_stale_poll_returns_full_payload(self):
+        """since が古ければ通常のペイロードを返すこと"""
+        revision = get_revision('ice')
+        Order.objects.create(
+            group_id='rev_002', size='S', container='cup',
+            flavor1='jersey', clip_color='white', clip_number=2,
+        )
+        response = self.client.get(
+            reverse('ice_view'), {'format': 'json', 'since': revision}
+        )
+        payload = response.json()
+        self.assertTrue(payload['changed'])
+        self.assertEqual(payload['active_order_total'], 1)
+        self.assertEqual(payload['value'], str(get_revision('ice')))
+
+
+class BoardChangeLogTest(TestCase):
+    """ボード変更ログのテスト"""
+
+    def test_changed_group_ids(self):
+        """since 以降に変更されたグループだけが返ること"""
+        since = get_revision('ice')
+        bump_revision('ice', 'created', 'g1')
+        bump_revision('ice', 'status_changed', ['g2', 'g3'])
+        revision = get_revision('ice')
+        self.assertEqual(changed_group_ids('ice', since, revision), {'g1', 'g2', 'g3'})
+        self.assertEqual(changed_group_ids('ice', since + 1, revision), {'g2', 'g3'})
+
+    def test_unknown_group_requires_full_refresh(self):
+        """対象グループが不明な変更や、ログにない古いリビジョンでは None になること"""
+        since = get_revision('food')
+        bump_revision('food', 'created', 'f1')
+        bump_revision('food')
+        revision = get_revision('food')
+        self.assertIsNone(changed_group_ids('food', since, revision))
+        self.assertIsNone(changed_group_ids('food', None, revision))
+        self.assertIsNone(changed_group_ids('food', since - 1, revision))
+
+
+class BoardSnapshotTest(TestCase):
+    """ボードのビューモデルとキャッシュのテスト"""
+
+    def setUp(self):
+        Order.objects.create(
+            group_id='snap_1', size='S', container='cup', flavor1='jersey',
+            clip_color='yellow', clip_number=4,
+        )
+        Order.objects.create(
+            group_id='snap_1', is_pudding=True, clip_color='yellow', clip_number=4,
+        )
+
+    def test_group_summary(self):
+        """1グループの集計値がまとめて計算されること"""
+        active, completed = live_board(Order, get_revision('ice'), timezone.now())
+        self.assertEqual(completed, [])
+        group = active[0]
+        self.assertEqual((group.group_id, group.clip_number), ('snap_1', 4))
+        self.assertEqual(group.pudding_count, 1)
+        self.assertEqual(len(group.items), 1)
+        self.assertEqual(group.open_count, 2)
+        self.assertFalse(group.is_completed)
+
+    def test_same_revision_is_shared(self):
+        """同じリビジョンでは注文を読み直さず、変更後は作り直すこと"""
+        revision = get_revision('ice')
+        live_board(Order, revision, timezone.now())
+        with self.assertNumQueries(0):
+            live_board(Order, revision, timezone.now())
+
+        Order.objects.filter(group_id='snap_1').delete()
+        active, _ = live_board(Order, get_revision('ice'), timezone.now())
+        self.assertEqual(active, [])
+
+
+class PollCacheTest(TestCase):
+    """JSON ポーリング応答のキャッシュと ETag のテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        Order.objects.create(
+            group_id='poll_1', size='S', container='cup', flavor1='jersey',
+            clip_color='yellow', clip_number=5,
+        )
+
+    def test_matching_etag_returns_not_modified(self):
+        """If-None-Match が現在のリビジョンと一致すれば 304 を返すこと"""
+        response = self.client.get(reverse('ice_view'), {'format': 'json'})
+        etag = response['ETag']
+        self.assertEqual(etag, 'W/"ice-%d"' % get_revision('ice'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('ice_view'), {'format': 'json'}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_same_revision_served_from_cache(self):
+        """同じリビジョンの2回目以降は集計せずにキャッシュから返すこと"""
+        first = self.client.get(reverse('ice_view'), {'format': 'json'})
+        with self.assertNumQueries(1):
+            second = self.client.get(reverse('ice_view'), {'format': 'json'})
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_write_invalidates_cached_response(self):
+        """注文の変更後は新しい内容を返すこと"""
+        first = self.client.get(reverse('ice_view'), {'format': 'json'})
+        self.assertEqual(first.json()['active_order_total'], 1)
+
+        Order.objects.create(
+            group_id='poll_2', size='S', container='cup', flavor1='jersey',
+            clip_color='white', clip_number=6,
+        )
+        response = self.client.get(
+            reverse('ice_view'), {'format': 'json'}, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['active_order_total'], 2)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+
+class FloorStatusTest(TestCase):
+    """フロア状況（3ステーションまとめ）のテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        Order.objects.create(
+            group_id='floor_1', size='S', container='cup', flavor1='jersey',
+            clip_color='yellow', clip_number=5,
+        )
+        FoodOrder.objects.create(
+            group_id='floor_2', menu='からあげ丼', quantity=2, clip_color='white', clip_number=6,
+        )
+
+    def test_all_stations_in_one_response(self):
+        """3ステーションの件数と待ち時間を1回の応答で返すこと"""
+        data = self.client.get(reverse('floor_status'), {'format': 'json'}).json()
+        stations = {s['app_label']: s for s in data['stations']}
+        self.assertEqual(stations['ice']['active_count'], 1)
+        self.assertEqual(stations['food']['open_items'], 2)
+        self.assertEqual(stations['food']['wait_minutes'], 2)
+        self.assertEqual(stations['shavedice']['groups'], [])
+        self.assertEqual(data['revision'], get_revision('ice') + get_revision('food'))
+
+    def test_cached_per_combined_revision(self):
+        """どのアプリの変更でも新しい内容を返し、変更がなければ1クエリで返すこと"""
+        first = self.client.get(reverse('floor_status'), {'format': 'json'})
+        with self.assertNumQueries(1):
+            self.client.get(reverse('floor_status'), {'format': 'json'})
+
+        ShavedIceOrder.objects.create(
+            group_id='floor_3', flavor='🍧いちご🍧', clip_color='white', clip_number=7,
+        )
+        response = self.client.get(
+            reverse('floor_status'), {'format': 'json'}, HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stations'][2]['active_count'], 1)
+
+    def test_pending_counts_single_query(self):
+        """未完了件数を1クエリで数えること"""
+        with self.assertNumQueries(1):
+            counts = pending_counts()
+        self.assertEqual(counts, {'ice': 1, 'food': 1, 'shavedice': 0, 'total': 2})
+
+
+class ArchiveTest(TestCase):
+    """注文のアーカイブのテスト"""
+
+    def _food(self, group_id, days_ago, completed=True):
+        order = FoodOrder.objects.create(
+            group_id=group_id, menu='からあげ丼', quantity=2, clip_color='white', clip_number=1,
+        )
+        at = timezone.now() - timedelta(days=days_ago)
+        FoodOrder.objects.filter(id=order.id).update(
+            timestamp=at, is_completed=completed, completed_at=at if completed else None,
+        )
+        return order
+
+    def test_moves_only_finished_groups_before_today(self):
+        """前日以前に完了したグループだけを移し、リビジョンは進めないこと"""
+        old = self._food('old', days_ago=2)
+        self._food('old_open', days_ago=2, completed=False)
+        self._food('mixed', days_ago=2)
+        self._food('mixed', days_ago=2, completed=False)
+        self._food('today', days_ago=0)
+        revision = get_revision('food')
+
+        call_command('archive_orders', stdout=StringIO())
+
+        self.assertEqual(set(FoodOrder.objects.values_list('group_id', flat=True)), {'old_open', 'mixed', 'today'})
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.app_label, archived.original_id), ('food', old.id))
+        self.assertEqual((archived.item, archived.quantity), ('からあげ丼', 2))
+        self.assertEqual(archived.data['group_id'], 'old')
+        self.assertEqual(get_revision('food'), revision)
+
+        start = business_day_start(timezone.localdate() - timedelta(days=3))
+        history = list(order_history(FoodOrder, start, timezone.now() + timedelta(minutes=1)))
+        self.assertEqual(len(history), 5)
+        self.assertEqual(sum(row['quantity'] for row in history), 10)
+
+    def test_full_scan_runs_once_for_all_batches(self):
+        """対象グループの全体集計はバッチの数によらず1回だけであること"""
+        for number in range(5):
+            self._food(f'batch_{number}', days_ago=2)
+        with CaptureQueriesContext(connection) as ctx:
+            moved = archive_orders(FoodOrder, business_day_start(), batch_groups=2)
+        self.assertEqual(moved, 5)
+        self.assertFalse(FoodOrder.objects.exists())
+        full_scans = [
+            q['sql'] for q in ctx.captured_queries
+            if 'GROUP BY' in q['sql'] and ' IN (' not in q['sql']
+        ]
+        self.assertEqual(len(full_scans), 1)
+
+    def test_large_batch_is_chunked(self):
+        """1バッチの行が多くても DELETE を分けて実行し、グループ数は上限までに抑えること"""
+        at = timezone.now() - timedelta(days=2)
+        FoodOrder.objects.bulk_create([
+            FoodOrder(group_id='big', menu='からあげ丼', quantity=1, clip_color='white', clip_number=1,
+                      timestamp=at, is_completed=True, completed_at=at)
+            for _ in range(1200)
+        ])
+        with CaptureQueriesContext(connection) as ctx:
+            moved = archive_orders(FoodOrder, business_day_start(), batch_groups=5000)
+        self.assertEqual(moved, 1200)
+        self.assertEqual(ArchivedOrder.objects.count(), 1200)
+        deletes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "food_foodorder"')]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(batch_size(5000), settings.ARCHIVE_MAX_BATCH_GROUPS)
+
+    def test_dry_run_keeps_orders(self):
+        """--dry-run では何も移さないこと"""
+        self._food('old', days_ago=2)
+        out = StringIO()
+        call_command('archive_orders', '--dry-run', stdout=out)
+        self.assertIn('food: 1 件対象', out.getvalue())
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+
+class OrderRollupTest(TestCase):
+    """注文の集計（ロールアップ）のテスト"""
+
+    def _submit(self, group_id, menu, quantity):
+        return submit_order_group(
+            FoodOrder, group_id, [{'menu': menu, 'quantity': quantity}],
+            clip_color='white', clip_number=1,
+        )
+
+    def test_incremental_counts(self):
+        """受付・完了・取り消しで集計が更新されること"""
+        self._submit('r_1', 'からあげ丼', 2)
+        self._submit('r_2', 'からあげ丼', 1)
+        self._submit('r_3', '焼きそば', 1)
+        FoodOrder.objects.filter(group_id='r_3').delete()
+        complete_group(FoodOrder, 'r_1')
+
+        rollup = OrderRollup.objects.get(app_label='food', item='からあげ丼')
+        self.assertEqual((rollup.orders, rollup.items, rollup.completed), (2, 3, 1))
+        self.assertEqual(rollup.service_histogram, {'0': 1})
+        self.assertEqual(OrderRollup.objects.get(item='焼きそば').orders, 0)
+
+        response = self.client.get('/api/food-orders/statistics/')
+        self.assertEqual(response.data['total_orders_today'], 2)
+        self.assertEqual(response.data['completed_orders_today'], 1)
+        self.assertEqual(response.data['pending_orders'], 1)
+        self.assertEqual(response.data['popular_menu'], {'menu': 'からあげ丼', 'count': 2})
+
+    def test_backfill_matches_history(self):
+        """作り直した集計が、アーカイブ済みの注文も含めて元の注文と一致すること"""
+        self._submit('r_4', 'からあげ丼', 1)
+        self._submit('r_5', 'ルーロー飯', 3)
+        complete_group(FoodOrder, 'r_4')
+        yesterday = timezone.now() - timedelta(days=1)
+        FoodOrder.objects.filter(group_id='r_4').update(timestamp=yesterday, completed_at=yesterday)
+        call_command('archive_orders', stdout=StringIO())
+        OrderRollup.objects.all().delete()
+
+        call_command('backfill_rollups', stdout=StringIO())
+
+        rows = {(r.item, r.orders, r.items, r.completed) for r in OrderRollup.objects.filter(app_label='food')}
+        self.assertEqual(rows, {('からあげ丼', 1, 1, 1), ('ルーロー飯', 1, 3, 0)})
+
+    def test_date_range_api(self):
+        """期間指定の統計 API が集計を日ごとに返し、不正な指定は 400 を返すこと"""
+        self._submit('r_6', 'からあげ丼', 1)
+        today = timezone.localdate()
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('api_order_statistics'),
+                {'app': 'food', 'from': str(today - timedelta(days=7)), 'to': str(today), 'by': 'day'},
+            )
+        self.assertEqual(response.data['total']['orders'], 1)
+        self.assertEqual([g['day'] for g in response.data['groups']], [today])
+
+        self.assertEqual(self.client.get(reverse('api_order_statistics'), {'app': 'bar'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse('api_order_statistics'), {'app': 'food', 'from': 'x'}).status_code, 400
+        )
+
+
+class OrderApiPagingTest(TestCase):
+    """注文 API のカーソルページングと項目の絞り込みのテスト"""
+
+    def setUp(self):
+        now = timezone.now()
+        for i in range(5):
+            order = FoodOrder.objects.create(
+                group_id=f'p_{i}', menu='からあげ丼', clip_color='white', clip_number=1,
+                note='長い備考' * 20, is_completed=i % 2 == 0,
+            )
+            # timestamp は auto_now_add のため作成後に設定する
+            FoodOrder.objects.filter(pk=order.pk).update(timestamp=now - timedelta(minutes=i))
+
+    def test_cursor_pages(self):
+        """新しい順にページングし、次のページで重複・欠落がないこと"""
+        response = self.client.get('/api/food-orders/', {'page_size': 2})
+        ids = [row['group_id'] for row in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [row['group_id'] for row in response.data['results']]
+        self.assertEqual(ids, [f'p_{i}' for i in range(5)])
+
+    def test_fields_projection(self):
+        """一覧は既定で備考を含めず、?fields= で項目を指定できること"""
+        row = self.client.get('/api/food-orders/').data['results'][0]
+        self.assertNotIn('note', row)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/food-orders/', {'fields': 'id,menu'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'menu'})
+        self.assertNotIn('note', queries.captured_queries[-1]['sql'])
+
+        response = self.client.get('/api/food-orders/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ordering_override_keeps_id_tiebreak(self):
+        """?ordering=timestamp でも同じ受付時刻の注文がページ間で重複・欠落しないこと"""
+        at = timezone.now() - timedelta(hours=1)
+        created = FoodOrder.objects.bulk_create([
+            FoodOrder(group_id=f'tie_{number}', menu='からあげ丼', quantity=1, clip_color='white', clip_number=1)
+            for number in range(7)
+        ])
+        FoodOrder.objects.filter(id__in=[order.id for order in created]).update(timestamp=at)
+
+        seen = []
+        url, params = '/api/food-orders/', {'ordering': 'timestamp', 'page_size': 2, 'fields': 'id'}
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertIn(
+                'ORDER BY "food_foodorder"."timestamp" ASC, "food_foodorder"."id" ASC',
+                queries.captured_queries[-1]['sql'],
+            )
+            seen += [row['id'] for row in response.data['results']]
+            url, params = response.data['next'], None
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), set(FoodOrder.objects.values_list('id', flat=True)))
+
+    def test_active_orders_paginated(self):
+        """未完了注文もページングされ、件数は最初のページだけで返すこと"""
+        response = self.client.get('/api/food-orders/active_orders/', {'page_size': 1})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(response.data['next'])
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse([q for q in queries.captured_queries if 'COUNT(' in q['sql']])
+
+
+class BulkOrderApiTest(TestCase):
+    """注文の一括 API のテスト"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _post(self, path, data):
+        return self.client.post(path, data, content_type='application/json')
+
+    def test_bulk_create_group(self):
+        """複数商品を1グループとしてまとめて登録し、不正な行があれば何も登録しないこと"""
+        items = [{'menu': 'からあげ丼', 'quantity': 2}, {'menu': 'ルーロー飯', 'eat_in': False}]
+        response = self._post('/api/food-orders/bulk_create/', {
+            'group_id': 'bulk_1', 'clip_color': 'white', 'clip_number': 3, 'items': items,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(FoodOrder.objects.filter(group_id='bulk_1', clip_number=3).count(), 2)
+        self.assertEqual(OrderRollup.objects.get(item='からあげ丼').items, 2)
+
+        response = self._post('/api/food-orders/bulk_create/', {
+            'group_id': 'bulk_2', 'clip_color': 'white', 'clip_number': 3,
+            'items': [{'menu': 'からあげ丼'}, {'menu': 'ルーロー飯', 'quantity': 0}],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['index'] for e in response.data['errors']], [1])
+        self.assertFalse(FoodOrder.objects.filter(group_id='bulk_2').exists())
+
+    def test_bulk_complete(self):
+        """グループID・注文IDでまとめて完了し、行ごとの結果を返すこと"""
+        for group_id in ('c_1', 'c_2'):
+            submit_order_group(
+                ShavedIceOrder, group_id, [{'flavor': '🍧いちご🍧'}, {'flavor': '🍧抹茶🍧'}],
+                clip_color='white', clip_number=1,
+            )
+        single = ShavedIceOrder.objects.filter(group_id='c_2').first()
+        revision = get_revision('shavedice')
+
+        response = self._post('/api/shavedice-orders/bulk_complete/', {
+            'group_ids': ['c_1', 'missing'], 'ids': [single.id, 999999],
+        })
+        self.assertEqual(response.data['completed_count'], 3)
+        self.assertEqual(
+            [g['result'] for g in response.data['groups']], ['completed', 'not_found']
+        )
+        self.assertEqual(
+            [o['result'] for o in response.data['orders']], ['completed', 'not_found']
+        )
+        self.assertEqual(get_revision('shavedice'), revision + 1)
+
+        response = self._post('/api/shavedice-orders/bulk_complete/', {'group_ids': ['c_1']})
+        self.assertEqual(response.data['groups'][0]['result'], 'already_completed')
+
+    def test_bulk_update_status(self):
+        """複数グループの状態をまとめて変更し、不正な状態は 400 を返すこと"""
+        for group_id in ('s_1', 's_2'):
+            submit_order_group(
+                FoodOrder, group_id, [{'menu': 'からあげ丼'}], clip_color='white', clip_number=1,
+            )
+        response = self._post('/api/food-orders/bulk_update_status/', {
+            'group_ids': ['s_1', 's_2', 'missing'], 'status': 'stop',
+        })
+        self.assertEqual(response.data['updated_count'], 2)
+        self.assertEqual(response.data['groups'][2]['result'], 'not_found')
+        self.assertEqual(FoodOrder.objects.filter(status='stop').count(), 2)
+
+        response = self._post('/api/food-orders/bulk_update_status/', {
+            'group_ids': ['s_1'], 'status': 'hold',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class CartTest(TestCase):
+    """仮オーダー（カート）のテスト"""
+
+    def setUp(self):
+        self.client = Client()
+        self.headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    def add_ice(self, quantity=1):
+        return self.client.post(reverse('add_temp_ice_prefixed'), {
+            'size': 'S', 'container': 'cup', 'flavor1': 'マンゴー', 'quantity': quantity,
+        }, **self.headers).json()
+
+    def test_add_remove_clear(self):
+        """追加・1行削除・全削除が JSON で一覧を返すこと"""
+        payload = self.add_ice(quantity=2)
+        self.assertEqual(payload['count'], 2)
+        self.assertIn('マンゴー', payload['html'])
+
+        item_id = payload['items'][0]['id']
+        payload = self.client.post(reverse('ice_cart_remove', args=[item_id]), **self.headers).json()
+        self.assertEqual(payload['count'], 1)
+
+        self.client.post(reverse('add_temp_pudding_prefixed'), **self.headers)
+        payload = self.client.post(reverse('delete_all_pudding_prefixed'), **self.headers).json()
+        self.assertEqual([item.get('is_pudding') for item in payload['items']], [None])
+
+        payload = self.client.post(reverse('ice_cart_clear'), **self.headers).json()
+        self.assertEqual(payload['count'], 0)
+
+    def test_tap_does_not_rewrite_session(self):
+        """2回目以降の追加はセッションを書き換えず INSERT と一覧の取得だけで済むこと"""
+        self.add_ice()
+        with CaptureQueriesContext(connection) as ctx:
+            self.add_ice()
+        statements = [query['sql'].split()[0].upper() for query in ctx.captured_queries]
+        self.assertEqual(statements, ['INSERT', 'SELECT'])
+
+    def test_carts_are_separated_by_app(self):
+        """アイスとかき氷の仮オーダーが混ざらないこと"""
+        self.add_ice()
+        self.client.post('/shavedice/add_temp_ice/', {'flavor': '🍧いちご🍧'}, **self.headers)
+        self.assertEqual(self.client.get(reverse('ice_cart'), **self.headers).json()['count'], 1)
+        self.assertEqual(CartItem.objects.filter(app_label='shavedice').count(), 1)
+
+
+class SubmitOrderGroupTest(TestCase):
+    """注文確定の共通処理のテスト"""
+
+    def _submit(self, group_id, count):
+        return submit_order_group(
+            FoodOrder, group_id, [{'menu': 'からあげ丼', 'quantity': 1}] * count,
+            clip_color='yellow', clip_number=1, note='',
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        """1行でも10行でもクエリ数が変わらないこと"""
+        # 集計行の初回作成分を除くため、同じ時間帯に1回登録しておく
+        self._submit('bulk_0', 1)
+        with CaptureQueriesContext(connection) as single:
+            self._submit('bulk_1', 1)
+        with CaptureQueriesContext(connection) as ten:
+            self._submit('bulk_10', 10)
+        self.assertEqual(len(single), len(ten))
+        self.assertEqual(FoodOrder.objects.filter(group_id='bulk_10').count(), 10)
+
+    def test_inherits_stop(self):
+        """未完了の STOP 注文があれば新しいグループも STOP になること"""
+        before = get_revision('ice')
+        Order.objects.create(
+            group_id='stop_1', size='S', container='cup', flavor1='jersey',
+            clip_color='white', clip_number=1, status='stop',
+        )
+        orders = submit_order_group(
+            Order, 'stop_2', [{'size': 'S', 'container': 'cup', 'flavor1': 'mango'}],
+            clip_color='yellow', clip_number=2, note='',
+        )
+        self.assertEqual(orders[0].status, 'stop')
+        self.assertTrue(orders[0].is_auto_stopped)
+        self.assertGreater(get_revision('ice'), before)
+
+    def test_invalid_item_writes_nothing(self):
+        """不正な行を含むカートは1行も登録しないこと"""
+        with self.assertRaises(TypeError):
+            submit_order_group(
+                FoodOrder, 'bad', [{'menu': 'からあげ丼'}, {'unknown_field': 1}],
+                clip_color='yellow', clip_number=1,
+            )
+        self.assertFalse(FoodOrder.objects.filter(group_id='bad').exists())
+
+
+class OrderServiceTest(TestCase):
+    """3アプリ共通の完了・状態変更処理のテスト"""
+
+    def _shavedice(self, group_id, **fields):
+        return ShavedIceOrder.objects.create(
+            group_id=group_id, flavor='🍧いちご🍧', clip_color='white', clip_number=1, **fields
+        )
+
+    def test_complete_group_skips_completed_orders(self):
+        """完了済みの注文の完了時刻を上書きせず、二重完了でリビジョンを進めないこと"""
+        done_at = timezone.now() - timedelta(minutes=5)
+        done = self._shavedice('si_1', is_completed=True, completed_at=done_at)
+        self._shavedice('si_1')
+
+        before = get_revision('shavedice')
+        self.assertEqual(complete_group(ShavedIceOrder, 'si_1'), 1)
+        self.assertEqual(complete_group(ShavedIceOrder, 'si_1'), 0)
+        self.assertEqual(get_revision('shavedice'), before + 1)
+        done.refresh_from_db()
+        self.assertEqual(done.completed_at, done_at)
+
+    def test_update_group_status_rejects_unknown_status(self):
+        """choices にない状態には変更しないこと"""
+        self._shavedice('si_2')
+        self.assertEqual(update_group_status(ShavedIceOrder, 'si_2', 'broken'), 0)
+        self.assertEqual(update_group_status(ShavedIceOrder, 'si_2', 'stop'), 1)
+        self.assertEqual(ShavedIceOrder.objects.get(group_id='si_2').status, 'stop')
+
+    def test_complete_order_only_once(self):
+        """完了済みの注文は変更しないこと"""
+        order = self._shavedice('si_3')
+        self.assertTrue(complete_order(order, status='hold'))
+        completed_at = order.completed_at
+        self.assertFalse(complete_order(order))
+        order.refresh_from_db()
+        self.assertEqual(order.completed_at, completed_at)
+        self.assertEqual(order.status, 'hold')
+
+
+class OrderGroupTest(TestCase):
+    """注文グループ（OrderGroup）の同期のテスト"""
+
+    def _group(self, model, group_id):
+        return OrderGroup.objects.get(app_label=model._meta.app_label, group_id=group_id)
+
+    def test_submit_and_complete_update_one_row(self):
+        """受付で1行作り、完了で完了数・完了時刻・完了フラグを更新すること"""
+        submit_order_group(
+            FoodOrder, 'g_food', [{'menu': 'からあげ丼', 'quantity': 2}, {'menu': 'ポテト'}],
+            clip_color='white', clip_number=3,
+        )
+        group = self._group(FoodOrder, 'g_food')
+        self.assertEqual((group.clip_color, group.clip_number, group.status), ('white', 3, 'ok'))
+        self.assertEqual((group.item_count, group.quantity, group.completed_count), (2, 3, 0))
+        self.assertFalse(group.is_completed)
+
+        first = FoodOrder.objects.filter(group_id='g_food').first()
+        complete_orders(FoodOrder, ids=[first.id])
+        group.refresh_from_db()
+        self.assertEqual(group.completed_count, 1)
+        self.assertFalse(group.is_completed)
+
+        now = timezone.now()
+        self.assertEqual(complete_group(FoodOrder, 'g_food', now), 1)
+        group.refresh_from_db()
+        self.assertEqual((group.completed_count, group.completed_at), (2, now))
+        self.assertTrue(group.is_completed)
+
+    def test_status_change_and_stop_inheritance(self):
+        """状態の変更がグループの行に反映され、STOP の判定に使われること"""
+        submit_order_group(ShavedIceOrder, 'g_si_1', [{'flavor': '🍧いちご🍧'}], clip_color='white', clip_number=1)
+        submit_order_group(ShavedIceOrder, 'g_si_2', [{'flavor': '🍧抹茶🍧'}], clip_color='white', clip_number=2)
+        update_group_status(ShavedIceOrder, 'g_si_1', 'stop')
+        self.assertEqual(self._group(ShavedIceOrder, 'g_si_1').status, 'stop')
+
+        submit_order_group(ShavedIceOrder, 'g_si_3', [{'flavor': '🍧ゆず🍧'}], clip_color='white', clip_number=3)
+        self.assertEqual(self._group(ShavedIceOrder, 'g_si_3').status, 'stop')
+
+        update_groups_status(ShavedIceOrder, ['g_si_1', 'g_si_3'], 'ok')
+        self.assertFalse(OrderGroup.objects.filter(app_label='shavedice', status='stop').exists())
+
+    def test_single_saves_and_deletes_are_synced(self):
+        """1件ずつの作成・完了・削除（シグナル）でグループの行を数え直すこと"""
+        first = Order.objects.create(
+            group_id='g_ice', size='S', container='cup', flavor1='jersey',
+            clip_color='yellow', clip_number=4,
+        )
+        Order.objects.create(
+            group_id='g_ice', size='W', container='cone', flavor1='mango', flavor2='mint',
+            clip_color='yellow', clip_number=4, is_pudding=True,
+        )
+        group = self._group(Order, 'g_ice')
+        self.assertEqual((group.item_count, group.pudding_count), (2, 1))
+
+        complete_order(first, status='hold')
+        group.refresh_from_db()
+        self.assertEqual((group.completed_count, group.is_completed), (1, False))
+
+        Order.objects.filter(group_id='g_ice').delete()
+        self.assertFalse(OrderGroup.objects.filter(app_label='ice', group_id='g_ice').exists())
+
+    def test_live_window_reads_group_rows(self):
+        """ボードの対象は未完了のグループと直近に完了したグループだけであること"""
+        for group_id in ('open', 'recent', 'old'):
+            submit_order_group(ShavedIceOrder, group_id, [{'flavor': '🍧いちご🍧'}], clip_color='white', clip_number=1)
+        now = timezone.now()
+        complete_group(ShavedIceOrder, 'recent', now - timedelta(seconds=10))
+        complete_group(ShavedIceOrder, 'old', now - timedelta(minutes=5))
+
+        live = live_window_queryset(ShavedIceOrder, now)
+        self.assertEqual({order.group_id for order in live}, {'open', 'recent'})
+
+    def test_sync_rebuilds_and_archive_removes_rows(self):
+        """sync_groups() で注文から作り直し、アーカイブで移したグループの行を削除すること"""
+        order = FoodOrder.objects.create(
+            group_id='g_old', menu='からあげ丼', quantity=2, clip_color='white', clip_number=1,
+        )
+        at = timezone.now() - timedelta(days=2)
+        FoodOrder.objects.filter(id=order.id).update(timestamp=at, is_completed=True, completed_at=at)
+        OrderGroup.objects.all().delete()
+
+        self.assertEqual(sync_groups(FoodOrder, None), 1)
+        group = self._group(FoodOrder, 'g_old')
+        self.assertEqual((group.quantity, group.first_timestamp, group.is_completed), (2, at, True))
+
+        call_command('archive_orders', stdout=StringIO())
+        self.assertFalse(OrderGroup.objects.exists())
+
+
+def _generate_ids(count):
+    """子プロセスで ID を採番する（IdGeneratorTest 用）"""
+    return [new_id() for _ in range(count)]
+
+
+class BoardSnapshotBroker(LocalEventBroker):
+    """リビジョンの更新がコミットされた時点（イベント発行時）のボードを記録するブローカー"""
+
+    boards = []
+
+    def publish(self, channel, event):
+        if channel == 'ice':
+            active, _ = live_board(Order, get_revision('ice'), timezone.now())
+            self.boards.append([group.group_id for group in active])
+        super().publish(channel, event)
+
+
+@override_settings(ORDER_EVENT_BROKER='common.tests.BoardSnapshotBroker')
+class SingleSaveOrderingTest(TransactionTestCase):
+    """自動コミットの1件保存で、リビジョンより先にグループが書き込まれることのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        BoardSnapshotBroker.boards = []
+        order_events._broker = None
+
+    def tearDown(self):
+        order_events._broker = None
+
+    def test_board_has_group_when_revision_is_visible(self):
+        """新しいリビジョンが見えた時点のボードに保存した注文のグループが含まれること"""
+        Order.objects.create(
+            group_id='autocommit_1', size='S', container='cup', flavor1='jersey',
+            clip_color='white', clip_number=1,
+        )
+        self.assertEqual(BoardSnapshotBroker.boards, [['autocommit_1']])
+        # そのリビジョンでキャッシュしたボードにも含まれる
+        active, _ = live_board(Order, get_revision('ice'), timezone.now())
+        self.assertEqual([group.group_id for group in active], ['autocommit_1'])
+
+
+class IdGeneratorTest(TestCase):
+    """注文グループIDの採番のテスト"""
+
+    def test_encoding_is_fixed_width_and_sortable(self):
+        """文字列は固定長で、並び順が数値の順と一致すること"""
+        values = [0, 1, 31, 32, 2 ** 40, 2 ** 62 + 12345, 2 ** 63 - 1]
+        encoded = [encode(value) for value in values]
+        self.assertTrue(all(len(text) == ENCODED_LENGTH for text in encoded))
+        self.assertEqual(encoded, sorted(encoded))
+        self.assertEqual([decode(text) for text in encoded], values)
+        with self.assertRaises(ValueError):
+            decode('0000000000i00')
+
+    def test_monotonic_within_millisecond_and_clock_skew(self):
+        """同じミリ秒・時計の巻き戻り・連番の使い切りでも増え続けること"""
+        times = iter([1800000000.000] * 4100 + [1799999999.000] * 5)
+        generator = SnowflakeGenerator(node_id=3, slot=7, clock=lambda: next(times))
+        ids = [generator.next_id() for _ in range(4105)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertEqual((ids[0] >> 12) & 0x3ff, 3 << 5 | 7)
+
+    @skipUnless(hasattr(os, 'fork'), 'fork が使えない環境')
+    def test_unique_across_processes(self):
+        """複数プロセスから同時に採番しても重複しないこと"""
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes=4) as pool:
+            results = pool.map(_generate_ids, [5000] * 8)
+        ids = [value for chunk in results for value in chunk]
+        self.assertEqual(len(set(ids)), len(ids))
+        for chunk in results:
+            self.assertEqual(chunk, sorted(chunk))
+
+    def test_submit_paths_use_distinct_ids(self):
+        """同じ秒に確定したフードの注文が別々のグループになること"""
+        client = Client()
+        for _ in range(2):
+            client.post(reverse('add_temp_food'), {'menu': 'からあげ', 'eat_in': '1'})
+            client.post(reverse('submit_temp_food_orders'), {'clip_color': 'white', 'clip_number': 1})
+        group_ids = set(FoodOrder.objects.values_list('group_id', flat=True))
+        self.assertEqual(len(group_ids), 2)
+        self.assertTrue(all(len(group_id) == ENCODED_LENGTH for group_id in group_ids))
+
+
+class IdempotencyTest(TestCase):
+    """注文の確定の冪等キーのテスト"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _submit(self, key, group_id):
+        return submit_order_group(
+            ShavedIceOrder, group_id, [{'flavor': '🍧いちご🍧'}, {'flavor': '🍧抹茶🍧'}],
+            idempotency_key=key, clip_color='white', clip_number=1,
+        )
+
+    def test_retry_returns_original_orders_without_insert(self):
+        """同じキーの再送は INSERT せずに最初の注文を返すこと"""
+        first = self._submit('key-1', 'idem_1')
+        revision = get_revision('shavedice')
+        with CaptureQueriesContext(connection) as ctx:
+            retried = self._submit('key-1', 'idem_2')
+        self.assertEqual([order.id for order in retried], [order.id for order in first])
+        self.assertFalse(any(q['sql'].lstrip().upper().startswith('INSERT') for q in ctx.captured_queries))
+        self.assertEqual(ShavedIceOrder.objects.count(), 2)
+        self.assertEqual(get_revision('shavedice'), revision)
+
+        self._submit('key-2', 'idem_3')
+        self.assertEqual(ShavedIceOrder.objects.count(), 4)
+
+    @override_settings(IDEMPOTENCY_KEY_SECONDS=0)
+    def test_expired_key_is_a_new_submission(self):
+        """期限切れのキーは新しい確定として登録すること"""
+        self._submit('key-old', 'idem_old_1')
+        self._submit('key-old', 'idem_old_2')
+        self.assertEqual(set(ShavedIceOrder.objects.values_list('group_id', flat=True)), {'idem_old_1', 'idem_old_2'})
+        self.assertEqual(IdempotencyKey.objects.get().group_id, 'idem_old_2')
+
+    def test_submit_without_key_is_atomic(self):
+        """キーがない登録も1トランザクションで行い、失敗すれば何も残さないこと"""
+        def submit():
+            self._submit(None, 'atomic_1')
+            raise ValueError('登録の途中で失敗')
+
+        with self.assertRaises(ValueError):
+            submit_once(ShavedIceOrder, None, submit)
+        self.assertFalse(ShavedIceOrder.objects.exists())
+        self.assertFalse(OrderGroup.objects.filter(group_id='atomic_1').exists())
+
+        response = self.client.post(
+            '/api/food-orders/',
+            {'group_id': 'atomic_2', 'menu': 'からあげ丼', 'quantity': 1, 'clip_color': 'white', 'clip_number': 2},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(OrderGroup.objects.get(group_id='atomic_2').item_count, 1)
+
+    def test_register_retry_after_cart_cleared(self):
+        """レジ画面の確定の再送はカートが空でも登録せずに成功として扱うこと"""
+        page = self.client.get(reverse('food_register'))
+        key = page.context['idempotency_key']
+        self.client.post(reverse('add_temp_food'), {'menu': 'からあげ', 'eat_in': '1'})
+        data = {'clip_color': 'white', 'clip_number': 1, 'idempotency_key': key}
+        self.client.post(reverse('submit_temp_food_orders'), data)
+        self.client.post(reverse('add_temp_food'), {'menu': 'からあげ', 'eat_in': '1'})
+        response = self.client.post(reverse('submit_temp_food_orders'), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(FoodOrder.objects.count(), 1)
+        # 再送で登録しなかった仮注文は残る
+        self.assertEqual(CartItem.objects.filter(app_label='food').count(), 1)
+
+    def test_mobile_submit_replay_with_header(self):
+        """モバイル注文の送信は Idempotency-Key ヘッダーが同じ再送を登録しないこと"""
+        data = {'menu': 'からあげ丼', 'quantity': 2, 'clip_color': 'white', 'clip_number': 4}
+        headers = {'Idempotency-Key': 'mobile-key-1'}
+        for _ in range(2):
+            response = self.client.post(reverse('submit_mobile_order'), data, headers=headers)
+            self.assertRedirects(response, reverse('mobile_order_complete'), fetch_redirect_response=False)
+        self.assertEqual(FoodOrder.objects.count(), 2)
+        self.assertEqual(FoodOrder.objects.values('group_id').distinct().count(), 1)
+
+    def test_api_create_and_bulk_create_replay(self):
+        """API の create / bulk_create は同じキーの再送に最初の結果を返すこと"""
+        body = {'group_id': 'api_1', 'menu': 'からあげ丼', 'quantity': 1, 'clip_color': 'white', 'clip_number': 2}
+        headers = {'Idempotency-Key': 'api-key-1'}
+        first = self.client.post('/api/food-orders/', body, content_type='application/json', headers=headers)
+        second = self.client.post('/api/food-orders/', body, content_type='application/json', headers=headers)
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(FoodOrder.objects.count(), 1)
+
+        bulk = {'clip_color': 'white', 'clip_number': 3, 'items': [{'menu': 'からあげ丼'}, {'menu': 'ルーロー飯'}]}
+        headers = {'Idempotency-Key': 'api-key-2'}
+        first = self.client.post('/api/food-orders/bulk_create/', bulk, content_type='application/json', headers=headers)
+        second = self.client.post('/api/food-orders/bulk_create/', bulk, content_type='application/json', headers=headers)
+        self.assertEqual(first.data['group_id'], second.data['group_id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(FoodOrder.objects.count(), 3)
+
+        response = self.client.post(
+            '/api/food-orders/', body, content_type='application/json', headers={'Idempotency-Key': 'bad key!'},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ServiceTimeTest(TestCase):
+    """提供時間の学習と待ち時間の見積もりのテスト"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _food(self, group_id, menu, quantity, minutes_ago):
+        order = FoodOrder.objects.create(
+            group_id=group_id, menu=menu, quantity=quantity, clip_color='white', clip_number=1,
+        )
+        timestamp = timezone.now() - timedelta(minutes=minutes_ago)
+        FoodOrder.objects.filter(id=order.id).update(timestamp=timestamp)
+        return order
+
+    def test_completion_updates_means(self):
+        """完了のたびにメニューごとの平均が更新されること"""
+        self._food('st_1', 'からあげ丼', 2, minutes_ago=10)
+        complete_group(FoodOrder, 'st_1')
+        # 2個で10分 → 1個あたり約300秒
+        self.assertAlmostEqual(service_means('food')['からあげ丼'], 300, delta=5)
+
+        # 直前の完了から作り始めた扱いになるため、受付からの時間では学習しない
+        self._food('st_2', 'からあげ丼', 1, minutes_ago=10)
+        complete_group(FoodOrder, 'st_2')
+        self.assertLess(service_means('food')['からあげ丼'], 300)
+
+    def test_previous_completion_read_from_groups(self):
+        """直前の完了時刻を注文の履歴ではなくグループの行から読むこと"""
+        self._food('st_4', 'からあげ丼', 1, minutes_ago=10)
+        complete_group(FoodOrder, 'st_4')
+        self._food('st_5', 'からあげ丼', 1, minutes_ago=10)
+        with CaptureQueriesContext(connection) as ctx:
+            complete_group(FoodOrder, 'st_5')
+        self.assertFalse([
+            q['sql'] for q in ctx.captured_queries
+            if 'MAX(' in q['sql'] and 'food_foodorder' in q['sql']
+        ])
+        # 直前の完了（st_4）から作り始めた扱いになる
+        self.assertLess(service_means('food')['からあげ丼'], 600)
+
+    def test_estimate_uses_learned_means(self):
+        """学習した平均と未完了の個数から待ち時間を見積もり、学習前は既定値を使うこと"""
+        self._food('st_3', 'からあげ丼', 3, minutes_ago=0)
+        revision = get_revision('food')
+        active_groups, _ = live_board(FoodOrder, revision, timezone.now())
+        estimate = estimate_wait('food', revision, active_groups)
+        self.assertEqual(estimate, {'wait_seconds': 180, 'wait_minutes': 3, 'open_items': 3})
+        # 同じリビジョンの間はキャッシュから返す
+        with self.assertNumQueries(0):
+            estimate_wait('food', revision, active_groups)
+
+        ServiceTimeStat.objects.create(app_label='food', key='からあげ丼', samples=5, mean_seconds=120)
+        bump_revision('food')
+        revision = get_revision('food')
+        active_groups, _ = live_board(FoodOrder, revision, timezone.now())
+        self.assertEqual(estimate_wait('food', revision, active_groups)['wait_minutes'], 6)
+
+
+class OrderEventTest(TestCase):
+    """注文イベント配信のテスト"""
+
+    def test_local_broker_filters_by_channel(self):
+        """購読したチャンネルのイベントだけが届き、カーソルが進むこと"""
+        broker = LocalEventBroker()
+        cursor = broker.latest_id('ice')
+        broker.publish('food', {'type': 'created'})
+        broker.publish('ice', {'type': 'completed', 'group_id': 'g1'})
+
+        cursor, events = broker.listen('ice', cursor, timeout=0)
+        self.assertEqual([event for _, event in events], [{'type': 'completed', 'group_id': 'g1'}])
+        _, events = broker.listen('ice', cursor, timeout=0)
+        self.assertEqual(events, [])
+
+    async def test_local_broker_async_listen(self):
+        """非同期の購読者が別スレッドの発行で起こされ、待機にスレッドを使わないこと"""
+        broker = LocalEventBroker()
+        cursor = await broker.alatest_id('ice')
+        threads = threading.active_count()
+        listeners = [broker.alisten('ice', cursor, timeout=5) for _ in range(50)]
+        publisher = threading.Timer(0.05, broker.publish, args=('ice', {'type': 'created'}))
+        publisher.start()
+        results = await asyncio.gather(*listeners)
+        publisher.join()
+        self.assertEqual({len(events) for _, events in results}, {1})
+        self.assertEqual(threading.active_count(), threads)
+
+        _, events = await broker.alisten('ice', results[0][0], timeout=0.01)
+        self.assertEqual(events, [])
+
+    def test_bump_publishes_after_commit(self):
+        """リビジョン更新でコミット後にイベントが発行されること"""
+        broker = get_broker()
+        cursor = broker.latest_id('shavedice')
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_revision('shavedice', 'completed', 'sd-1')
+        _, events = broker.listen('shavedice', cursor, timeout=0)
+        self.assertEqual(
+            events[-1][1],
+            {'app': 'shavedice', 'type': 'completed', 'group_id': 'sd-1'},
+        )
+
+    @override_settings(ORDER_EVENT_STREAM_SECONDS=0)
+    def test_event_stream_sends_current_revision(self):
+        """接続直後に現在のリビジョンが配信されること"""
+        bump_revision('food')
+        response = Client().get(reverse('food_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: revision', body)
+        self.assertIn(f'"revision": {get_revision("food")}', body)
+
+
+@override_settings(METRICS_ENABLED=True)
+class RequestMetricsTest(TestCase):
+    """リクエスト計測ミドルウェアと /metrics のテスト"""
+
+    def setUp(self):
+        registry.reset()
+        self.client = Client()
+
+    def test_poll_is_recorded(self):
+        """ポーリングの処理時間・クエリ数が /metrics に出力されること"""
+        self.client.get(reverse('food_kitchen'), {'format': 'json'})
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        view = 'view="food.views.food_kitchen"'
+        self.assertIn(f'cafemuji_requests_total{{{view},method="GET",status="200"}} 1', body)
+        self.assertIn(f'cafemuji_request_duration_seconds_count{{{view},method="GET"}} 1', body)
+        self.assertIn(f'cafemuji_request_db_queries_bucket{{{view},le="+Inf"}} 1', body)
+        self.assertIn(f'cafemuji_window_requests{{{view}}} 1', body)
+        queries = [
+            line for line in body.splitlines()
+            if line.startswith(f'cafemuji_window_db_queries{{{view}}}')
+        ]
+        self.assertGreater(int(queries[0].split()[-1]), 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        """METRICS_TOKEN を設定した場合はトークンが必要なこと"""
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_disabled_by_default_and_limited_to_allowed_ips(self):
+        """/metrics は既定で無効、有効時もトークンがなければ許可した接続元だけに返すこと"""
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='192.168.0.20')
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['192.168.0.20']):
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='192.168.0.20')
+            self.assertEqual(response.status_code, 200)
+
+    def test_pool_stats_lines(self):
+        """接続プールの統計が待ち時間（秒）を含めて出力され、プールなしでは出力しないこと"""
+        lines = pool_stats_lines({'default': {
+            'pool_size': 4, 'pool_available': 1, 'pool_max': 8,
+            'requests_num': 120, 'requests_queued': 3, 'requests_wait_ms': 1500,
+        }})
+        self.assertIn('cafemuji_db_pool_connections{database="default"} 4', lines)
+        self.assertIn('cafemuji_db_pool_requests_queued_total{database="default"} 3', lines)
+        self.assertIn('cafemuji_db_pool_wait_seconds_total{database="default"} 1.5', lines)
+        self.assertIn('cafemuji_db_pool_timeouts_total{database="default"} 0', lines)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertNotIn('cafemuji_db_pool_', body)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite のみ')
+class SqliteProfileTest(TestCase):
+    """SQLite の LAN 営業設定のテスト"""
+
+    def _pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connection_pragmas(self):
+        """接続ごとに busy timeout・synchronous=NORMAL が設定されること"""
+        self.assertEqual(self._pragma('busy_timeout'), int(settings.SQLITE_BUSY_TIMEOUT * 1000))
+        self.assertEqual(self._pragma('synchronous'), 1)
+
+    def test_write_transaction_is_reentrant(self):
+        """書き込みトランザクションを入れ子にしても止まらないこと"""
+        self.assertTrue(serialized_writes())
+        with write_transaction():
+            with write_transaction():
+                submit_order_group(
+                    FoodOrder, 'w_1', [{'menu': 'からあげ丼'}], clip_color='white', clip_number=1,
+                )
+        self.assertEqual(complete_group(FoodOrder, 'w_1'), 1)
+
+
+@override_settings(ORDER_EVENT_STREAM_SECONDS=0)
+class AsyncPollTest(TestCase):
+    """ASGI（非同期ビュー）でのポーリングのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    async def test_board_poll_and_etag(self):
+        """非同期のボードのポーリングが JSON と ETag を返し、同じリビジョンでは 304 になること"""
+        await sync_to_async(submit_order_group)(
+            FoodOrder, 'a_1', [{'menu': 'からあげ丼', 'quantity': 2}], clip_color='white', clip_number=1,
+        )
+        response = await self.async_client.get(reverse('food_kitchen'), {'format': 'json'})
+        self.assertEqual(response.json()['active_order_total'], 2)
+
+        response = await self.async_client.get(
+            reverse('food_kitchen'), {'format': 'json'}, headers={'If-None-Match': response['ETag']},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(reverse('food_wait_time'), {'format': 'json'})
+        self.assertEqual(response.json()['uncompleted_count'], 2)
+
+    async def test_counts_and_health(self):
+        """未完了件数 API とヘルスチェックが非同期 ORM で数えること"""
+        await Order.objects.acreate(
+            group_id='a_2', size='S', container='cup', flavor1='mango', clip_color='white', clip_number=1,
+        )
+        response = await self.async_client.get(reverse('api_active_count'))
+        self.assertEqual(response.json(), {'active_count': 1})
+
+        response = await self.async_client.get(reverse('api_health_check'))
+        self.assertEqual(response.json()['pending_orders']['ice'], 1)
+        self.assertEqual(response.json()['status'], 'healthy')
+
+    async def test_metrics_recorded_under_asgi(self):
+        """非同期ミドルウェアでも非同期 ORM のクエリが計測されること"""
+        await self.async_client.get(reverse('food_kitchen'), {'format': 'json'})
+        body = registry.render()
+        line = next(
+            line for line in body.splitlines()
+            if line.startswith('cafemuji_window_db_queries{view="food.views.food_kitchen"}')
+        )
+        self.assertGreater(int(line.split()[-1]), 0)
+
+    async def test_event_stream_under_asgi(self):
+        """ASGI では非同期ジェネレーターでイベントを配信すること"""
+        response = await self.async_client.get(reverse('food_events'))
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertIn('retry:', body)
+        self.assertIn('event: revision', body)
@@ -0,0 +1,32 @@
+"""
+cafeMuji - 仮オーダー（カート）API
+
+レジ画面が fetch で呼び出す、仮オーダーの取得・1行削除・全削除のビューです。
+行の追加は入力チェックが異なるため、各アプリのビュー（add_temp_ice など）が行います。
+"""
+
+from django.views.decorators.http import require_GET, require_POST
+
+from .carts import Cart, cart_response
+
+
+@require_GET
+def cart_detail(request, app_label):
+    """仮オーダーの一覧を返す"""
+    return cart_response(request, Cart(request, app_label))
+
+
+@require_POST
+def cart_remove(request, app_label, item_id):
+    """仮オーダーから1行削除する"""
+    cart = Cart(request, app_label)
+    cart.remove(item_id)
+    return cart_response(request, cart)
+
+
+@require_POST
+def cart_clear(request, app_label):
+    """仮オーダーを空にする"""
+    cart = Cart(request, app_label)
+    cart.clear()
+    return cart_response(request, cart)
@@ -0,0 +1,104 @@
+"""
+cafeMuji - 注文イベントの Server-Sent Events 配信ビュー
+
+ボード画面はこのストリームを EventSource で購読し、注文イベントを受け取った
+ときだけ最新状態を取得します。ストリームは一定時間で閉じ、ブラウザが
+Last-Event-ID 付きで自動再接続します。
+
+ASGI で動かす場合は非同期ジェネレーターで配信し、ブローカーの待機もイベントループ上で
+行う（alisten()）ため、接続を保持している間スレッドを使いません。
+1プロセスで多数の接続を保持できます（同期ワーカーでは1接続が1スレッドを占有）。
+"""
+
+import json
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .events import get_broker
+from .revisions import aget_revision, get_revision
+
+
+def _format_event(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _event_stream(app_label, last_event_id):
+    broker = get_broker()
+    heartbeat = settings.ORDER_EVENT_HEARTBEAT_SECONDS
+    deadline = time.monotonic() + settings.ORDER_EVENT_STREAM_SECONDS
+
+    cursor = last_event_id or broker.latest_id(app_label)
+    revision = get_revision(app_label)
+    yield f"retry: {settings.ORDER_EVENT_RETRY_MS}\n\n"
+    yield _format_event('revision', {'app': app_label, 'revision': revision}, cursor)
+
+    delivered = False
+    while time.monotonic() < deadline:
+        timeout = min(heartbeat, max(deadline - time.monotonic(), 0))
+        cursor, events = broker.listen(app_label, cursor, timeout)
+        for event_id, event in events:
+            delivered = True
+            yield _format_event(event.get('type', 'changed'), event, event_id)
+        if events:
+            continue
+
+        # 別プロセスで発生した変更（ローカルブローカーでは届かない）をリビジョンで補完する
+        current = get_revision(app_label)
+        if current != revision and not delivered:
+            yield _format_event('revision', {'app': app_label, 'revision': current}, cursor)
+        else:
+            yield ": keep-alive\n\n"
+        revision = current
+        delivered = False
+
+
+async def _aevent_stream(app_label, last_event_id):
+    """_event_stream() の非同期版（ASGI）"""
+    broker = get_broker()
+    heartbeat = settings.ORDER_EVENT_HEARTBEAT_SECONDS
+    deadline = time.monotonic() + settings.ORDER_EVENT_STREAM_SECONDS
+
+    cursor = last_event_id or await broker.alatest_id(app_label)
+    revision = await aget_revision(app_label)
+    yield f"retry: {settings.ORDER_EVENT_RETRY_MS}\n\n"
+    yield _format_event('revision', {'app': app_label, 'revision': revision}, cursor)
+
+    delivered = False
+    while time.monotonic() < deadline:
+        timeout = min(heartbeat, max(deadline - time.monotonic(), 0))
+        cursor, events = await broker.alisten(app_label, cursor, timeout)
+        for event_id, event in events:
+            delivered = True
+            yield _format_event(event.get('type', 'changed'), event, event_id)
+        if events:
+            continue
+
+        current = await aget_revision(app_label)
+        if current != revision and not delivered:
+            yield _format_event('revision', {'app': app_label, 'revision': current}, cursor)
+        else:
+            yield ": keep-alive\n\n"
+        revision = current
+        delivered = False
+
+
+def order_event_stream(request, app_label):
+    """指定アプリの注文イベントを text/event-stream で配信する"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    # WSGI では非同期ジェネレーターを最後まで読んでから送るため、同期版を使う
+    stream = _aevent_stream if isinstance(request, ASGIRequest) else _event_stream
+    response = StreamingHttpResponse(
+        stream(app_label, last_event_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,23 @@
+"""
+cafeMuji - フロア状況ビュー
+
+アイス・フード・かき氷の状況を1画面（1回のポーリング）で確認するマネージャー用のビューです。
+JSON 応答は3アプリの合計リビジョン単位でキャッシュされます（common.poll_cache）。
+"""
+
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .floor import afloor_status
+from .poll_cache import arender, cached_poll, wants_json
+from .revisions import BOARD_APPS
+
+
+@cached_poll(BOARD_APPS, per_minute=True)
+async def floor_status_view(request):
+    """フロア全体の状況（?format=json で JSON）"""
+    now = timezone.localtime()
+    status = await afloor_status(now)
+    if wants_json(request):
+        return JsonResponse({'changed': True, **status, 'timestamp': now.isoformat()})
+    return await arender(request, 'common/floor.html', {'floor': status, 'now': now})
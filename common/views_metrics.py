@@ -0,0 +1,33 @@
+"""
+cafeMuji - 計測値の出力ビュー
+
+RequestMetricsMiddleware が集計した値を Prometheus のテキスト形式で返します。
+接続プール（DB_POOL=psycopg）を使っている場合はプールの統計も続けて出力します。
+リクエストのパスや件数が分かるため、既定では公開しません。
+
+- settings.METRICS_ENABLED が False の間は 404 を返します。
+- settings.METRICS_TOKEN を設定した場合は Authorization: Bearer <token> を要求します。
+- トークンがない場合は settings.METRICS_ALLOWED_IPS の接続元（既定はこのマシン）だけに返します。
+"""
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .metrics import registry, render_pool_stats
+
+
+def _allowed(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        return constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    """/metrics: Prometheus 形式の計測値"""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render() + render_pool_stats(), content_type='text/plain; version=0.0.4; charset=utf-8')
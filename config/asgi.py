@@ -3,6 +3,14 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+本番は gunicorn + uvicorn ワーカーでこのアプリケーションを起動します（Procfile の web）。
+ボード・待ち時間のポーリング、未完了件数・ヘルスチェックの API、注文イベントの配信は
+非同期ビューで、1プロセスが多数のタブレットの接続を同時に保持できます。
+その他の同期ビューは Django がスレッドで実行します。
+
+    gunicorn config.asgi:application --worker-class uvicorn.workers.UvicornWorker
+    uvicorn config.asgi:application --host 0.0.0.0 --port 8000   # 単体で起動する場合
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +20,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# settings で ASGI 向けの既定値（持続接続を使わない）を選ぶための目印
+os.environ.setdefault('DJANGO_ASGI', 'True')
 
 application = get_asgi_application()
@@ -17,6 +17,7 @@ Generated by 'django-admin startproject' using Django 5.2.1.
 from pathlib import Path
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # プロジェクトのルートディレクトリを設定
 # このディレクトリを基準に他のパスを設定します
@@ -71,11 +72,13 @@ INSTALLED_APPS = [
     'ice',         # アイスクリーム注文管理
     'shavedice',   # かき氷注文管理
     'api',         # REST API
+    'common',      # 共通機能（ボード更新リビジョン等）
 ]
 
 # ミドルウェア設定（リクエスト処理の順序）
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',             # CORS対応（最上位）
+    'common.middleware.RequestMetricsMiddleware',        # 処理時間・クエリ数の計測（/metrics）
     'django.middleware.security.SecurityMiddleware',      # セキュリティ
     'django.contrib.sessions.middleware.SessionMiddleware', # セッション
     'django.middleware.common.CommonMiddleware',          # 共通処理
@@ -110,20 +113,73 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # ==================== データベース設定 ====================
 
+# ASGI（config.asgi。Procfile の web）で起動しているか
+RUNNING_ASGI = os.environ.get('DJANGO_ASGI', 'False').lower() == 'true'
+
+# PostgreSQL の接続方式（DB_POOL）
+# - psycopg: Django の psycopg 接続プール（psycopg[pool] が必要。ASGI の本番はこちらを使う）。
+#   ワーカープロセスごとに DB_POOL_MIN_SIZE〜DB_POOL_MAX_SIZE 本を保持し、貸し出し時に死活確認する。
+#   空きがなければ DB_POOL_TIMEOUT 秒まで待つ（待ち時間は /metrics に出力）
+# - 未設定: WSGI（gthread）では持続接続。ワーカーのスレッドが接続を DB_CONN_MAX_AGE 秒使い回し、
+#   リクエスト開始時に死活確認（CONN_HEALTH_CHECKS）してから使う。
+#   ASGI では同期の ORM 処理が使い捨てのスレッドで動き、持続接続はスレッドごとに残って
+#   使い回されないため、既定で持続接続を使わない（リクエストごとに接続する）
+DB_POOL = os.environ.get('DB_POOL', '').lower()
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '0' if RUNNING_ASGI else '60'))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '8'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+# SQLite（DATABASE_URL 未設定時）の LAN 営業向け設定
+# ノートPC1台でレジ2台・タブレット10台程度を受ける場合の「database is locked」を防ぐ。
+# 書き込みは common.db_writer でプロセス内の1本の列に並べる
+SQLITE_LAN_PROFILE = os.environ.get('SQLITE_LAN_PROFILE', 'True').lower() == 'true'
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '20'))
+SQLITE_MMAP_SIZE = 128 * 1024 * 1024
+
 # データベース接続設定（本番環境対応）
 if os.environ.get('DATABASE_URL'):
     # 本番環境（PostgreSQL）
     DATABASES = {
-        'default': dj_database_url.parse(os.environ.get('DATABASE_URL'))
+        'default': dj_database_url.parse(
+            os.environ.get('DATABASE_URL'),
+            conn_max_age=0 if DB_POOL else DB_CONN_MAX_AGE,  # プールは持続接続と併用できない
+            conn_health_checks=not DB_POOL,
+        )
     }
+    if DB_POOL == 'psycopg':
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as exc:
+            raise ImproperlyConfigured("DB_POOL=psycopg には psycopg[pool] のインストールが必要です") from exc
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'check': ConnectionPool.check_connection,  # 貸し出し時の死活確認
+        }
+    elif DB_POOL:
+        raise ImproperlyConfigured(f"DB_POOL に指定できるのは psycopg のみです: {DB_POOL}")
 else:
-    # 開発環境（SQLite）
+    # 開発環境・オフライン営業（SQLite）
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',  # SQLiteデータベースエンジン
             'NAME': BASE_DIR / 'db.sqlite3',          # データベースファイルの場所
         }
     }
+    if SQLITE_LAN_PROFILE:
+        DATABASES['default']['OPTIONS'] = {
+            # 接続ごとに実行: WAL（読み取りが書き込みを待たない）・fsync の削減・メモリマップ読み込み
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                f'PRAGMA mmap_size={SQLITE_MMAP_SIZE};'
+            ),
+            'timeout': SQLITE_BUSY_TIMEOUT,  # ロック中の書き込みを待つ秒数（busy timeout）
+            # トランザクション開始時に書き込みロックを取る（途中でのロック昇格失敗を防ぐ）
+            'transaction_mode': 'IMMEDIATE',
+        }
 
 
 # ==================== パスワード検証設定 ====================
@@ -192,6 +248,64 @@ CACHES = {
     }
 }
 
+# 複数の gunicorn ワーカー・ノードでポーリング応答のキャッシュを共有する場合は Redis を使う
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_REDIS_URL'],
+        'TIMEOUT': 300,
+    }
+
+# ==================== 注文イベント配信設定 ====================
+
+# ボード画面への Server-Sent Events 配信に使うブローカー
+# 単一プロセス（gthread ワーカー）ならプロセス内ブローカーで十分。
+# 複数ワーカー・複数ノードで動かす場合は common.events.RedisEventBroker を指定する。
+ORDER_EVENT_BROKER = os.environ.get('ORDER_EVENT_BROKER', 'common.events.LocalEventBroker')
+ORDER_EVENT_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+ORDER_EVENT_STREAM_SECONDS = int(os.environ.get('ORDER_EVENT_STREAM_SECONDS', '300'))  # 1接続の最大秒数
+ORDER_EVENT_HEARTBEAT_SECONDS = 15  # keep-alive とリビジョン照合の間隔（秒）
+ORDER_EVENT_RETRY_MS = 3000         # ブラウザの再接続待ち（ミリ秒）
+
+# ボード画面のスナップショット（common.board）をキャッシュする秒数
+BOARD_CACHE_SECONDS = 60
+# JSON ポーリング応答（common.poll_cache）をキャッシュする秒数
+POLL_CACHE_SECONDS = 60
+
+# ==================== 注文グループIDの採番（common.ids） ====================
+
+# サーバー・ノートPCごとに変える 0〜31 の番号（同じデータベースを共有するノード間で重複させない）
+ID_NODE_ID = int(os.environ.get('ID_NODE_ID', '0'))
+# プロセススロットのロックファイルを置くディレクトリ（空のときは一時ディレクトリ）
+ID_LOCK_DIR = os.environ.get('ID_LOCK_DIR', '')
+
+# ==================== 注文のアーカイブ（common.archive） ====================
+
+# 1トランザクションで移すグループ数（archive_orders --batch-groups の既定値）
+ARCHIVE_BATCH_GROUPS = int(os.environ.get('ARCHIVE_BATCH_GROUPS', '200'))
+# グループ数の上限。グループIDを IN 句のパラメータで渡すため、古い SQLite の
+# パラメータ数の上限（SQLITE_MAX_VARIABLE_NUMBER = 999）を超えないようにする
+ARCHIVE_MAX_BATCH_GROUPS = 500
+
+# ==================== 注文の確定の再送（common.idempotency） ====================
+
+# 注文の確定の冪等キー（Idempotency-Key ヘッダー・idempotency_key フィールド）を覚えておく秒数
+IDEMPOTENCY_KEY_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_SECONDS', str(24 * 60 * 60)))
+
+# ==================== 計測（/metrics） ====================
+
+# 直近の集計値（cafemuji_window_*）に含める秒数
+METRICS_WINDOW_SECONDS = int(os.environ.get('METRICS_WINDOW_SECONDS', '300'))
+# /metrics を公開するか（既定は無効。無効の間は 404 を返す）
+# リクエストのパスや件数が分かるため、有効にする場合はトークンか接続元の制限を使う
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'False').lower() == 'true'
+# 設定すると /metrics に Authorization: Bearer <token> が必要になる
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# METRICS_TOKEN を設定しない場合に /metrics を読める接続元IP（カンマ区切り。既定はこのマシンのみ）
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]
+
 # ==================== ログ設定 ====================
 
 # 本番環境対応のログ設定
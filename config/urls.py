@@ -16,6 +16,9 @@ URL構造:
 from django.contrib import admin
 from django.urls import path, include
 
+from common.views_floor import floor_status_view
+from common.views_metrics import metrics_view
+
 # プロジェクト全体のURLパターン定義
 urlpatterns = [
     # Django管理画面（データベース管理用）
@@ -40,4 +43,10 @@ urlpatterns = [
     # REST API
     # /api/で始まるURLをAPIアプリのURLに振り分け
     path('api/', include('api.urls')),
+
+    # 計測値（Prometheus のテキスト形式）
+    path('metrics', metrics_view, name='metrics'),
+
+    # フロア全体の状況（3ステーションをまとめて表示・1回のポーリングで更新）
+    path('floor/', floor_status_view, name='floor_status'),
 ]
@@ -117,34 +117,33 @@ class FoodOrderViewTest(TestCase):
 
 
 class FoodOrderSessionTest(TestCase):
-    """セッション関連のテスト"""
+    """仮注文（カート）関連のテスト"""
     
     def setUp(self):
         self.client = Client()
     
-    def test_temp_food_session_storage(self):
-        """仮注文のセッション保存テスト"""
+    def test_temp_food_cart_storage(self):
+        """仮注文がセッションではなく仮注文テーブルに保存されるテスト"""
         # 仮注文を追加
-        self.client.post(reverse('add_temp_food'), {
+        response = self.client.post(reverse('add_temp_food'), {
             'menu': 'からあげ',
             'eat_in': '1'
-        })
+        }, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
         
-        # セッションに保存されているかチェック
-        session = self.client.session
-        self.assertIn('temp_food', session)
-        self.assertEqual(len(session['temp_food']), 1)
-        self.assertEqual(session['temp_food'][0]['menu'], 'からあげ')
+        # 仮注文一覧が JSON で返り、セッションには保存されていないかチェック
+        payload = response.json()
+        self.assertEqual(payload['count'], 1)
+        self.assertEqual(payload['items'][0]['menu'], 'からあげ')
+        self.assertIn('からあげ', payload['html'])
+        self.assertNotIn('temp_food', self.client.session)
     
     def test_submit_temp_food_orders(self):
         """仮注文の本注文化テスト"""
-        # 仮注文をセッションに追加
-        session = self.client.session
-        session['temp_food'] = [{
+        # 仮注文を追加
+        self.client.post(reverse('add_temp_food'), {
             'menu': 'からあげ',
-            'eat_in': True
-        }]
-        session.save()
+            'eat_in': '1'
+        })
         
         # 本注文として送信
         response = self.client.post(reverse('submit_temp_food_orders'), {
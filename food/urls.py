@@ -13,10 +13,12 @@ URL構造（/food/プレフィックスの下）:
 - /food/delete_temp_food/<i>/  → 仮注文削除処理
 - /food/delete_all_temp_food/  → 全仮注文削除処理
 - /food/submit_order_group/    → 本注文確定処理
+- /food/cart/                  → 仮注文の取得・削除API（JSON）
 """
 
 from django.urls import path
 from . import views
+from common import views_cart, views_events
 
 # フード注文システムのURLパターン定義
 urlpatterns = [
@@ -33,6 +35,10 @@ urlpatterns = [
     path('kitchen/', views.food_kitchen, name='food_kitchen'),
     path('deshap/', views.food_deshap_view, name='food_deshap'),
     path('waittime/', views.food_wait_time_view, name='food_wait_time'),
+
+    # 注文イベント配信（Server-Sent Events）
+    # 注文の作成・完了・状態変更・削除をボード画面へ即時に通知
+    path('events/', views_events.order_event_stream, {'app_label': 'food'}, name='food_events'),
     
     # 注文完了処理（POST専用）
     # 指定されたグループIDの注文を一括で完了状態に更新
@@ -45,8 +51,13 @@ urlpatterns = [
     path('delete_temp_food/<int:index>/', views.delete_temp_food, name='delete_temp_food'),
     
     # 全仮注文削除処理（POST専用）
-    # セッション内の仮注文リストを全てクリア
+    # 仮注文を全てクリア
     path('delete_all_temp_food/', views.delete_all_temp_food, name='delete_all_temp_food'),
+
+    # 仮注文API（レジ画面から fetch で呼び出し、一覧の HTML 断片を返す）
+    path('cart/', views_cart.cart_detail, {'app_label': 'food'}, name='food_cart'),
+    path('cart/<int:item_id>/delete/', views_cart.cart_remove, {'app_label': 'food'}, name='food_cart_remove'),
+    path('cart/clear/', views_cart.cart_clear, {'app_label': 'food'}, name='food_cart_clear'),
     
     # 本注文確定処理（POST専用）
     # 仮注文をデータベースに保存し、キッチンに送信
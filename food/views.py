@@ -18,10 +18,19 @@ from django.shortcuts import render, redirect
 from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from collections import defaultdict, Counter
-from django.db.models import Count, Sum, Max, Q
+from collections import Counter
 from .models import FoodOrder
-import time
+from common.carts import Cart, cart_context, cart_response
+from common.board import alive_board
+from common.orders import board_metrics, complete_group as complete_orders, update_group_status
+from common.orders import complete_order as complete_single_order
+from common.orders import submit_order_group as submit_orders
+from common.poll_cache import arender, cached_poll
+from common.rollups import rollups_between, summarize_by
+from common.service_times import aestimate_wait
+from common.revisions import aget_revision
+from common.idempotency import new_idempotency_key, replayed_submission, request_key
+from common.ids import new_group_id
 
 FOOD_CATEGORIES = [
     {
@@ -51,73 +60,40 @@ FOOD_MENU_NAMES = {
     for menu in category['items']
 }
 
-
-def _split_active_completed(grouped, now):
-    active = {}
-    completed = {}
-    for gid, ords in grouped.items():
-        if all(o.is_completed for o in ords):
-            latest = max((o.completed_at for o in ords if o.completed_at), default=None)
-            if latest and now - latest <= timezone.timedelta(seconds=30):
-                completed[gid] = ords
-        else:
-            active[gid] = ords
-    return active, completed
-
-
-def _group_by_group_id(queryset):
-    grouped = defaultdict(list)
-    for obj in queryset:
-        grouped[obj.group_id].append(obj)
-    return grouped
-
-
-def _calculate_food_refresh_metrics():
-    aggregates = FoodOrder.objects.aggregate(
-        active_items=Sum('quantity', filter=Q(is_completed=False)),
-        latest_id=Max('id'),
-        active_stop_groups=Count(
-            'group_id',
-            filter=Q(is_completed=False, status='stop'),
-            distinct=True,
-        ),
-    )
-    active_order_total = aggregates['active_items'] or 0
-    latest_order_id = aggregates['latest_id'] or 0
-    active_stop_groups = aggregates['active_stop_groups'] or 0
-    refresh_value = f"{active_order_total}:{latest_order_id}:{active_stop_groups}"
-    return {
-        'active_order_total': active_order_total,
-        'latest_order_id': latest_order_id,
-        'active_stop_groups': active_stop_groups,
-        'refresh_value': refresh_value,
-    }
+# デシャップ画面から変更できる注文状態
+ORDER_STATUS_VALUES = {'ok', 'stop'}
 
 
-def _get_food_order_context():
+async def _get_food_order_context(revision):
+    """キッチン・デシャップ画面で共通のコンテキスト（リビジョン単位のキャッシュから取得）"""
     now = timezone.localtime()
-    all_food = FoodOrder.objects.all().order_by('timestamp')
-    for order in all_food:
-        order.elapsed_seconds = int((now - order.timestamp).total_seconds())
-        order.elapsed_minutes = order.elapsed_seconds // 60
-
-    grouped = _group_by_group_id(all_food)
-    active_orders, completed_orders = _split_active_completed(grouped, now)
-    metrics = _calculate_food_refresh_metrics()
+    active_groups, completed_groups = await alive_board(FoodOrder, revision, now)
+    metrics = board_metrics(active_groups, revision)
+    latest_order_id = max(
+        (o.id for group in active_groups + completed_groups for o in group.orders),
+        default=0,
+    )
 
     return {
-        'active_orders': active_orders,
-        'completed_orders': completed_orders,
+        'active_groups': active_groups,
+        'completed_groups': completed_groups,
         'now': now,
-        'active_count': len(active_orders),
+        'active_count': len(active_groups),
         'active_order_total': metrics['active_order_total'],
-        'latest_order_id': metrics['latest_order_id'],
+        'latest_order_id': latest_order_id,
         'refresh_value': metrics['refresh_value'],
+        'revision': revision,
     }
 
 
-def _food_orders_partial(context, request, template_name='food/_food_orders.html'):
-    return render_to_string(template_name, context, request=request)
+def _wants_json(request):
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json'
+
+
+def _food_orders_partial(context, template_name='food/_food_orders.html'):
+    # ポーリング応答は全タブレットで共有（キャッシュ）するため、request を渡さず
+    # セッション固有の CSRF トークンを含めない（送信先のビューは csrf_exempt）
+    return render_to_string(template_name, context)
 
 
 def food_register(request):
@@ -134,32 +110,25 @@ def food_register(request):
         HttpResponse: フード注文登録画面のHTMLレスポンス
         
     Context:
-        temp_food: 現在の仮注文リスト
+        cart_items: 現在の仮注文リスト
         karaage_count: からあげ丼の合計数量
         lurowfan_count: ルーロー飯の合計数量
-        clip_color: 選択されたクリップの色
-        clip_number: 選択されたクリップの番号
     """
-    # セッションから仮注文リストを取得
-    temp_food = request.session.get('temp_food', [])
+    # 仮注文リストを取得
+    temp_food = Cart(request, 'food').items()
     
     # メニューごとの合計数を計算（表示用）
     counts = Counter()
     for item in temp_food:
         counts[item['menu']] += item['quantity']
     
-    # セッションからクリップ情報を取得
-    clip_color = request.session.get('clip_color', '')
-    clip_number = request.session.get('clip_number', '')
-    
     # テンプレートに渡すデータを準備
     context = {
-        'temp_food': temp_food,
+        **cart_context(temp_food),
         'food_categories': FOOD_CATEGORIES,
+        'idempotency_key': new_idempotency_key(),
         'karaage_count': counts.get('からあげ丼', 0),
         'lurowfan_count': counts.get('ルーロー飯', 0),
-        'clip_color': clip_color,
-        'clip_number': clip_number,
     }
     
     return render(request, 'food/food_register.html', context)
@@ -168,16 +137,17 @@ def food_register(request):
 @csrf_exempt
 def add_temp_food(request):
     """
-    仮注文をセッションに追加するビュー
+    仮注文に追加するビュー
     
     レジ担当者が選択したメニュー・数量・店内/テイクアウトを
-    セッション内の仮注文リストに追加します。
+    仮注文（common.carts.Cart）に1行追加します。
     
     Args:
         request: HTTPリクエストオブジェクト（POSTメソッド）
         
     Returns:
-        HttpResponse: フード注文登録画面へのリダイレクト
+        HttpResponse: fetch からの呼び出しには仮注文一覧の JSON、
+            それ以外はフード注文登録画面へのリダイレクト
         
     POST Parameters:
         menu: メニュー名（からあげ丼、ルーロー飯）
@@ -210,18 +180,15 @@ def add_temp_food(request):
     # 店内/テイクアウトをブール値に変換
     eat_in = True if eat_in_str == '1' else False
     
-    # セッションから仮注文リストを取得して新しい注文を追加
-    temp_food = request.session.get('temp_food', [])
-    temp_food.append({'menu': menu, 'quantity': quantity, 'eat_in': eat_in})
-    
-    # セッションを更新
-    request.session['temp_food'] = temp_food
-    request.session.modified = True
+    # 仮注文に1行追加（INSERT 1回）
+    cart = Cart(request, 'food')
+    cart.add({'menu': menu, 'quantity': quantity, 'eat_in': eat_in})
     
-    return redirect('food_register')
+    return cart_response(request, cart)
 
 
-def food_kitchen(request):
+@cached_poll('food', per_minute=True)
+async def food_kitchen(request):
     """
     キッチン画面：注文をグループごとに集計して表示するビュー
     
@@ -235,26 +202,30 @@ def food_kitchen(request):
         HttpResponse: キッチン画面のHTMLレスポンス
         
     Context:
-        active_orders: 未完了の注文グループ
-        completed_orders: 完了済みの注文グループ（30秒以内）
+        active_groups: 未完了の注文グループ（GroupSummary）
+        completed_groups: 完了済みの注文グループ（30秒以内）
         now: 現在時刻
         active_count: 未完了注文数
     """
-    context = _get_food_order_context()
+    revision = await aget_revision('food')
+
+    context = await _get_food_order_context(revision)
     now = context['now']
     
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': context['refresh_value'],
             'refresh_value': context['refresh_value'],
             'active_order_total': context['active_order_total'],
             'active_count': context['active_count'],
             'latest_order_id': context['latest_order_id'],
-            'html': _food_orders_partial(context, request),
+            'html': _food_orders_partial(context),
             'timestamp': now.isoformat(),
         })
     
-    return render(request, 'food/food_kitchen.html', context)
+    return await arender(request, 'food/food_kitchen.html', context)
 
 
 @csrf_exempt
@@ -273,14 +244,10 @@ def complete_food_group(request, group_id):
         HttpResponse: キッチン画面へのリダイレクト
     """
     if request.method == 'POST':
-        now = timezone.now()
         # 指定グループの未完了注文を一括で完了状態に更新
-        FoodOrder.objects.filter(
-            group_id=group_id, 
-            is_completed=False
-        ).update(is_completed=True, completed_at=now)
+        completed = complete_orders(FoodOrder, group_id)
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-            return JsonResponse({'status': 'ok'})
+            return JsonResponse({'status': 'ok', 'group_id': group_id, 'completed': completed})
     
     return redirect('food_kitchen')
 
@@ -291,14 +258,9 @@ def complete_food_order(request, order_id):
     指定IDの注文を個別に完了にするビュー
     """
     if request.method == 'POST':
-        now = timezone.now()
-        try:
-            order = FoodOrder.objects.get(id=order_id)
-            order.is_completed = True
-            order.completed_at = now
-            order.save()
-        except FoodOrder.DoesNotExist:
-            pass
+        order = FoodOrder.objects.filter(id=order_id).first()
+        if order is not None:
+            complete_single_order(order)
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({'status': 'ok'})
     return redirect('food_kitchen')
@@ -307,51 +269,60 @@ def complete_food_order(request, order_id):
 @csrf_exempt
 def food_update_status(request, group_id, new_status):
     """フードデシャップ画面からグループの状態を更新"""
-    if request.method == 'POST' and new_status in {'ok', 'stop'}:
-        FoodOrder.objects.filter(group_id=group_id, is_completed=False).update(
-            status=new_status
-        )
+    if request.method == 'POST' and new_status in ORDER_STATUS_VALUES:
+        update_group_status(FoodOrder, group_id, new_status, statuses=ORDER_STATUS_VALUES, open_only=True)
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({'status': 'ok'})
     return redirect('food_deshap')
 
 
-def food_deshap_view(request):
+@cached_poll('food', per_minute=True)
+async def food_deshap_view(request):
     """フードデシャップ担当画面"""
-    context = _get_food_order_context()
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    revision = await aget_revision('food')
+
+    context = await _get_food_order_context(revision)
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': context['refresh_value'],
             'refresh_value': context['refresh_value'],
             'active_order_total': context['active_order_total'],
             'active_count': context['active_count'],
             'latest_order_id': context['latest_order_id'],
-            'html': _food_orders_partial(context, request, 'food/_food_deshap_orders.html'),
+            'html': _food_orders_partial(context, 'food/_food_deshap_orders.html'),
             'timestamp': context['now'].isoformat(),
         })
-    return render(request, "food/food_deshap.html", context)
+    return await arender(request, "food/food_deshap.html", context)
 
 
-def food_wait_time_view(request):
+@cached_poll('food')
+async def food_wait_time_view(request):
     """
-    フードの未完了商品数から待ち時間（1商品1分）を計算して表示するビュー
+    フードの未完了商品と、メニューごとに学習した提供時間から待ち時間を見積もって表示するビュー
     """
-    uncompleted_count = FoodOrder.objects.filter(is_completed=False).aggregate(
-        total=Sum('quantity')
-    )['total'] or 0
-    wait_minutes = uncompleted_count
+    revision = await aget_revision('food')
+
+    active_groups, _ = await alive_board(FoodOrder, revision, timezone.localtime())
+    estimate = await aestimate_wait('food', revision, active_groups)
+    uncompleted_count = estimate['open_items']
+    wait_minutes = estimate['wait_minutes']
     context = {
         'uncompleted_count': uncompleted_count,
         'wait_minutes': wait_minutes,
+        'revision': revision,
     }
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': wait_minutes,
             'wait_minutes': wait_minutes,
             'uncompleted_count': uncompleted_count,
             'timestamp': timezone.now().isoformat(),
         })
-    return render(request, 'food/food_wait_time.html', context)
+    return await arender(request, 'food/food_wait_time.html', context)
 
 
 @csrf_exempt
@@ -368,16 +339,9 @@ def delete_temp_food(request, index):
     Returns:
         HttpResponse: フード注文登録画面へのリダイレクト
     """
-    if 'temp_food' in request.session:
-        temp_food = request.session['temp_food']
-        # インデックスの範囲チェック
-        if 0 <= index < len(temp_food):
-            # 指定インデックスの注文を削除
-            del temp_food[index]
-            request.session['temp_food'] = temp_food
-            request.session.modified = True
-    
-    return redirect('food_register')
+    cart = Cart(request, 'food')
+    cart.remove_at(index)
+    return cart_response(request, cart)
 
 
 @csrf_exempt
@@ -393,10 +357,10 @@ def delete_all_temp_food(request):
     Returns:
         HttpResponse: フード注文登録画面へのリダイレクト
     """
-    # セッションの仮注文リストを空にする
-    request.session['temp_food'] = []
-    request.session.modified = True
-    return redirect('food_register')
+    # 仮注文を空にする
+    cart = Cart(request, 'food')
+    cart.clear()
+    return cart_response(request, cart)
 
 
 @csrf_exempt
@@ -405,7 +369,7 @@ def submit_order_group(request):
     仮注文を本注文としてデータベースに保存するビュー
     
     レジ担当者が仮注文を確定し、キッチンに送信する際に呼び出されます。
-    セッション内の仮注文をデータベースに保存し、セッションをクリアします。
+    仮注文をデータベースに保存し、仮注文を空にします。
     
     Args:
         request: HTTPリクエストオブジェクト（POSTメソッド）
@@ -417,13 +381,19 @@ def submit_order_group(request):
         clip_color: クリップの色
         clip_number: クリップの番号
         note: 備考欄
+        idempotency_key: 確定の冪等キー（同じキーの再送は登録しない）
     """
     # POSTメソッド以外は注文画面にリダイレクト
     if request.method != "POST":
         return redirect('food_register')
     
-    # セッションから仮注文リストを取得
-    temp_food = request.session.get('temp_food', [])
+    # 確定済みの送信の再送（Wi-Fi の切断など）は何も登録しない
+    if replayed_submission(request, 'food'):
+        return redirect('food_register')
+
+    # 仮注文リストを取得
+    cart = Cart(request, 'food')
+    temp_food = cart.items()
     
     # POSTデータから注文情報を取得
     clip_color = request.POST.get('clip_color')
@@ -440,31 +410,31 @@ def submit_order_group(request):
     except (ValueError, TypeError):
         return redirect('food_register')
     
-    # グループIDを現在時刻で生成（一意性を保証）
-    group_id = str(int(time.time()))
-
-    has_stop = FoodOrder.objects.filter(is_completed=False, status='stop').exists()
-    status = 'stop' if has_stop else 'ok'
-    
-    # 仮注文をデータベースに保存
-    for item in temp_food:
-        FoodOrder.objects.create(
-            menu=item['menu'],
-            quantity=item.get('quantity', 1),
-            eat_in=item.get('eat_in', True),
-            clip_color=clip_color,
-            clip_number=clip_number,
-            note=note,
-            group_id=group_id,
-            status=status,
-            is_completed=False
-        )
+    # グループID生成（ワーカー・ノードをまたいで重複しない採番）
+    group_id = new_group_id()
+
+    # 仮注文をデータベースに保存（STOP 判定と登録は共通処理で1トランザクションにまとめる）
+    items = [
+        {
+            'menu': item['menu'],
+            'quantity': item.get('quantity', 1),
+            'eat_in': item.get('eat_in', True),
+        }
+        for item in temp_food
+        if item.get('menu')
+    ]
+    if not items:
+        return redirect('food_register')
+    submit_orders(
+        FoodOrder, group_id, items,
+        idempotency_key=request_key(request),
+        clip_color=clip_color,
+        clip_number=clip_number,
+        note=note,
+    )
     
-    # セッションを初期化（注文完了）
-    request.session['temp_food'] = []
-    request.session['clip_color'] = ''
-    request.session['clip_number'] = ''
-    request.session.modified = True
+    # 仮注文を空にする（注文完了）
+    cart.clear()
     
     return redirect('food_register')
 
@@ -518,22 +488,20 @@ def food_statistics(request):
     """
     del request
     try:
-        today = timezone.now().date()
+        today = timezone.localdate()
         
-        # 今日の統計
-        today_orders = FoodOrder.objects.filter(timestamp__date=today)
-        
-        # メニュー別集計
-        from django.db.models import Count
-        menu_stats = today_orders.values('menu').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        # 今日の統計（集計テーブルを1回読む）
+        by_menu = summarize_by(rollups_between('food', today, today), 'item')
+        menu_stats = sorted(
+            ({'menu': row['item'], 'count': row['orders']} for row in by_menu),
+            key=lambda row: -row['count'],
+        )
         
         return JsonResponse({
             'date': str(today),
-            'total_orders': today_orders.count(),
-            'completed_orders': today_orders.filter(is_completed=True).count(),
-            'menu_statistics': list(menu_stats)
+            'total_orders': sum(row['orders'] for row in by_menu),
+            'completed_orders': sum(row['completed'] for row in by_menu),
+            'menu_statistics': menu_stats
         })
         
     except Exception as e:
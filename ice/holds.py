@@ -0,0 +1,50 @@
+"""
+cafeMuji - アイス注文の保留（hold）解除
+
+デシャップ画面で「保留」にしたグループを、保留中のグループ数に応じて
+OK（3グループ以下）または STOP に切り替えます。
+
+以前はデシャップ画面の表示・ポーリングのたびに実行していましたが、
+閲覧のたびに書き込みとリビジョン更新が発生するため、
+process_hold_status コマンド（常駐ワーカー）から実行します。
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from common.groups import record_group_status
+from common.models import OrderGroup
+from common.revisions import bump_revision
+
+from .models import Order
+
+# この数までの保留グループは OK、超えると STOP に切り替える
+HOLD_RELEASE_LIMIT = 3
+
+
+def resolve_hold_status():
+    """
+    保留中の未完了グループを OK / STOP に切り替える
+
+    対象グループの注文はすべて（完了済み・保留以外の行も）新しい状態にします。
+
+    Returns:
+        list: 切り替えたグループIDのリスト（保留がなければ空）
+    """
+    with transaction.atomic():
+        # 保留中の未完了グループはグループの行（1グループ1行）から探す
+        pending_groups = list(
+            OrderGroup.objects.filter(app_label='ice', is_completed=False, status='hold')
+            .values_list('group_id', flat=True)
+        )
+        if not pending_groups:
+            return []
+        new_status = 'ok' if len(pending_groups) <= HOLD_RELEASE_LIMIT else 'stop'
+        # 以前と同じく、グループの全行（完了済みの行を含む）を切り替える
+        Order.objects.filter(group_id__in=pending_groups).update(
+            status=new_status,
+            status_modified_at=timezone.now(),
+        )
+        record_group_status(Order, pending_groups, new_status)
+        bump_revision('ice', 'status_changed', pending_groups)
+    return pending_groups
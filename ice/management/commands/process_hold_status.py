@@ -0,0 +1,55 @@
+"""
+保留（hold）中のアイス注文を OK / STOP に切り替える常駐コマンド
+
+アイスのリビジョンが進んだときだけ保留グループを確認するため、
+変更がない間はリビジョンの読み出し1クエリで待機します。
+
+実行例:
+    python manage.py process_hold_status            # 常駐（既定 2 秒間隔）
+    python manage.py process_hold_status --once     # 1回だけ実行
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from common.revisions import get_revision
+from ice.holds import resolve_hold_status
+
+
+class Command(BaseCommand):
+    help = '保留中のアイス注文を OK / STOP に切り替えます'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2.0, help='確認間隔（秒）')
+        parser.add_argument('--once', action='store_true', help='1回だけ実行して終了する')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            self._report(resolve_hold_status())
+            return
+
+        last_revision = None
+        while True:
+            close_old_connections()
+            last_revision = self._check(last_revision)
+            time.sleep(options['interval'])
+
+    def _check(self, last_revision):
+        """
+        リビジョンが進んでいれば保留を解除する
+
+        Returns:
+            int: 次回の比較に使うリビジョン（解除の前に読んだもの）
+        """
+        revision = get_revision('ice')
+        if revision != last_revision:
+            self._report(resolve_hold_status())
+        # 解除の後に読み直すと、その間に保留にされたグループを確認済みとして見落とすため、
+        # 解除の前に読んだ値を記録する（自身の切り替えで進んだ分は次回に1クエリで確認して終わる）
+        return revision
+
+    def _report(self, groups):
+        if groups:
+            self.stdout.write(f"保留を解除: {', '.join(groups)}")
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ice', '0007_order_status_modified_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['completed_at'], name='ice_completed_at_idx'),
+        ),
+    ]
@@ -66,5 +66,6 @@ class Order(models.Model):
             models.Index(fields=['clip_color', 'clip_number'], name='ice_clip_idx'),
             models.Index(fields=['group_id'], name='ice_group_idx'),
             models.Index(fields=['timestamp'], name='ice_timestamp_idx'),
+            models.Index(fields=['completed_at'], name='ice_completed_at_idx'),
             models.Index(fields=['size', 'is_completed'], name='ice_size_completed_idx'),
         ]
@@ -124,14 +124,11 @@ class IceOrderViewTest(TestCase):
 
     def test_prefixed_submit_order_group(self):
         """登録画面テンプレートが使う注文確定URLのテスト"""
-        session = self.client.session
-        session['temp_ice'] = [{
+        self.client.post('/ice/add_temp_ice/', {
             'size': 'S',
             'container': 'cup',
             'flavor1': 'jersey',
-            'flavor2': '',
-        }]
-        session.save()
+        })
 
         response = self.client.post('/ice/submit_order_group/', {
             'clip_color': 'yellow',
@@ -182,3 +179,203 @@ class IceOrderStatusTest(TestCase):
         
         updated_order = Order.objects.get(id=self.test_order.id)
         self.assertEqual(updated_order.status, 'hold')
+
+    def test_complete_group_json(self):
+        """グループ完了が UPDATE 1文で行われ、件数を JSON で返すこと"""
+        from common.revisions import get_revision
+
+        Order.objects.create(
+            group_id=self.test_order.group_id, size='S', container='cup',
+            flavor1='mango', clip_color='yellow', clip_number=1,
+        )
+        before = get_revision('ice')
+        response = self.client.post(
+            reverse('complete_group_prefixed', args=[self.test_order.group_id]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json()['completed'], 2)
+        self.assertEqual(get_revision('ice'), before + 1)
+        self.assertFalse(Order.objects.filter(group_id=self.test_order.group_id, is_completed=False).exists())
+        self.assertEqual(Order.objects.get(id=self.test_order.id).status, 'hold')
+
+        # 完了済みのグループを再送してもリビジョンは進まない
+        response = self.client.post(
+            reverse('complete_group_prefixed', args=[self.test_order.group_id]),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.json()['completed'], 0)
+        self.assertEqual(get_revision('ice'), before + 1)
+
+
+    def test_deshap_poll_does_not_release_hold(self):
+        """デシャップ画面のポーリングでは書き込みを行わないこと"""
+        from common.revisions import get_revision
+
+        self.client.post(reverse('update_status', args=[self.test_order.group_id, 'hold']))
+        before = get_revision('ice')
+        self.client.get(reverse('deshap'), {'format': 'json'})
+        self.client.get(reverse('deshap_changes'), {'since': before - 1})
+        self.assertEqual(Order.objects.get(id=self.test_order.id).status, 'hold')
+        self.assertEqual(get_revision('ice'), before)
+
+    def test_resolve_hold_status(self):
+        """保留グループが3つ以下なら OK、超えれば STOP に切り替わること"""
+        from io import StringIO
+        from django.core.management import call_command
+        from common.orders import update_group_status
+        from .holds import resolve_hold_status
+
+        update_group_status(Order, self.test_order.group_id, 'hold')
+        call_command('process_hold_status', '--once', stdout=StringIO())
+        self.assertEqual(Order.objects.get(id=self.test_order.id).status, 'ok')
+
+        for number in range(4):
+            Order.objects.create(
+                group_id=f'hold_{number}', size='S', container='cup', flavor1='jersey',
+                clip_color='white', clip_number=number + 1, status='hold',
+            )
+        self.assertEqual(len(resolve_hold_status()), 4)
+        self.assertFalse(Order.objects.filter(status='hold').exists())
+        self.assertEqual(Order.objects.filter(status='stop').count(), 4)
+        self.assertEqual(resolve_hold_status(), [])
+
+    def test_resolve_hold_status_updates_whole_group(self):
+        """保留の解除はグループの完了済みの行も含めて切り替えること"""
+        from io import StringIO
+        from django.core.management import call_command
+        from common.orders import complete_order, update_group_status
+
+        done = Order.objects.create(
+            group_id='whole_hold', size='S', container='cup', flavor1='jersey',
+            clip_color='white', clip_number=6,
+        )
+        Order.objects.create(
+            group_id='whole_hold', size='M', container='cup', flavor1='mango',
+            clip_color='white', clip_number=6,
+        )
+        complete_order(done, status='hold')
+        update_group_status(Order, 'whole_hold', 'hold')
+        call_command('process_hold_status', '--once', stdout=StringIO())
+        self.assertEqual(
+            set(Order.objects.filter(group_id='whole_hold').values_list('is_completed', 'status')),
+            {(True, 'ok'), (False, 'ok')},
+        )
+
+    def test_hold_worker_sees_hold_placed_during_resolve(self):
+        """解除の直後に保留にされたグループも次の確認で解除されること"""
+        from io import StringIO
+        from common.orders import update_group_status
+        from .management.commands.process_hold_status import Command
+
+        class HoldDuringResolve(Command):
+            placed = False
+
+            def _report(self, groups):
+                super()._report(groups)
+                if not self.placed:
+                    self.placed = True
+                    update_group_status(Order, 'late_hold', 'hold')
+
+        Order.objects.create(
+            group_id='late_hold', size='S', container='cup', flavor1='jersey',
+            clip_color='white', clip_number=5,
+        )
+        update_group_status(Order, self.test_order.group_id, 'hold')
+        command = HoldDuringResolve(stdout=StringIO())
+        last_revision = command._check(None)
+        self.assertEqual(Order.objects.get(group_id='late_hold').status, 'hold')
+        command._check(last_revision)
+        self.assertEqual(Order.objects.get(group_id='late_hold').status, 'ok')
+
+
+class IceLiveWindowTest(TestCase):
+    """ボード画面のライブウィンドウ取得のテスト"""
+
+    def setUp(self):
+        self.client = Client()
+        now = timezone.now()
+        self.active = Order.objects.create(
+            group_id='live_active', size='S', container='cup',
+            flavor1='jersey', clip_color='yellow', clip_number=1,
+        )
+        self.recent = Order.objects.create(
+            group_id='live_recent', size='S', container='cup',
+            flavor1='mango', clip_color='white', clip_number=2,
+            is_completed=True, completed_at=now - timezone.timedelta(seconds=5),
+        )
+        self.old = Order.objects.create(
+            group_id='live_old', size='S', container='cup',
+            flavor1='mint', clip_color='white', clip_number=3,
+            is_completed=True, completed_at=now - timezone.timedelta(hours=2),
+        )
+
+    def test_live_window_excludes_history(self):
+        """古い完了済みグループは読み込まれないこと"""
+        from common.orders import live_window_queryset
+        from ice.views import ORDER_STATUS_VALUES
+
+        group_ids = set(
+            live_window_queryset(Order, timezone.now(), ORDER_STATUS_VALUES)
+            .values_list('group_id', flat=True)
+        )
+        self.assertEqual(group_ids, {'live_active', 'live_recent'})
+
+    def test_partially_completed_group_stays_active(self):
+        """一部だけ完了したグループは未完了として表示されること"""
+        Order.objects.create(
+            group_id='live_active', size='S', container='cup',
+            flavor1='cassis', clip_color='yellow', clip_number=1,
+            is_completed=True, completed_at=timezone.now() - timezone.timedelta(hours=1),
+        )
+        response = self.client.get(reverse('ice_view'))
+        self.assertIn('live_active', response.context['grouped_orders'])
+        self.assertEqual(len(response.context['grouped_orders']['live_active']), 2)
+        self.assertIn('live_recent', response.context['completed_orders'])
+        self.assertNotIn('live_old', response.context['completed_orders'])
+
+
+class IceBoardChangesTest(TestCase):
+    """ボード画面の差分更新APIのテスト"""
+
+    def setUp(self):
+        self.client = Client()
+        for group_id, clip_number in (('diff_a', 1), ('diff_b', 2)):
+            Order.objects.create(
+                group_id=group_id, size='S', container='cup',
+                flavor1='jersey', clip_color='yellow', clip_number=clip_number,
+            )
+
+    def test_without_since_returns_all_groups(self):
+        """since がなければ表示中の全グループを返すこと"""
+        payload = self.client.get(reverse('ice_changes')).json()
+        self.assertTrue(payload['full'])
+        self.assertEqual([g['group_id'] for g in payload['groups']], ['diff_a', 'diff_b'])
+        self.assertIn('data-group-id="diff_a"', payload['groups'][0]['html'])
+        self.assertEqual(payload['order'], {'active': ['diff_a', 'diff_b'], 'completed': []})
+
+    def test_since_returns_only_changed_groups(self):
+        """since 以降に完了したグループだけを完了済みセクションの断片で返すこと"""
+        from common.revisions import get_revision
+
+        since = get_revision('ice')
+        self.client.post(reverse('complete_group_prefixed', args=['diff_b']))
+        payload = self.client.get(reverse('ice_changes'), {'since': since}).json()
+        self.assertFalse(payload['full'])
+        self.assertEqual(len(payload['groups']), 1)
+        self.assertEqual(payload['groups'][0]['group_id'], 'diff_b')
+        self.assertEqual(payload['groups'][0]['section'], 'completed')
+        self.assertEqual(payload['order'], {'active': ['diff_a'], 'completed': ['diff_b']})
+        self.assertEqual(payload['active_count'], 1)
+
+        latest = self.client.get(reverse('ice_changes'), {'since': payload['revision']}).json()
+        self.assertFalse(latest['changed'])
+
+    def test_deleted_group_is_reported(self):
+        """削除されたグループは section なしで返ること"""
+        from common.revisions import get_revision
+
+        since = get_revision('ice')
+        self.client.post(reverse('delete_group_from_deshap', args=['diff_a']))
+        payload = self.client.get(reverse('deshap_changes'), {'since': since}).json()
+        self.assertEqual(payload['groups'], [{'group_id': 'diff_a', 'section': None, 'html': ''}])
+        self.assertEqual(payload['order']['active'], ['diff_b'])
@@ -1,19 +1,24 @@
 from django.urls import path
 from ice import views
-from common import views_auth
+from common import views_auth, views_cart, views_events
 
 urlpatterns = [
     path('ice/register/', views.register_view, name='ice_register_prefixed'),
     path('ice/register', views.register_view),
     path('ice/ice/', views.ice_view, name='ice_view_prefixed'),
     path('ice/ice', views.ice_view),
+    path('ice/ice/changes/', views.ice_changes, name='ice_changes'),
     path('ice/deshap/', views.deshap_view, name='deshap_prefixed'),
     path('ice/deshap', views.deshap_view),
+    path('ice/deshap/changes/', views.deshap_changes, name='deshap_changes'),
     path('ice/submit_order_group/', views.submit_order_group, name='submit_order_group_prefixed'),
     path('ice/add_temp_ice/', views.add_temp_ice, name='add_temp_ice_prefixed'),
     path('ice/add_temp_pudding/', views.add_temp_pudding, name='add_temp_pudding_prefixed'),
     path('ice/delete_temp_ice/<int:index>/', views.delete_temp_ice, name='delete_temp_ice_prefixed'),
     path('ice/delete_all_pudding/', views.delete_all_pudding, name='delete_all_pudding_prefixed'),
+    path('ice/cart/', views_cart.cart_detail, {'app_label': 'ice'}, name='ice_cart'),
+    path('ice/cart/<int:item_id>/delete/', views_cart.cart_remove, {'app_label': 'ice'}, name='ice_cart_remove'),
+    path('ice/cart/clear/', views_cart.cart_clear, {'app_label': 'ice'}, name='ice_cart_clear'),
     path('ice/complete/<int:order_id>/', views.complete_order, name='complete_order_prefixed'),
     path('ice/detail/<int:order_id>/', views.order_detail, name='order_detail_prefixed'),
     path('ice/complete_group/<str:group_id>/', views.complete_group, name='complete_group_prefixed'),
@@ -21,6 +26,7 @@ urlpatterns = [
     path('ice/update_status/<str:group_id>/<str:new_status>/', views.update_status, name='update_status_prefixed'),
     path('ice/delete_group_from_deshap/<str:group_id>/', views.delete_group_from_deshap, name='delete_group_from_deshap_prefixed'),
     path('ice/api/active_count/', views.api_active_count, name='api_active_count_prefixed'),
+    path('ice/events/', views_events.order_event_stream, {'app_label': 'ice'}, name='ice_events'),
     path('', views.role_select, name='role_select'),
     path('register/', views.register_view, name='register_view'),
     path('register/', views.register_view, name='register'),  # backward compatibility
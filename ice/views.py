@@ -1,15 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse, HttpResponse
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_protect, csrf_exempt
 from django.views.decorators.http import require_POST
-from collections import defaultdict
-from datetime import timedelta
-from .models import Order, FLAVOR_CHOICES
+from .models import Order, FLAVOR_CHOICES, ORDER_STATUS_CHOICES
+from common.board import alive_board, live_board
+from common.board_changes import board_changes_response
+from common.carts import Cart, cart_context, cart_response
+from common.orders import board_metrics, complete_group as complete_orders, update_group_status
+from common.orders import complete_order as complete_single_order
+from common.orders import submit_order_group as submit_orders
+from common.poll_cache import arender, cached_poll
+from common.revisions import aget_revision, get_revision, unchanged_response
 from food.models import FoodOrder
-from django.db.models import Count, Max, Q
-import time
+from common.idempotency import new_idempotency_key, replayed_submission, request_key
+from common.ids import new_group_id
 
 # 共有パスコード
 SHARED_PASSCODE = "1234"
@@ -21,91 +28,55 @@ FLAVORS = [
     "抹茶", "いちご", "ほうじ茶", "ゆず",
 ]
 
+# ボードに表示する未完了グループの状態値一覧（live_group_filter() が OrderGroup の状態で絞り込む）
+ORDER_STATUS_VALUES = [value for value, _ in ORDER_STATUS_CHOICES]
 
-def _group_orders_by_id(orders):
-    grouped = {}
-    for order in orders:
-        grouped.setdefault(order.group_id, []).append(order)
-    return grouped
-
-
-def _separate_active_completed(grouped_orders, now):
-    active = {}
-    completed = {}
-    for group_id, orders in grouped_orders.items():
-        sorted_orders = sorted(orders, key=lambda o: o.timestamp)
-        if all(o.is_completed for o in sorted_orders):
-            completed_times = [o.completed_at for o in sorted_orders if o.completed_at]
-            if completed_times and now - max(completed_times) <= timedelta(seconds=30):
-                completed[group_id] = sorted_orders
-        else:
-            active[group_id] = sorted_orders
-    return active, completed
-
-
-def _update_hold_status():
-    pending_groups = list(
-        Order.objects.filter(is_completed=False, status='hold')
-        .values_list('group_id', flat=True)
-        .distinct()
-    )
-    if not pending_groups:
-        return
-    new_status = 'ok' if len(pending_groups) <= 3 else 'stop'
-    now = timezone.now()
-    Order.objects.filter(group_id__in=pending_groups).update(
-        status=new_status,
-        status_modified_at=now,
-    )
 
+def _live_board(revision, now):
+    """ボード表示対象（未完了・直近完了）のグループをリビジョン単位のキャッシュから取得"""
+    return live_board(Order, revision, now, status_values=ORDER_STATUS_VALUES)
 
-def _find_recent_groups(grouped_orders, threshold_seconds=3, reference_time=None):
-    now = reference_time or timezone.now()
-    recent_ids = []
-    for group_id, orders in grouped_orders.items():
-        if all(not o.is_completed for o in orders):
-            if any((now - o.timestamp).total_seconds() < threshold_seconds for o in orders):
-                recent_ids.append(group_id)
-    return recent_ids
-
-
-def _count_pudding_by_group(group_orders):
-    return {
-        group_id: sum(1 for o in orders if o.is_pudding)
-        for group_id, orders in group_orders.items()
-    }
 
+async def _alive_board(revision, now):
+    """_live_board() の非同期版（ポーリングビュー用）"""
+    return await alive_board(Order, revision, now, status_values=ORDER_STATUS_VALUES)
 
-def _count_active_order_items(active_orders):
-    return sum(
-        1
-        for orders in active_orders.values()
-        for order in orders
-        if not order.is_completed
-    )
 
+def _render_group(request, template_name, group):
+    """1グループ分のカードを HTML 断片として描画する"""
+    return render_to_string(template_name, {'group': group}, request=request)
 
-def _calculate_ice_refresh_metrics():
-    aggregates = Order.objects.aggregate(
-        active_items=Count('id', filter=Q(is_completed=False)),
-        latest_id=Max('id'),
-        latest_status_ts=Max('status_modified_at'),
-    )
-    active_order_total = aggregates['active_items'] or 0
-    latest_order_id = aggregates['latest_id'] or 0
-    latest_status_ts = aggregates['latest_status_ts']
-    status_marker = (
-        str(latest_status_ts.timestamp())
-        if latest_status_ts
-        else '0'
+
+def _ice_board_changes(request, template_name, revision, now):
+    """ボード画面の差分（変更グループのカード）を JSON で返す"""
+    active_groups, completed_groups = _live_board(revision, now)
+    metrics = board_metrics(active_groups, revision)
+    return board_changes_response(
+        request, 'ice', revision,
+        {g.group_id: g for g in active_groups},
+        {g.group_id: g for g in completed_groups},
+        lambda group_id, group, section: _render_group(request, template_name, group),
+        extra={
+            'value': metrics['refresh_value'],
+            'refresh_value': metrics['refresh_value'],
+            'active_order_total': metrics['active_order_total'],
+            'active_count': len(active_groups),
+        },
     )
-    refresh_value = f"{active_order_total}:{latest_order_id}:{status_marker}"
-    return {
-        'active_order_total': active_order_total,
-        'latest_order_id': latest_order_id,
-        'latest_status_marker': status_marker,
-        'refresh_value': refresh_value,
-    }
+
+
+def _find_recent_groups(active_groups, threshold_seconds=3, reference_time=None):
+    now = reference_time or timezone.now()
+    return [
+        g.group_id
+        for g in active_groups
+        if g.open_count == len(g.orders)
+        and any((now - o.timestamp).total_seconds() < threshold_seconds for o in g.orders)
+    ]
+
+
+def _wants_json(request):
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json'
 
 
 def role_select(request):
@@ -118,7 +89,7 @@ def role_select(request):
 
 @csrf_exempt
 def add_temp_ice(request):
-    """仮注文をセッションに追加"""
+    """仮注文に追加（quantity 個）"""
     if request.method != 'POST':
         return JsonResponse(
             {
@@ -144,36 +115,26 @@ def add_temp_ice(request):
         'container': container,
     }
 
-    temp_ice = request.session.get('temp_ice', [])
-    temp_ice.append(ice)
-    request.session['temp_ice'] = temp_ice
-    request.session.modified = True
-
-    clip_color = request.POST.get('clip_color')
-    clip_number = request.POST.get('clip_number')
-    if clip_color and clip_number:
-        request.session['clip_color'] = clip_color
-        request.session['clip_number'] = clip_number
-        request.session.modified = True
-
-    wants_json = (
-        request.headers.get('x-requested-with') == 'XMLHttpRequest'
-        or 'application/json' in request.headers.get('accept', '')
-    )
-    if wants_json:
-        return JsonResponse({'status': 'ok'})
-
-    return redirect('register_view')
+    cart = Cart(request, 'ice')
+    cart.add(ice, count=_cart_quantity(request))
+    return cart_response(request, cart)
 
 
 @require_POST
 def add_temp_pudding(request):
-    """仮注文リストにアフォガードプリンを追加"""
-    temp_ice = request.session.get('temp_ice', [])
-    temp_ice.append({'is_pudding': True})
-    request.session['temp_ice'] = temp_ice
-    request.session.modified = True
-    return HttpResponse("ok")
+    """仮注文にアフォガードプリンを追加（quantity 個）"""
+    cart = Cart(request, 'ice')
+    cart.add({'is_pudding': True}, count=_cart_quantity(request))
+    return cart_response(request, cart)
+
+
+def _cart_quantity(request, maximum=5):
+    """1回の追加で入れる個数（レジ画面の個数ボタンは 1〜5）"""
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+    except (TypeError, ValueError):
+        return 1
+    return max(1, min(maximum, quantity))
 
 
 @csrf_exempt
@@ -182,7 +143,13 @@ def submit_order_group(request):
     if request.method != 'POST':
         return redirect('register_view')
     
-    temp_ice_list = request.session.get('temp_ice', [])
+    # 確定済みの送信の再送（Wi-Fi の切断など）は何も登録しない
+    if replayed_submission(request, 'ice'):
+        messages.info(request, 'この注文は確定済みです。')
+        return redirect('register_view')
+
+    cart = Cart(request, 'ice')
+    temp_ice_list = cart.items()
     clip_color = request.POST.get('clip_color')
     clip_number_str = request.POST.get('clip_number')
     note = request.POST.get('note', "")
@@ -198,147 +165,84 @@ def submit_order_group(request):
         messages.warning(request, 'クリップ番号が正しくありません。')
         return redirect('register_view')
     
-    # グループID生成
-    group_id = f"{clip_color}-{clip_number}-{int(time.time() * 1000)}"
-    
-    # 状態判定
-    has_stop = Order.objects.filter(is_completed=False, status='stop').exists()
-    status = 'stop' if has_stop else 'ok'
-    auto_stopped = has_stop
+    # グループID生成（ワーカー・ノードをまたいで重複しない採番）
+    group_id = new_group_id()
     
-    # 注文をDBに保存
-    for ice in temp_ice_list:
-        if ice.get('is_pudding'):
-            Order.objects.create(
-                is_pudding=True,
-                clip_color=clip_color,
-                clip_number=clip_number,
-                group_id=group_id,
-                status=status,
-                is_auto_stopped=auto_stopped,
-                note=note
-            )
-        else:
-            Order.objects.create(
-                size=ice['size'],
-                container=ice['container'],
-                flavor1=ice['flavor1'],
-                flavor2=ice.get('flavor2'),
-                clip_color=clip_color,
-                clip_number=clip_number,
-                group_id=group_id,
-                status=status,
-                is_auto_stopped=auto_stopped,
-                note=note,
-            )
+    # カートの行を組み立てる（STOP 判定と登録は共通処理で1トランザクションにまとめる）
+    try:
+        items = [
+            {'is_pudding': True} if ice.get('is_pudding') else {
+                'size': ice['size'],
+                'container': ice['container'],
+                'flavor1': ice['flavor1'],
+                'flavor2': ice.get('flavor2'),
+            }
+            for ice in temp_ice_list
+        ]
+    except KeyError:
+        messages.warning(request, '仮注文の内容が正しくありません。')
+        return redirect('register_view')
+
+    submit_orders(
+        Order, group_id, items,
+        idempotency_key=request_key(request),
+        clip_color=clip_color,
+        clip_number=clip_number,
+        note=note,
+    )
     
-    # セッション初期化
-    request.session['temp_ice'] = []
-    request.session.pop('clip_color', None)
-    request.session.pop('clip_number', None)
-    request.session.modified = True
+    # 仮注文を空にする
+    cart.clear()
     return redirect('register_view')
 
 
 def register_view(request):
     """注文登録画面を表示"""
-    temp_ice = request.session.get('temp_ice', [])
-    
-    # アフォガードプリンの数をカウント
-    pudding_count = sum(1 for item in temp_ice if item.get('is_pudding'))
-    
     # FLAVOR_CHOICESから日本語名のみを抽出
     flavors = [label for value, label in FLAVOR_CHOICES]
-    
-    # 容器表示用マップ
-    container_map = {
-        'cup': 'カップ',
-        'cone': 'コーン'
-    }
-    
+
     context = {
         'flavors': flavors,
-        'container_map': container_map,
-        'temp_ice': temp_ice,
-        'pudding_count': pudding_count,
+        **cart_context(Cart(request, 'ice').items()),
+        'idempotency_key': new_idempotency_key(),
     }
     
     return render(request, 'ice/register.html', context)
 
 
-def ice_view(request):
+@cached_poll('ice')
+async def ice_view(request):
     """アイスクリーム一覧画面を表示"""
     now = timezone.localtime()
+    revision = await aget_revision('ice')
     
-    # 全注文を取得
-    all_orders = Order.objects.order_by('timestamp')
-    
-    # グループ化
-    grouped_orders = {}
-    for order in all_orders:
-        grouped_orders.setdefault(order.group_id, []).append(order)
-    
-    # 未完了・完了注文を分離
-    active_orders = {}
-    completed_orders = {}
-    
-    for group_id, orders in grouped_orders.items():
-        # 経過時間を計算
-        for o in orders:
-            o.elapsed_seconds = int((now - o.timestamp).total_seconds())
-            o.elapsed_minutes = o.elapsed_seconds // 60
-        
-        if all(o.is_completed for o in orders):
-            latest_completion = max(
-                (o.completed_at for o in orders if o.completed_at), 
-                default=None
-            )
-            if latest_completion and now - latest_completion <= timedelta(seconds=30):
-                completed_orders[group_id] = orders
-        else:
-            active_orders[group_id] = orders
-    
-    active_count = len(active_orders)
-    metrics = _calculate_ice_refresh_metrics()
+    # 表示対象（未完了・直近完了）のグループを取得（リビジョンが同じ間は集計を共有）
+    active_groups, completed_groups = await _alive_board(revision, now)
+
+    active_count = len(active_groups)
+    metrics = board_metrics(active_groups, revision)
     active_order_total = metrics['active_order_total']
     refresh_value = metrics['refresh_value']
-    
-    # プリン数を計算
-    pudding_count_active = sum(
-        sum(1 for o in orders if o.is_pudding)
-        for orders in active_orders.values()
-    )
-    pudding_count_completed = sum(
-        sum(1 for o in orders if o.is_pudding)
-        for orders in completed_orders.values()
-    )
-    
-    # 一覧上で「どのグループにプリンが何個あるか」を表示するため、グループ単位の個数も計算する。
-    pudding_counts_active_by_group = {
-        group_id: sum(1 for o in orders if o.is_pudding)
-        for group_id, orders in active_orders.items()
-    }
-    pudding_counts_completed_by_group = {
-        group_id: sum(1 for o in orders if o.is_pudding)
-        for group_id, orders in completed_orders.items()
-    }
 
     context = {
-        'grouped_orders': active_orders,
-        'completed_orders': completed_orders,
+        'active_groups': active_groups,
+        'completed_groups': completed_groups,
+        'grouped_orders': {g.group_id: g.orders for g in active_groups},
+        'completed_orders': {g.group_id: g.orders for g in completed_groups},
         'now': now,
         'active_count': active_count,
         'active_order_total': active_order_total,
-    'refresh_value': refresh_value,
-        'pudding_count_active': pudding_count_active,
-        'pudding_count_completed': pudding_count_completed,
-        'pudding_counts_active_by_group': pudding_counts_active_by_group,
-        'pudding_counts_completed_by_group': pudding_counts_completed_by_group,
+        'refresh_value': refresh_value,
+        'revision': revision,
+        'pudding_count_active': sum(g.pudding_count for g in active_groups),
+        'pudding_count_completed': sum(g.pudding_count for g in completed_groups),
     }
     
-    context['is_logged_in'] = request.session.get('logged_in', False)
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    context['is_logged_in'] = await request.session.aget('logged_in', False)
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': refresh_value,
             'refresh_value': refresh_value,
             'active_order_total': active_order_total,
@@ -346,68 +250,44 @@ def ice_view(request):
             'timestamp': now.isoformat(),
         })
 
-    return render(request, 'ice/ice.html', context)
+    return await arender(request, 'ice/ice.html', context)
+
+
+def ice_changes(request):
+    """アイス一覧画面の差分更新用API（?since= 以降に変わったグループのみ）"""
+    revision = get_revision('ice')
+    unchanged = unchanged_response(request, revision)
+    if unchanged:
+        return unchanged
+    return _ice_board_changes(request, 'ice/_ice_group.html', revision, timezone.localtime())
 
 
 @require_POST
 def complete_order(request, order_id):
     """指定IDの注文を完了"""
     order = get_object_or_404(Order, id=order_id)
-    order.is_completed = True
-    order.completed_at = timezone.now()
-    order.status = 'hold'
-    order.save()
-    
+    complete_single_order(order, status='hold')
+
     return redirect('ice_view')
 
 
 @csrf_exempt
 def complete_group(request, group_id):
-    """指定グループの注文を一括完了"""
+    """
+    指定グループの注文を一括完了
+
+    未完了の注文だけを UPDATE 1文で完了にし、完了した件数を返します。
+    実際に完了した注文があるときだけリビジョンを1つ進めます。
+    """
     if request.method == 'POST':
-        try:
-            orders = Order.objects.filter(group_id=group_id, is_completed=False)
-            now = timezone.now()
-            
-            for order in orders:
-                order.is_completed = True
-                order.completed_at = now
-                order.status = 'hold'
-                order.save()
-        except Exception as e:
-            print("[complete_group error]", e)
+        now = timezone.now()
+        completed = complete_orders(Order, group_id, now, status='hold', status_modified_at=now)
+        if _wants_json(request):
+            return JsonResponse({'status': 'ok', 'group_id': group_id, 'completed': completed})
 
     return redirect('ice_view')
 
 
-def get_grouped_active_orders():
-    """未完了注文をグループごとにまとめて返す"""
-    from collections import defaultdict
-    from .models import Order
-    
-    grouped = defaultdict(list)
-    now_time = timezone.now()
-    
-    active_orders = Order.objects.filter(is_completed=False).order_by('timestamp')
-    for order in active_orders:
-        delta = now_time - order.timestamp
-        order.elapsed_minutes = int(delta.total_seconds() // 60)
-        grouped[order.group_id].append(order)
-    
-    return grouped
-
-
-def get_grouped_completed_orders():
-    """完了注文をグループごとにまとめて返す"""
-    completed_orders = Order.objects.filter(is_completed=True).order_by('-completed_at')
-    grouped = defaultdict(list)
-    
-    for order in completed_orders:
-        grouped[order.group_id].append(order)
-    
-    return grouped
-
-
 @csrf_protect
 def delete_group(request, group_id):
     """指定グループの注文を削除"""
@@ -436,45 +316,42 @@ def order_detail(request, order_id):
 
 
 def delete_temp_ice(request, index):
-    """仮注文リストから指定インデックスの注文を削除"""
-    temp_ice = request.session.get('temp_ice', [])
-    if 0 <= index < len(temp_ice):
-        del temp_ice[index]
-        request.session['temp_ice'] = temp_ice
-        request.session.modified = True
-
-    return redirect('register_view')
+    """仮注文から指定インデックスの注文を削除"""
+    cart = Cart(request, 'ice')
+    cart.remove_at(index)
+    return cart_response(request, cart)
 
 
-def deshap_view(request):
-    """デシャップ画面を表示"""
-    _update_hold_status()
+@cached_poll('ice')
+async def deshap_view(request):
+    """デシャップ画面を表示（保留の解除は process_hold_status コマンドが行う）"""
     now = timezone.now()
+    revision = await aget_revision('ice')
 
-    grouped_orders = _group_orders_by_id(Order.objects.order_by('timestamp'))
-    active_orders, completed_orders = _separate_active_completed(grouped_orders, now)
+    active_groups, completed_groups = await _alive_board(revision, now)
 
-    active_count = len(active_orders)
-    metrics = _calculate_ice_refresh_metrics()
+    active_count = len(active_groups)
+    metrics = board_metrics(active_groups, revision)
     active_order_total = metrics['active_order_total']
-    newly_created_group_ids = _find_recent_groups(grouped_orders, reference_time=now)
-    pudding_counts_active_by_group = _count_pudding_by_group(active_orders)
-    pudding_counts_completed_by_group = _count_pudding_by_group(completed_orders)
+    newly_created_group_ids = _find_recent_groups(active_groups, reference_time=now)
 
     context = {
-        'grouped_orders': active_orders,
-        'completed_orders': completed_orders,
+        'active_groups': active_groups,
+        'completed_groups': completed_groups,
+        'grouped_orders': {g.group_id: g.orders for g in active_groups},
+        'completed_orders': {g.group_id: g.orders for g in completed_groups},
         'now': now,
         'active_count': active_count,
         'active_order_total': active_order_total,
         'newly_created_group_ids': newly_created_group_ids,
-        'pudding_counts_active_by_group': pudding_counts_active_by_group,
-        'pudding_counts_completed_by_group': pudding_counts_completed_by_group,
         'refresh_value': metrics['refresh_value'],
+        'revision': revision,
     }
 
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': metrics['refresh_value'],
             'refresh_value': metrics['refresh_value'],
             'active_order_total': active_order_total,
@@ -482,27 +359,30 @@ def deshap_view(request):
             'timestamp': now.isoformat(),
         })
 
-    return render(request, 'ice/deshap.html', context)
+    return await arender(request, 'ice/deshap.html', context)
+
+
+def deshap_changes(request):
+    """デシャップ画面の差分更新用API（?since= 以降に変わったグループのみ）"""
+    revision = get_revision('ice')
+    unchanged = unchanged_response(request, revision)
+    if unchanged:
+        return unchanged
+    return _ice_board_changes(request, 'ice/_deshap_group.html', revision, timezone.now())
 
 
 def delete_all_pudding(request):
-    """仮注文リストからアフォガードプリンを全て削除"""
-    temp_ice = request.session.get('temp_ice', [])
-    temp_ice = [item for item in temp_ice if not item.get('is_pudding')]
-    request.session['temp_ice'] = temp_ice
-    request.session.modified = True
-    
-    return HttpResponse("ok")
+    """仮注文からアフォガードプリンを全て削除"""
+    cart = Cart(request, 'ice')
+    cart.clear(is_pudding=True)
+    return cart_response(request, cart)
 
 
 @csrf_exempt
 def update_status(request, group_id, new_status):
     """指定グループの状態を更新"""
     if request.method == 'POST':
-        Order.objects.filter(group_id=group_id).update(
-            status=new_status,
-            status_modified_at=timezone.now(),
-        )
+        update_group_status(Order, group_id, new_status)
 
     return redirect('deshap')
 
@@ -513,9 +393,9 @@ def health_check(request):
     return HttpResponse("OK")
 
 
-def api_active_count(request):
+async def api_active_count(request):
     """未完了オーダー数を返すAPI"""
     del request
-    active_count = Order.objects.filter(is_completed=False).count()
+    active_count = await Order.objects.filter(is_completed=False).acount()
     return JsonResponse({'active_count': active_count})
 
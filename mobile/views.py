@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect
 from food.models import FoodOrder
-import time
+from common.orders import submit_order_group
+from common.idempotency import request_key
+from common.ids import new_group_id
 
 
 def mobile_order_entry(request):
@@ -16,6 +18,9 @@ def mobile_order_entry(request):
 def submit_mobile_order(request):
     """
     モバイル注文を処理
+
+    idempotency_key（フォーム）または Idempotency-Key ヘッダーが同じ再送は、
+    新しく登録せずに完了画面へ進みます。
     """
     if request.method == 'POST':
         menu = request.POST.get('menu')
@@ -34,18 +39,21 @@ def submit_mobile_order(request):
         except (ValueError, TypeError):
             return redirect('mobile_order')
         
-        group_id = f"{clip_color}-{clip_number}-{int(time.time() * 1000)}"
+        group_id = new_group_id()
         
-        for _ in range(quantity):
-            FoodOrder.objects.create(
-                menu=menu,
-                quantity=1,
-                clip_color=clip_color,
-                clip_number=clip_number,
-                group_id=group_id,
-                status='ok',
-                note=note,
-            )
+        if quantity < 1:
+            return redirect('mobile_order')
+
+        # 1個ずつの行を1回の bulk_create でまとめて登録する
+        submit_order_group(
+            FoodOrder, group_id, [{'menu': menu, 'quantity': 1}] * quantity,
+            inherit_stop=False,
+            idempotency_key=request_key(request),
+            clip_color=clip_color,
+            clip_number=clip_number,
+            status='ok',
+            note=note,
+        )
         
         return redirect('mobile_order_complete')
     
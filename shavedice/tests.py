@@ -75,6 +75,19 @@ class ShavedIceOrderViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, self.test_order.group_id)
     
+    def test_kitchen_changes_returns_group_fragment(self):
+        """差分更新APIがグループ単位の HTML 断片を返すこと"""
+        from common.revisions import get_revision
+
+        since = get_revision('shavedice')
+        ShavedIceOrder.objects.create(
+            flavor='ichigo', clip_color='white', clip_number=2, group_id='view_test_002'
+        )
+        payload = self.client.get(reverse('shavedice_kitchen_changes'), {'since': since}).json()
+        self.assertEqual([g['group_id'] for g in payload['groups']], ['view_test_002'])
+        self.assertIn('data-group-id="view_test_002"', payload['groups'][0]['html'])
+        self.assertEqual(payload['order']['active'], ['view_test_001', 'view_test_002'])
+
     def test_complete_shavedice_order(self):
         """かき氷注文完了処理のテスト"""
         response = self.client.post(reverse('complete_shavedice_order', args=[self.test_order.id]))
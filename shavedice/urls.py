@@ -1,9 +1,11 @@
 from django.urls import path
 from . import views
+from common import views_cart, views_events
 
 urlpatterns = [
     path('register/', views.shavedice_register, name='shavedice_register'),
     path('kitchen/', views.shavedice_kitchen, name='shavedice_kitchen'),
+    path('kitchen/changes/', views.shavedice_kitchen_changes, name='shavedice_kitchen_changes'),
     path('add_temp_ice/', views.add_temp_ice, name='add_temp_ice'),
     path('detail/<int:order_id>/', views.order_detail, name='order_detail'),
     path('submit_order_group/', views.submit_order_group, name='submit_order_group'),
@@ -11,8 +13,13 @@ urlpatterns = [
     path('complete_group/<str:group_id>/', views.complete_group, name='complete_group'),
     path('delete_group/<str:group_id>/', views.delete_group, name='delete_group'),
     path('delete_temp_ice/<int:index>/', views.delete_temp_ice, name='delete_temp_ice'),
+    path('cart/', views_cart.cart_detail, {'app_label': 'shavedice'}, name='shavedice_cart'),
+    path('cart/<int:item_id>/delete/', views_cart.cart_remove, {'app_label': 'shavedice'}, name='shavedice_cart_remove'),
+    path('cart/clear/', views_cart.cart_clear, {'app_label': 'shavedice'}, name='shavedice_cart_clear'),
     path('ice/', views.ice_view, name='ice'),
     path('deshap/', views.shavedice_deshap_view, name='shavedice_deshap'),
+    path('deshap/changes/', views.shavedice_deshap_changes, name='shavedice_deshap_changes'),
     path('update_status/<str:group_id>/<str:new_status>/', views.shavedice_update_status, name='shavedice_update_status'),
     path('waittime/', views.wait_time_view, name='shavedice_wait_time'),
+    path('events/', views_events.order_event_stream, {'app_label': 'shavedice'}, name='shavedice_events'),
 ]
@@ -1,83 +1,95 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse, HttpResponse
+from django.template.loader import render_to_string
 from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 from collections import defaultdict
-from datetime import timedelta
 from django.contrib import messages
 from .models import ShavedIceOrder
 from food.models import FoodOrder
-from django.db.models import Count, Max, Q
-import time
+from common.board import alive_board, live_board
+from common.board_changes import board_changes_response
+from common.carts import Cart, cart_context, cart_response
+from common.orders import (
+    board_metrics, complete_group as complete_orders, complete_order as complete_single_order,
+    submit_order_group as submit_orders, update_group_status,
+)
+from common.poll_cache import arender, cached_poll
+from common.service_times import aestimate_wait
+from common.revisions import aget_revision, get_revision, unchanged_response
+from common.idempotency import new_idempotency_key, replayed_submission, request_key
+from common.ids import new_group_id
 
 
-def _calculate_shavedice_refresh_metrics():
-    aggregates = ShavedIceOrder.objects.aggregate(
-        active_items=Count('id', filter=Q(is_completed=False)),
-        latest_id=Max('id'),
-        latest_status_ts=Max('status_modified_at'),
-    )
-    active_order_total = aggregates['active_items'] or 0
-    latest_order_id = aggregates['latest_id'] or 0
-    latest_status_ts = aggregates['latest_status_ts']
-    status_marker = (
-        str(latest_status_ts.timestamp()) if latest_status_ts else '0'
-    )
-    refresh_value = f"{active_order_total}:{latest_order_id}:{status_marker}"
-    return {
-        'active_order_total': active_order_total,
-        'latest_order_id': latest_order_id,
-        'latest_status_marker': status_marker,
-        'refresh_value': refresh_value,
-    }
+def _wants_json(request):
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json'
 
 
-def _get_order_context():
+def _get_order_context(revision):
     """キッチンビューとデシャップビューで共通のコンテキストを取得する"""
     now = timezone.localtime()
-    
-    # 注文を取得
-    active_orders = ShavedIceOrder.objects.filter(is_completed=False).order_by('timestamp')
-    completed_orders = ShavedIceOrder.objects.filter(is_completed=True).order_by('-completed_at')
-    
-    # グループ化
-    grouped_active = {}
-    grouped_completed = {}
-    
-    for order in active_orders:
-        delta = now - order.timestamp
-        order.elapsed_minutes = int(delta.total_seconds() // 60)
-        grouped_active.setdefault(order.group_id, []).append(order)
-    
-    for order in completed_orders:
-        # 完了から30秒以内のみ表示
-        if order.completed_at and (now - order.completed_at).total_seconds() <= 30:
-            grouped_completed.setdefault(order.group_id, []).append(order)
-            
-    metrics = _calculate_shavedice_refresh_metrics()
+
+    # 表示対象（未完了・直近完了）のグループを取得（リビジョンが同じ間は集計を共有）
+    active_groups, completed_groups = live_board(ShavedIceOrder, revision, now)
+    return _order_context(revision, now, active_groups, completed_groups)
+
+
+async def _aget_order_context(revision):
+    """_get_order_context() の非同期版（ポーリングビュー用）"""
+    now = timezone.localtime()
+    active_groups, completed_groups = await alive_board(ShavedIceOrder, revision, now)
+    return _order_context(revision, now, active_groups, completed_groups)
+
+
+def _order_context(revision, now, active_groups, completed_groups):
+    completed_groups.sort(key=lambda g: g.latest_completed_at, reverse=True)
+    metrics = board_metrics(active_groups, revision)
 
     return {
-        "grouped_orders": grouped_active,
-        "completed_orders": grouped_completed,
+        "active_groups": active_groups,
+        "completed_groups": completed_groups,
+        "grouped_orders": {g.group_id: g.orders for g in active_groups},
+        "completed_orders": {g.group_id: g.orders for g in completed_groups},
         "now": now,
-        "active_count": len(grouped_active),
+        "active_count": len(active_groups),
         "active_order_total": metrics['active_order_total'],
         "refresh_value": metrics['refresh_value'],
+        "revision": revision,
     }
 
 
+def _shavedice_board_changes(request, template_name, revision):
+    """ボード画面の差分（変更グループのカード）を JSON で返す"""
+    context = _get_order_context(revision)
+
+    def render_group(group_id, group, section):
+        return render_to_string(template_name, {'group': group}, request=request)
+
+    return board_changes_response(
+        request, 'shavedice', revision,
+        {g.group_id: g for g in context['active_groups']},
+        {g.group_id: g for g in context['completed_groups']},
+        render_group,
+        extra={
+            'value': context['refresh_value'],
+            'refresh_value': context['refresh_value'],
+            'active_order_total': context['active_order_total'],
+            'active_count': context['active_count'],
+        },
+    )
+
+
 def shavedice_register(request):
     """かき氷注文登録画面を表示"""
-    temp_ice = request.session.get("temp_ice", [])
-    
     flavor_choices = ShavedIceOrder.FLAVOR_CHOICES
     
     context = {
-        "temp_ice": temp_ice,
+        **cart_context(Cart(request, 'shavedice').items()),
         "flavor_choices": flavor_choices,
         "clip_numbers_first": list(range(1, 9)),
         "clip_numbers_second": list(range(9, 17)),
+        "idempotency_key": new_idempotency_key(),
     }
     
     return render(request, "shavedice/shavedice_register.html", context)
@@ -85,7 +97,7 @@ def shavedice_register(request):
 
 @csrf_exempt
 def add_temp_ice(request):
-    """仮注文をセッションに追加"""
+    """仮注文に追加（quantity 個）"""
     if request.method != 'POST':
         return JsonResponse({
             'status': 'error', 
@@ -99,26 +111,15 @@ def add_temp_ice(request):
         messages.error(request, 'フレーバーを選択してください。')
         return redirect('shavedice_register')
     
-    # 仮注文を作成
-    ice = {'flavor': flavor}
-    temp_ice = request.session.get('temp_ice', [])
-    temp_ice.append(ice)
-    request.session['temp_ice'] = temp_ice
-    request.session.modified = True
-    
-    # クリップ情報も保存
-    clip_color = request.POST.get('clip_color')
-    clip_number = request.POST.get('clip_number')
-    if clip_color and clip_number:
-        request.session['clip_color'] = clip_color
-        request.session['clip_number'] = clip_number
-        request.session.modified = True
-    
-    wants_json = request.headers.get('x-requested-with') == 'XMLHttpRequest' or 'application/json' in request.headers.get('accept', '')
-    if wants_json:
-        return JsonResponse({'status': 'ok'})
-    
-    return redirect('shavedice_register')
+    try:
+        quantity = max(1, min(5, int(request.POST.get('quantity', 1))))
+    except (TypeError, ValueError):
+        quantity = 1
+
+    # 仮注文を作成（INSERT 1回）
+    cart = Cart(request, 'shavedice')
+    cart.add({'flavor': flavor}, count=quantity)
+    return cart_response(request, cart)
 
 
 @csrf_exempt
@@ -127,7 +128,12 @@ def submit_order_group(request):
     if request.method != 'POST':
         return redirect('shavedice_register')
     
-    temp_ice_list = request.session.get('temp_ice', [])
+    # 確定済みの送信の再送（Wi-Fi の切断など）は何も登録しない
+    if replayed_submission(request, 'shavedice'):
+        return redirect('shavedice_register')
+
+    cart = Cart(request, 'shavedice')
+    temp_ice_list = cart.items()
     clip_color = request.POST.get('clip_color', 'white')
     clip_number_str = request.POST.get('clip_number', '0')
     note = request.POST.get('note', "")
@@ -141,115 +147,79 @@ def submit_order_group(request):
     except (ValueError, TypeError):
         clip_number = 0
     
-    # グループID生成
-    group_id = f"{clip_color}-{clip_number}-{int(time.time() * 1000)}"
+    # グループID生成（ワーカー・ノードをまたいで重複しない採番）
+    group_id = new_group_id()
     
-    # 状態判定
-    has_stop = ShavedIceOrder.objects.filter(is_completed=False, status='stop').exists()
-    status = 'stop' if has_stop else 'ok'
-    auto_stopped = has_stop
-    
-    # 注文をDBに保存
-    for ice in temp_ice_list:
-        flavor = ice.get('flavor')
-        if not flavor:
-            continue
-        ShavedIceOrder.objects.create(
-            flavor=flavor,
+    # 注文をDBに保存（STOP 判定と登録は共通処理で1トランザクションにまとめる）
+    items = [{'flavor': ice['flavor']} for ice in temp_ice_list if ice.get('flavor')]
+    if items:
+        submit_orders(
+            ShavedIceOrder, group_id, items,
+            idempotency_key=request_key(request),
             clip_color=clip_color,
             clip_number=clip_number,
-            group_id=group_id,
-            status=status,
-            is_auto_stopped=auto_stopped,
-            note=note
+            note=note,
         )
     
-    # セッション初期化
-    request.session['temp_ice'] = []
-    request.session.pop('clip_color', None)
-    request.session.pop('clip_number', None)
-    request.session.modified = True
+    # 仮注文を空にする
+    cart.clear()
     return redirect('shavedice_register')
 
 
-def shavedice_kitchen(request):
+@cached_poll('shavedice')
+async def shavedice_kitchen(request):
     """かき氷キッチン画面を表示"""
-    context = _get_order_context()
+    revision = await aget_revision('shavedice')
+
+    context = await _aget_order_context(revision)
     context["debug"] = True 
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': context['refresh_value'],
             'refresh_value': context['refresh_value'],
             'active_order_total': context['active_order_total'],
             'active_count': context['active_count'],
             'timestamp': context['now'].isoformat(),
         })
-    return render(request, "shavedice/shavedice_kitchen.html", context)
+    return await arender(request, "shavedice/shavedice_kitchen.html", context)
+
+
+def shavedice_kitchen_changes(request):
+    """かき氷キッチン画面の差分更新用API（?since= 以降に変わったグループのみ）"""
+    revision = get_revision('shavedice')
+    unchanged = unchanged_response(request, revision)
+    if unchanged:
+        return unchanged
+    return _shavedice_board_changes(request, 'shavedice/_kitchen_group.html', revision)
 
 
 def ice_view(request):
-    """かき氷一覧画面を表示"""
-    now = timezone.localtime()
-    
-    # 全注文を取得
-    all_orders = ShavedIceOrder.objects.order_by('timestamp')
-    
-    # グループ化
-    grouped_orders = {}
-    for order in all_orders:
-        grouped_orders.setdefault(order.group_id, []).append(order)
-    
-    # 未完了・完了注文を分離
-    active_orders = {}
-    completed_orders = {}
-    
-    for group_id, orders in grouped_orders.items():
-        # 経過時間を計算
-        for o in orders:
-            o.elapsed_seconds = int((now - o.timestamp).total_seconds())
-            o.elapsed_minutes = o.elapsed_seconds // 60
-        
-        if all(o.is_completed for o in orders):
-            latest_completion = max(
-                (o.completed_at for o in orders if o.completed_at), 
-                default=None
-            )
-            if latest_completion and now - latest_completion <= timedelta(seconds=30):
-                completed_orders[group_id] = orders
-        else:
-            active_orders[group_id] = orders
-    
-    active_count = len(active_orders)
-    
-    context = {
-        'grouped_orders': active_orders,
-        'completed_orders': completed_orders,
-        'now': now,
-        'active_count': active_count,
-    }
-    
-    context['is_logged_in'] = request.session.get('logged_in', False)
-    return render(request, 'shavedice/ice.html', context)
+    """旧かき氷一覧画面（キッチン画面へ統合済みのためリダイレクト）"""
+    return redirect('shavedice_kitchen')
 
 
 @require_POST
 def complete_order(request, order_id):
     """指定IDの注文を完了"""
     order = get_object_or_404(ShavedIceOrder, id=order_id)
-    order.is_completed = True
-    order.completed_at = timezone.now()
-    order.status = 'hold'
-    order.save()
-    
+    complete_single_order(order, status='hold')
+
     return redirect('shavedice_kitchen')
 
 
 @csrf_exempt
 def complete_group(request, group_id):
-    """指定グループの注文を一括完了"""
+    """
+    指定グループの注文を一括完了
+
+    未完了の注文だけを完了にするため、二重に押しても完了時刻は変わりません。
+    """
     if request.method == 'POST':
-        now = timezone.now()
-        ShavedIceOrder.objects.filter(group_id=group_id).update(is_completed=True, completed_at=now)
+        completed = complete_orders(ShavedIceOrder, group_id)
+        if _wants_json(request):
+            return JsonResponse({'status': 'ok', 'group_id': group_id, 'completed': completed})
     return redirect('shavedice_kitchen')
 
 
@@ -272,57 +242,72 @@ def order_detail(request, order_id):
 
 
 def delete_temp_ice(request, index):
-    """仮注文リストから指定インデックスの注文を削除"""
-    temp_ice = request.session.get('temp_ice', [])
-    if 0 <= index < len(temp_ice):
-        del temp_ice[index]
-        request.session['temp_ice'] = temp_ice
-        request.session.modified = True
-    
-    return redirect('shavedice_register')
+    """仮注文から指定インデックスの注文を削除"""
+    cart = Cart(request, 'shavedice')
+    cart.remove_at(index)
+    return cart_response(request, cart)
 
 
 @csrf_exempt
 def shavedice_update_status(request, group_id, new_status):
     """かき氷デシャップ画面からグループの状態を更新"""
     if request.method == 'POST':
-        ShavedIceOrder.objects.filter(group_id=group_id).update(
-            status=new_status,
-            status_modified_at=timezone.now(),
-        )
+        # 未定義の状態は update_group_status が無視する
+        update_group_status(ShavedIceOrder, group_id, new_status)
     return redirect('shavedice_deshap')
 
 
-def shavedice_deshap_view(request):
+@cached_poll('shavedice')
+async def shavedice_deshap_view(request):
     """かき氷デシャップ担当画面"""
-    context = _get_order_context()
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    revision = await aget_revision('shavedice')
+
+    context = await _aget_order_context(revision)
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': context['refresh_value'],
             'refresh_value': context['refresh_value'],
             'active_order_total': context['active_order_total'],
             'active_count': context['active_count'],
             'timestamp': context['now'].isoformat(),
         })
-    return render(request, "shavedice/deshap.html", context)
+    return await arender(request, "shavedice/deshap.html", context)
 
 
-def wait_time_view(request):
+def shavedice_deshap_changes(request):
+    """かき氷デシャップ画面の差分更新用API（?since= 以降に変わったグループのみ）"""
+    revision = get_revision('shavedice')
+    unchanged = unchanged_response(request, revision)
+    if unchanged:
+        return unchanged
+    return _shavedice_board_changes(request, 'shavedice/_deshap_group.html', revision)
+
+
+@cached_poll('shavedice')
+async def wait_time_view(request):
     """
-    かき氷の未完了注文数から待ち時間（1つ3分）を計算して表示するビュー
+    かき氷の未完了注文と、フレーバーごとに学習した提供時間から待ち時間を見積もって表示するビュー
     """
-    from .models import ShavedIceOrder
-    uncompleted_count = ShavedIceOrder.objects.filter(is_completed=False).count()
-    wait_minutes = uncompleted_count * 3
+    revision = await aget_revision('shavedice')
+
+    active_groups, _ = await alive_board(ShavedIceOrder, revision, timezone.localtime())
+    estimate = await aestimate_wait('shavedice', revision, active_groups)
+    uncompleted_count = estimate['open_items']
+    wait_minutes = estimate['wait_minutes']
     context = {
         'uncompleted_count': uncompleted_count,
         'wait_minutes': wait_minutes,
+        'revision': revision,
     }
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.GET.get('format') == 'json':
+    if _wants_json(request):
         return JsonResponse({
+            'changed': True,
+            'revision': revision,
             'value': wait_minutes,
             'wait_minutes': wait_minutes,
             'uncompleted_count': uncompleted_count,
             'timestamp': timezone.now().isoformat(),
         })
-    return render(request, 'shavedice/wait_time.html', context)
\ No newline at end of file
+    return await arender(request, 'shavedice/wait_time.html', context)
\ No newline at end of file
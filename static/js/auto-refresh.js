@@ -5,7 +5,82 @@
  * 想定ユースケース:
  *   - キッチン/デシャップ画面で未完了件数が増えたら自動的に最新状態へ更新
  *   - 待ち時間表示画面のように、単純に n 秒ごとリロードしたいケース
+ *
+ * ポーリング先が revision を返す場合は、次回以降 ?since=<revision> を付けて問い合わせる。
+ * サーバー側は変更がなければ {changed: false} だけを返すので、集計処理が走らない。
+ *
+ * eventsUrl を指定すると Server-Sent Events で注文イベントを購読し、イベント到着時だけ
+ * 問い合わせる。接続できない・切れた場合は従来のポーリングに自動で戻る。
+ *
+ * changesUrl を指定すると再読み込みはせず、前回のリビジョン以降に変わったグループの
+ * カード（data-group-id 付きの HTML 断片）だけを受け取り、sections で指定した
+ * コンテナ内のカードを差し替え・削除・並べ替える。form.async-action の送信も
+ * fetch で行い、送信後は差分だけを取得する。
+ */
+
+/**
+ * 注文イベント（Server-Sent Events）の購読ヘルパー。
+ * 接続エラーが続いた場合は購読を止め、retryMs 後に再接続を試みる（その間はポーリングに任せる）。
  */
+class OrderEventStream {
+  constructor(url, options = {}) {
+    this.url = url;
+    this.onEvent = options.onEvent || (() => {});
+    this.onRevision = options.onRevision || (() => {});
+    this.maxErrors = options.maxErrors || 3;
+    this.retryMs = options.retryMs || 60000;
+    this.errorCount = 0;
+    this.connected = false;
+    this.source = null;
+    this.connect();
+  }
+
+  static isSupported() {
+    return typeof window.EventSource === 'function';
+  }
+
+  connect() {
+    if (!OrderEventStream.isSupported()) {
+      return;
+    }
+    const source = new EventSource(this.url);
+    this.source = source;
+
+    source.addEventListener('open', () => {
+      this.connected = true;
+      this.errorCount = 0;
+    });
+    source.addEventListener('revision', (event) => {
+      this.onRevision(JSON.parse(event.data));
+    });
+    OrderEventStream.EVENT_TYPES.forEach((type) => {
+      source.addEventListener(type, (event) => {
+        this.onEvent(type, JSON.parse(event.data));
+      });
+    });
+    source.addEventListener('error', () => {
+      this.connected = false;
+      this.errorCount += 1;
+      if (this.errorCount >= this.maxErrors) {
+        this.close();
+        setTimeout(() => {
+          this.errorCount = 0;
+          this.connect();
+        }, this.retryMs);
+      }
+    });
+  }
+
+  close() {
+    if (this.source) {
+      this.source.close();
+      this.source = null;
+    }
+    this.connected = false;
+  }
+}
+
+OrderEventStream.EVENT_TYPES = ['created', 'completed', 'status_changed', 'deleted', 'changed'];
 
 class AutoRefresh {
   constructor(options = {}) {
@@ -13,6 +88,13 @@ class AutoRefresh {
     this.valueSelector = options.valueSelector || '[data-auto-refresh-value]';
     this.scrollStorageKey = options.scrollStorageKey || 'auto_refresh_scroll_pos';
     this.pollUrl = options.pollUrl || null;
+    this.eventsUrl = options.eventsUrl || null;
+    this.changesUrl = options.changesUrl || null;
+    this.sections = options.sections || { active: '#active-groups', completed: '#completed-groups' };
+    this.renderSummary = typeof options.renderSummary === 'function' ? options.renderSummary : null;
+    this.updatedSelector = options.updatedSelector || null;
+    this.onPatch = typeof options.onPatch === 'function' ? options.onPatch : () => {};
+    this.streamSafetyMs = options.streamSafetyMs || 60000; // SSE 接続中でも念のため問い合わせる間隔
     this.forceReload = Boolean(options.forceReload);
     this.fallbackReloadMs = options.fallbackReloadMs || null; // hard reload even if value unchanged
     this.maxFailuresBeforeReload = options.maxFailuresBeforeReload || 3;
@@ -22,7 +104,11 @@ class AutoRefresh {
         ? options.parseValue
         : this.defaultParseValue;
     this.isPolling = false;
+    this.pendingCheck = false;
+    this.lastPollAt = 0;
     this.lastValue = null;
+    this.lastRevision = null;
+    this.eventStream = null;
     this.fallbackTimerId = null;
 
     this.init();
@@ -31,6 +117,7 @@ class AutoRefresh {
   init() {
     const setup = () => {
       this.lastValue = this.parseValue(this.getCurrentValue());
+      this.lastRevision = this.getCurrentRevision();
       this.start();
     };
 
@@ -56,6 +143,21 @@ class AutoRefresh {
     return el ? el.dataset.autoRefreshValue : null;
   }
 
+  getCurrentRevision() {
+    const el = document.querySelector(this.valueSelector);
+    const raw = el ? el.dataset.autoRefreshRevision : null;
+    return raw === undefined || raw === null || raw === '' ? null : String(raw);
+  }
+
+  buildPollUrl() {
+    if (this.lastRevision === null) {
+      return this.pollUrl;
+    }
+    const url = new URL(this.pollUrl, window.location.href);
+    url.searchParams.set('since', this.lastRevision);
+    return url.toString();
+  }
+
   start() {
     if (this.forceReload) {
       this.timerId = setInterval(() => this.reloadPage(), this.interval);
@@ -63,18 +165,54 @@ class AutoRefresh {
       return;
     }
 
+    if (this.changesUrl) {
+      this.bindAsyncForms();
+      this.elapsedTimerId = setInterval(() => this.updateElapsed(), 30000);
+    }
+
+    if (this.eventsUrl && (this.pollUrl || this.changesUrl)) {
+      this.eventStream = new OrderEventStream(this.eventsUrl, {
+        onEvent: () => void this.checkForUpdate(),
+        onRevision: (data) => {
+          if (this.lastRevision === null || String(data.revision) !== this.lastRevision) {
+            void this.checkForUpdate();
+          }
+        },
+      });
+    }
+
     this.timerId = setInterval(() => {
+      if (this.isStreaming()) {
+        // イベント購読中はポーリングを間引き、強制リロードの保険も延長する
+        this.resetFallbackTimer();
+        if (Date.now() - this.lastPollAt < this.streamSafetyMs) {
+          return;
+        }
+      }
       void this.checkForUpdate();
     }, this.interval);
     this.resetFallbackTimer();
   }
 
+  isStreaming() {
+    return Boolean(this.eventStream && this.eventStream.connected);
+  }
+
   async checkForUpdate() {
     if (this.isPolling) {
+      // 問い合わせ中に届いたイベントは、完了後にもう一度確認する
+      this.pendingCheck = true;
       return;
     }
     this.isPolling = true;
+    this.lastPollAt = Date.now();
     try {
+      if (this.changesUrl) {
+        await this.applyChanges();
+        this.failureCount = 0;
+        this.resetFallbackTimer();
+        return;
+      }
       const latestValue = await this.fetchLatestValue();
       if (latestValue === null) {
         return;
@@ -96,6 +234,10 @@ class AutoRefresh {
       }
     } finally {
       this.isPolling = false;
+      if (this.pendingCheck) {
+        this.pendingCheck = false;
+        void this.checkForUpdate();
+      }
     }
   }
 
@@ -104,8 +246,8 @@ class AutoRefresh {
       return this.parseValue(this.getCurrentValue());
     }
 
-    const response = await fetch(this.pollUrl, {
-      cache: 'no-store',
+    const response = await fetch(this.buildPollUrl(), {
+      cache: 'no-cache',
       headers: {
         Accept: 'application/json',
         'X-Requested-With': 'XMLHttpRequest',
@@ -117,6 +259,13 @@ class AutoRefresh {
     }
 
     const payload = await response.json();
+    if (payload.revision !== undefined && payload.revision !== null) {
+      this.lastRevision = String(payload.revision);
+    }
+    if (payload.changed === false) {
+      // 前回から変更なし（サーバー側で集計も省略済み）
+      return this.lastValue;
+    }
     const raw =
       payload.value ??
       payload.refresh_value ??
@@ -127,6 +276,155 @@ class AutoRefresh {
     return this.parseValue(raw);
   }
 
+  async applyChanges() {
+    const url = new URL(this.changesUrl, window.location.href);
+    if (this.lastRevision !== null) {
+      url.searchParams.set('since', this.lastRevision);
+    }
+    const response = await fetch(url.toString(), {
+      cache: 'no-cache',
+      headers: {
+        Accept: 'application/json',
+        'X-Requested-With': 'XMLHttpRequest',
+      },
+    });
+    if (!response.ok) {
+      throw new Error(`Changes request responded with ${response.status}`);
+    }
+
+    const payload = await response.json();
+    if (payload.changed !== false) {
+      this.patchGroups(payload);
+      this.updateSummary(payload);
+      this.onPatch(payload);
+    }
+    if (payload.revision !== undefined && payload.revision !== null) {
+      this.lastRevision = String(payload.revision);
+    }
+  }
+
+  findGroupCards(groupId) {
+    return Array.from(document.querySelectorAll('[data-group-id]')).filter(
+      (card) => card.dataset.groupId === groupId,
+    );
+  }
+
+  patchGroups(payload) {
+    const containers = {};
+    Object.entries(this.sections).forEach(([name, selector]) => {
+      containers[name] = document.querySelector(selector);
+    });
+
+    if (payload.full) {
+      Object.values(containers).forEach((container) => {
+        if (container) {
+          container.querySelectorAll(':scope > [data-group-id]').forEach((card) => card.remove());
+        }
+      });
+    }
+
+    (payload.groups || []).forEach((group) => {
+      this.findGroupCards(group.group_id).forEach((card) => card.remove());
+      const container = containers[group.section];
+      if (container && group.html) {
+        const template = document.createElement('template');
+        template.innerHTML = group.html.trim();
+        container.appendChild(template.content);
+      }
+    });
+
+    // サーバーの表示順に合わせ、表示期間を過ぎたカードを取り除く
+    Object.entries(payload.order || {}).forEach(([name, ids]) => {
+      const container = containers[name];
+      if (!container) {
+        return;
+      }
+      const cards = new Map();
+      container.querySelectorAll(':scope > [data-group-id]').forEach((card) => {
+        cards.set(card.dataset.groupId, card);
+      });
+      const wanted = new Set(ids);
+      cards.forEach((card, id) => {
+        if (!wanted.has(id)) {
+          card.remove();
+          cards.delete(id);
+        }
+      });
+      const currentOrder = Array.from(cards.keys());
+      const desiredOrder = ids.filter((id) => cards.has(id));
+      if (currentOrder.join('\n') !== desiredOrder.join('\n')) {
+        desiredOrder.forEach((id) => container.appendChild(cards.get(id)));
+      }
+    });
+    this.updateElapsed();
+  }
+
+  updateSummary(payload) {
+    const el = document.querySelector(this.valueSelector);
+    if (el) {
+      el.dataset.autoRefreshValue = payload.refresh_value ?? payload.value ?? '';
+      el.dataset.autoRefreshRevision = payload.revision ?? '';
+      if (payload.active_order_total !== undefined) {
+        el.dataset.activeItems = payload.active_order_total;
+      }
+      if (this.renderSummary) {
+        el.textContent = this.renderSummary(payload);
+      }
+    }
+    const updatedEl = this.updatedSelector ? document.querySelector(this.updatedSelector) : null;
+    if (updatedEl && payload.timestamp) {
+      const time = new Date(payload.timestamp).toLocaleTimeString('ja-JP', { hour12: false });
+      updatedEl.textContent = `最終更新: ${time}`;
+    }
+    this.lastValue = this.parseValue(payload.refresh_value ?? payload.value ?? null);
+  }
+
+  updateElapsed() {
+    const now = Date.now();
+    document.querySelectorAll('[data-elapsed-since]').forEach((el) => {
+      const since = new Date(el.dataset.elapsedSince).getTime();
+      if (!Number.isNaN(since)) {
+        el.textContent = Math.max(0, Math.floor((now - since) / 60000));
+      }
+    });
+  }
+
+  bindAsyncForms() {
+    document.addEventListener('submit', (event) => {
+      const form = event.target.closest('form.async-action');
+      if (!form || event.defaultPrevented) {
+        return;
+      }
+      event.preventDefault();
+      void this.submitAction(form);
+    });
+  }
+
+  async submitAction(form) {
+    const submitter = form.querySelector('button[type="submit"]');
+    if (submitter) {
+      submitter.disabled = true;
+    }
+    try {
+      const response = await fetch(form.action, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: { 'X-Requested-With': 'XMLHttpRequest' },
+      });
+      if (!response.ok) {
+        throw new Error(`Action responded with ${response.status}`);
+      }
+      await this.checkForUpdate();
+    } catch (error) {
+      console.warn('AutoRefresh action failed:', error);
+      HTMLFormElement.prototype.submit.call(form);
+    } finally {
+      if (submitter) {
+        submitter.disabled = false;
+      }
+    }
+  }
+
   reloadPage() {
     sessionStorage.setItem(this.scrollStorageKey, window.scrollY.toString());
     this.clearFallbackTimer();
@@ -165,3 +463,4 @@ class AutoRefresh {
 }
 
 window.AutoRefresh = AutoRefresh;
+window.OrderEventStream = OrderEventStream;
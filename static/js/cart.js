@@ -0,0 +1,61 @@
+/**
+ * cafeMuji - レジ画面の仮オーダー操作
+ *
+ * 仮オーダーの追加・削除を fetch で送信し、サーバーが返す HTML 断片で
+ * #cart-items を差し替えます（画面の再読み込みなし）。
+ *
+ * - data-cart-post="<URL>" を持つ要素のクリックで、その URL に POST する
+ * - data-cart-when="filled" / "empty" を持つ要素は、件数に応じて表示を切り替える
+ */
+(function () {
+  function csrfToken() {
+    const input = document.querySelector('input[name="csrfmiddlewaretoken"]');
+    if (input) {
+      return input.value;
+    }
+    const match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+    return match ? decodeURIComponent(match[1]) : '';
+  }
+
+  function apply(payload) {
+    const container = document.getElementById('cart-items');
+    if (container && typeof payload.html === 'string') {
+      container.innerHTML = payload.html;
+    }
+    const filled = payload.count > 0;
+    document.querySelectorAll('[data-cart-when]').forEach((element) => {
+      element.hidden = (element.dataset.cartWhen === 'filled') !== filled;
+    });
+  }
+
+  async function post(url, data) {
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        Accept: 'application/json',
+        'X-Requested-With': 'XMLHttpRequest',
+        'X-CSRFToken': csrfToken(),
+      },
+      body: data ? new URLSearchParams(data) : undefined,
+    });
+    const payload = await response.json().catch(() => ({}));
+    if (!response.ok || payload.status !== 'ok') {
+      throw new Error(payload.message || response.status);
+    }
+    apply(payload);
+    return payload;
+  }
+
+  document.addEventListener('click', (event) => {
+    const target = event.target.closest('[data-cart-post]');
+    if (!target) {
+      return;
+    }
+    event.preventDefault();
+    post(target.dataset.cartPost).catch((error) => {
+      alert('仮オーダーの更新に失敗しました: ' + error.message);
+    });
+  });
+
+  window.CartClient = { post, apply };
+})();